@@ -0,0 +1,169 @@
+"""
+Бенчмарк коллекторов PM2.5 на локальном replay-сервере
+Измерения без живых API: воспроизводимо (фиксированный seed искажений) и без расхода квот
+
+Прогоняет PM25DataCollector.collect_all и find_sensors_openaq_v3 заданное число раундов
+(параллельно в несколько потоков) и выводит:
+    - пропускную способность (раундов/с, запросов/с)
+    - p50/p99 латентности по источникам
+    - поведение повторов: попыток на сервере на один логический вызов, ответы 429/500,
+      доля вызовов, завершившихся без данных
+"""
+
+import os
+import io
+import sys
+import time
+import argparse
+import tempfile
+import contextlib
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+
+from replay_server import ReplayServer
+from fetch_pm25_data import PM25DataCollector
+from rate_limiter import QuotaRateLimiter
+from http_cache import ResponseCache
+from timeseries_store import TimeSeriesStore
+from find_sensors import find_sensors_openaq_v3
+
+
+def make_collector_factory(base_url, work_dir, max_retries):
+    """
+    Фабрика коллекторов против replay-сервера: без квот, без кэша, всё во временной директории
+
+    Коллекторы разделяют сессию (пул соединений), лимитер, кэш и хранилище рядов;
+    отдельный экземпляр на раунд нужен только из-за last_latencies
+    """
+    sources = ("openaq", "iqair", "openweathermap")
+    unlimited = {"quota": 10 ** 9, "window": "hour", "burst": 10 ** 9}
+    shared = {
+        "rate_limiter": QuotaRateLimiter(state_file=None, quotas={source: unlimited for source in sources}),
+        "response_cache": ResponseCache(os.path.join(work_dir, "cache"), ttls={source: 0 for source in sources}),
+        "timeseries_store": TimeSeriesStore(os.path.join(work_dir, "timeseries")),
+    }
+    session = PM25DataCollector(
+        output_dir=os.path.join(work_dir, "pm25"), max_retries=max_retries, **shared
+    ).session
+
+    def make_collector():
+        collector = PM25DataCollector(
+            output_dir=os.path.join(work_dir, "pm25"),
+            base_urls={source: base_url for source in sources},
+            **shared
+        )
+        collector.session = session
+        return collector
+
+    return make_collector, session
+
+
+def percentile_ms(values, q):
+    return float(np.percentile(values, q) * 1000) if values else float('nan')
+
+
+def run_benchmark(server, rounds, concurrency, max_retries):
+    """
+    Returns:
+        dict: elapsed, latencies {источник: [сек]}, failures {источник: n}, calls {источник: n}
+    """
+    work_dir = tempfile.mkdtemp(prefix="bench_collectors_")
+    make_collector, session = make_collector_factory(server.url, work_dir, max_retries)
+
+    latencies = {"openaq": [], "iqair": [], "openweathermap": [], "sensors_v3": []}
+    failures = dict.fromkeys(latencies, 0)
+
+    def one_round(_):
+        round_collector = make_collector()
+        data = round_collector.collect_all(iqair_key="bench", openweather_key="bench", save=False)
+
+        start = time.perf_counter()
+        sensors = find_sensors_openaq_v3(base_url=server.url, session=session)
+        sensors_latency = time.perf_counter() - start
+
+        sources = {record["source"].lower() for record in data}
+        return round_collector.last_latencies, sources, sensors_latency, bool(sensors)
+
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            results = list(executor.map(one_round, range(rounds)))
+    elapsed = time.perf_counter() - start
+
+    for round_latencies, sources, sensors_latency, sensors_ok in results:
+        for source, latency in round_latencies.items():
+            latencies[source].append(latency)
+            if source not in sources:
+                failures[source] += 1
+        latencies["sensors_v3"].append(sensors_latency)
+        if not sensors_ok:
+            failures["sensors_v3"] += 1
+
+    return {"elapsed": elapsed, "latencies": latencies, "failures": failures}
+
+
+def print_report(result, server, rounds, concurrency, max_retries):
+    # Логических вызовов HTTP на раунд: OpenAQ 1, IQAir 1, OWM 2, find_sensors 1
+    logical_calls = rounds * 5
+    attempts = server.total_requests()
+
+    status_totals = {}
+    for by_status in server.stats.values():
+        for status, count in by_status.items():
+            status_totals[status] = status_totals.get(status, 0) + count
+
+    print("=" * 80)
+    print("⏱️  БЕНЧМАРК КОЛЛЕКТОРОВ (replay-сервер)")
+    print("=" * 80)
+    print(f"  Раундов: {rounds}, потоков: {concurrency}, повторов: {max_retries}")
+    print(f"  Искажения: задержка {server.latency_ms}±{server.jitter_ms} мс, "
+          f"500: {server.error_rate:.0%}, 429: {server.rate_limit_rate:.0%}")
+    print()
+    print(f"  Время: {result['elapsed']:.2f} с")
+    print(f"  Пропускная способность: {rounds / result['elapsed']:.1f} раундов/с, "
+          f"{attempts / result['elapsed']:.1f} запросов/с")
+    print()
+    print(f"  {'источник':<16} {'p50, мс':>9} {'p99, мс':>9} {'без данных':>11}")
+    for source, values in result["latencies"].items():
+        print(f"  {source:<16} {percentile_ms(values, 50):>9.1f} {percentile_ms(values, 99):>9.1f} "
+              f"{result['failures'][source]:>6}/{len(values)}")
+    print()
+    print(f"  Повторы: {attempts} попыток на {logical_calls} вызовов "
+          f"({attempts / logical_calls:.2f} попытки/вызов)")
+    print(f"  Ответы сервера: " + ", ".join(f"{status}: {count}" for status, count in sorted(status_totals.items())))
+    print("=" * 80)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Бенчмарк коллекторов PM2.5 на replay-сервере')
+    parser.add_argument('--rounds', type=int, default=50, help='Раундов collect_all + find_sensors')
+    parser.add_argument('--concurrency', type=int, default=4, help='Параллельных раундов')
+    parser.add_argument('--retries', type=int, default=0, help='max_retries коллектора')
+    parser.add_argument('--latency-ms', type=float, default=50.0)
+    parser.add_argument('--jitter-ms', type=float, default=20.0)
+    parser.add_argument('--error-rate', type=float, default=0.0)
+    parser.add_argument('--rate-limit-rate', type=float, default=0.0)
+    parser.add_argument('--cache-dir', type=str, default=None,
+                        help='Записанные ответы (кэш HTTP-ответов); по умолчанию синтетические')
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args()
+
+    server = ReplayServer(
+        cache_dir=args.cache_dir,
+        latency_ms=args.latency_ms,
+        jitter_ms=args.jitter_ms,
+        error_rate=args.error_rate,
+        rate_limit_rate=args.rate_limit_rate,
+        retry_after=0,
+        seed=args.seed
+    )
+    with server:
+        result = run_benchmark(server, args.rounds, args.concurrency, args.retries)
+    print_report(result, server, args.rounds, args.concurrency, args.retries)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,132 @@
+"""
+Векторная конвертация US AQI ↔ µg/m³ для PM2.5
+PM25DataCollector.aqi_to_ugm3 - скалярная цепочка if/elif в одну сторону;
+исторические ряды, где есть только AQI (например фид посольства США), - миллионы строк
+
+Таблица breakpoints EPA задаёт узлы кусочно-линейной функции:
+    AQI  0-50   ↔ 0.0-12.0 µg/m³
+    AQI  51-100 ↔ 12.1-35.4
+    ...
+Промежутки между соседними диапазонами (AQI 50..51, 12.0..12.1 µg/m³) соединяются
+линейно - функция непрерывна и монотонна, обе стороны обратны друг другу.
+Выше последнего узла (AQI 500) - продолжение последнего отрезка.
+Пропуски (None, NaN) и отрицательные значения → NaN
+"""
+
+import argparse
+
+import numpy as np
+
+
+# (AQI low, AQI high, µg/m³ low, µg/m³ high) - EPA, PM2.5 24-hour
+PM25_BREAKPOINTS = (
+    (0, 50, 0.0, 12.0),
+    (51, 100, 12.1, 35.4),
+    (101, 150, 35.5, 55.4),
+    (151, 200, 55.5, 150.4),
+    (201, 300, 150.5, 250.4),
+    (301, 400, 250.5, 350.4),
+    (401, 500, 350.5, 500.4),
+)
+
+
+def _knots(breakpoints=PM25_BREAKPOINTS):
+    aqi = np.array([v for bp in breakpoints for v in bp[:2]], dtype=np.float64)
+    conc = np.array([v for bp in breakpoints for v in bp[2:]], dtype=np.float64)
+    return aqi, conc
+
+
+AQI_KNOTS, UGM3_KNOTS = _knots()
+
+
+def _as_float_array(values):
+    """Массив float64; None и нечисловые значения → NaN"""
+    if hasattr(values, "to_numpy"):
+        import pandas as pd
+        return pd.to_numeric(values, errors="coerce").to_numpy(dtype=np.float64, na_value=np.nan)
+    return np.asarray(values, dtype=np.float64)
+
+
+def _wrap_like(values, result):
+    """Возвращает результат в типе входа: pandas.Series (с индексом), ndarray или float"""
+    if hasattr(values, "to_numpy") and hasattr(values, "index"):
+        import pandas as pd
+        return pd.Series(result, index=values.index, name=getattr(values, "name", None))
+    if np.ndim(values) == 0:
+        return float(result[0])
+    return result
+
+
+def _piecewise(x, xp, fp):
+    """np.interp с линейной экстраполяцией за последним узлом; x < 0 и NaN → NaN"""
+    with np.errstate(invalid="ignore"):
+        result = np.interp(x, xp, fp)
+
+        above = x > xp[-1]
+        if above.any():
+            slope = (fp[-1] - fp[-2]) / (xp[-1] - xp[-2])
+            result[above] = fp[-1] + (x[above] - xp[-1]) * slope
+
+        result[~(x >= 0)] = np.nan
+    return result
+
+
+def aqi_to_ugm3(aqi):
+    """
+    US AQI → концентрация PM2.5 (µg/m³)
+
+    Args:
+        aqi: число, список, np.ndarray или pandas.Series
+
+    Returns:
+        тот же тип (Series сохраняет индекс), NaN для пропусков и отрицательных значений
+    """
+    x = np.atleast_1d(_as_float_array(aqi))
+    return _wrap_like(aqi, _piecewise(x, AQI_KNOTS, UGM3_KNOTS))
+
+
+def ugm3_to_aqi(concentration, rounded=False):
+    """
+    Концентрация PM2.5 (µg/m³) → US AQI
+
+    Args:
+        concentration: число, список, np.ndarray или pandas.Series
+        rounded: Округлить до целого AQI (как в публикуемых индексах)
+
+    Returns:
+        тот же тип (Series сохраняет индекс), NaN для пропусков и отрицательных значений
+    """
+    x = np.atleast_1d(_as_float_array(concentration))
+    result = _piecewise(x, UGM3_KNOTS, AQI_KNOTS)
+    if rounded:
+        # Округление половин вверх (np.round округляет к чётному)
+        result = np.floor(result + 0.5)
+    return _wrap_like(concentration, result)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Конвертация столбца CSV: US AQI ↔ µg/m³ (PM2.5)')
+    parser.add_argument('input', help='CSV файл')
+    parser.add_argument('output', help='Куда записать CSV с новым столбцом')
+    parser.add_argument('--column', type=str, default='aqi', help='Исходный столбец (default: aqi)')
+    parser.add_argument('--to', choices=['ugm3', 'aqi'], default='ugm3',
+                        help='Направление: ugm3 (AQI → µg/m³) или aqi (µg/m³ → AQI)')
+    parser.add_argument('--chunksize', type=int, default=1_000_000, help='Строк в блоке чтения')
+    args = parser.parse_args()
+
+    import pandas as pd
+
+    convert = aqi_to_ugm3 if args.to == 'ugm3' else ugm3_to_aqi
+    target = 'pm25' if args.to == 'ugm3' else 'pm25_aqi'
+
+    total = 0
+    for i, chunk in enumerate(pd.read_csv(args.input, chunksize=args.chunksize)):
+        chunk[target] = convert(chunk[args.column])
+        chunk.to_csv(args.output, mode='w' if i == 0 else 'a', header=(i == 0), index=False)
+        total += len(chunk)
+
+    print(f"✅ Сконвертировано строк: {total} → {args.output} (столбец {target})")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,371 @@
+"""
+Массовая загрузка исторических данных PM2.5 и метеоданных (backfill)
+PM25DataCollector получает только текущие значения; для обучения
+BaselineWeatherModel на прошлых зимах нужна история
+
+Источники:
+    - OpenWeatherMap air_pollution/history (PM2.5, PM10 по координатам)
+    - OpenAQ v3 /sensors/{id}/measurements (PM2.5, температура, влажность датчиков)
+
+Диапазон дат режется на чанки, чанки качаются параллельно в пределах квоты
+(приоритет backfill, см. rate_limiter.py), прогресс пишется в checkpoint,
+поэтому перезапуск продолжает с места остановки.
+Базовые URL настраиваются - можно гонять против локального mock-сервера
+"""
+
+import os
+import json
+import math
+import hashlib
+import argparse
+import threading
+from datetime import datetime, timedelta, timezone
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import requests
+from requests.adapters import HTTPAdapter
+from dotenv import load_dotenv
+
+from rate_limiter import QuotaRateLimiter, PRIORITY_BACKFILL
+from timeseries_store import TimeSeriesStore, STORE_DIR
+from fetch_pm25_data import OWM_LOCATION
+
+
+load_dotenv()
+
+OWM_BASE_URL = "http://api.openweathermap.org"
+OPENAQ_BASE_URL = "https://api.openaq.org"
+
+# Параметры OpenAQ → поля записи
+OPENAQ_PARAMETERS = {
+    "pm25": "pm25",
+    "pm10": "pm10",
+    "temperature": "temperature",
+    "relativehumidity": "humidity",
+    "pressure": "pressure",
+    "wind_speed": "wind_speed",
+}
+
+OPENAQ_PAGE_LIMIT = 1000
+
+
+def _parse_date(value):
+    dt = datetime.fromisoformat(value)
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=timezone.utc)
+    return dt
+
+
+def split_range(start, end, chunk_days):
+    """
+    Делит [start, end) на чанки по chunk_days дней
+
+    Returns:
+        list: [(chunk_start, chunk_end)] datetime
+    """
+    chunks = []
+    current = start
+    while current < end:
+        chunk_end = min(current + timedelta(days=chunk_days), end)
+        chunks.append((current, chunk_end))
+        current = chunk_end
+    return chunks
+
+
+class JsonlSink:
+    """Запись результатов чанка одним файлом JSONL (data/pm25/backfill/)"""
+
+    def __init__(self, output_dir="data/pm25/backfill"):
+        self.output_dir = output_dir
+        os.makedirs(output_dir, exist_ok=True)
+
+    def write(self, job_key, records):
+        path = os.path.join(self.output_dir, f"{job_key}.jsonl")
+        with open(path + ".tmp", 'w', encoding='utf-8') as f:
+            for record in records:
+                f.write(json.dumps(record, ensure_ascii=False) + "\n")
+        os.replace(path + ".tmp", path)
+
+
+class Checkpoint:
+    """Множество завершённых чанков, сохраняется после каждого чанка"""
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self.done = set()
+        if os.path.exists(path):
+            with open(path, 'r', encoding='utf-8') as f:
+                self.done = set(json.load(f)["done"])
+
+    def mark_done(self, job_key):
+        with self._lock:
+            self.done.add(job_key)
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            with open(self.path + ".tmp", 'w', encoding='utf-8') as f:
+                json.dump({"done": sorted(self.done)}, f, indent=2)
+            os.replace(self.path + ".tmp", self.path)
+
+
+class HistoricalBackfill:
+    """Параллельная загрузка истории по чанкам с checkpoint"""
+
+    def __init__(
+        self,
+        owm_key=None,
+        openaq_key=None,
+        lat=42.8746,
+        lon=74.5698,
+        owm_base_url=OWM_BASE_URL,
+        openaq_base_url=OPENAQ_BASE_URL,
+        rate_limiter=None,
+        sink=None,
+        checkpoint_dir="data/pm25/backfill",
+        max_workers=4
+    ):
+        """
+        Args:
+            owm_key: API ключ OpenWeatherMap
+            openaq_key: API ключ OpenAQ v3 (заголовок X-API-Key)
+            lat, lon: Координаты для OpenWeatherMap (центр Бишкека)
+            owm_base_url, openaq_base_url: Базовые URL API (mock-сервер в тестах)
+            rate_limiter: QuotaRateLimiter (None = общий data/api_usage.json)
+            sink: Куда писать записи чанка (объект с методом write(job_key, records))
+            checkpoint_dir: Директория checkpoint-файлов
+            max_workers: Параллельных чанков
+        """
+        self.owm_key = owm_key
+        self.openaq_key = openaq_key
+        self.lat = lat
+        self.lon = lon
+        self.owm_base_url = owm_base_url.rstrip('/')
+        self.openaq_base_url = openaq_base_url.rstrip('/')
+        self.rate_limiter = rate_limiter if rate_limiter is not None else QuotaRateLimiter()
+        self.sink = sink if sink is not None else JsonlSink()
+        self.checkpoint_dir = checkpoint_dir
+        self.max_workers = max_workers
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=max_workers, pool_block=True)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+    def _acquire(self, source, api_key):
+        # Backfill ждёт токены, но не трогает резерв real-time опросов
+        if not self.rate_limiter.acquire(source, api_key, priority=PRIORITY_BACKFILL, timeout=3600):
+            raise RuntimeError(f"{source}: квота API исчерпана")
+
+    # ------------------------------------------------------------------
+    # OpenWeatherMap
+    # ------------------------------------------------------------------
+
+    def fetch_owm_chunk(self, start, end):
+        """PM2.5/PM10 за период из OpenWeatherMap air_pollution/history"""
+        self._acquire("openweathermap", self.owm_key)
+
+        response = self.session.get(
+            f"{self.owm_base_url}/data/2.5/air_pollution/history",
+            params={
+                "lat": self.lat,
+                "lon": self.lon,
+                "start": int(start.timestamp()),
+                "end": int(end.timestamp()),
+                "appid": self.owm_key
+            },
+            timeout=30
+        )
+        response.raise_for_status()
+
+        records = []
+        for item in response.json().get("list", []):
+            components = item.get("components", {})
+            records.append({
+                "source": "OpenWeatherMap",
+                "location": OWM_LOCATION,
+                "latitude": self.lat,
+                "longitude": self.lon,
+                "timestamp": datetime.fromtimestamp(item["dt"], tz=timezone.utc).isoformat(),
+                "pm25": components.get("pm2_5"),
+                "pm10": components.get("pm10")
+            })
+        return records
+
+    # ------------------------------------------------------------------
+    # OpenAQ v3
+    # ------------------------------------------------------------------
+
+    def _openaq_page(self, sensor_id, start, end, page):
+        self._acquire("openaq", None)
+
+        headers = {"X-API-Key": self.openaq_key} if self.openaq_key else {}
+        response = self.session.get(
+            f"{self.openaq_base_url}/v3/sensors/{sensor_id}/measurements",
+            params={
+                "datetime_from": start.isoformat(),
+                "datetime_to": end.isoformat(),
+                "limit": OPENAQ_PAGE_LIMIT,
+                "page": page
+            },
+            headers=headers,
+            timeout=30
+        )
+        response.raise_for_status()
+        return response.json()
+
+    def fetch_openaq_chunk(self, sensor_id, start, end):
+        """
+        Измерения датчика OpenAQ за период
+
+        Первая страница сообщает meta.found - остальные страницы качаются параллельно
+        """
+        first = self._openaq_page(sensor_id, start, end, 1)
+        pages = [first]
+
+        found = first.get("meta", {}).get("found")
+        if isinstance(found, int):
+            n_pages = math.ceil(found / OPENAQ_PAGE_LIMIT)
+            if n_pages > 1:
+                with ThreadPoolExecutor(max_workers=min(self.max_workers, n_pages - 1)) as executor:
+                    pages.extend(executor.map(
+                        lambda page: self._openaq_page(sensor_id, start, end, page),
+                        range(2, n_pages + 1)
+                    ))
+        else:
+            # found неизвестен ("> 1000") - идём по страницам последовательно
+            page = 1
+            while len(pages[-1].get("results", [])) == OPENAQ_PAGE_LIMIT:
+                page += 1
+                pages.append(self._openaq_page(sensor_id, start, end, page))
+
+        records = []
+        for data in pages:
+            for item in data.get("results", []):
+                parameter = item.get("parameter", {}).get("name")
+                field = OPENAQ_PARAMETERS.get(parameter)
+                if field is None:
+                    continue
+                period = item.get("period", {})
+                records.append({
+                    "source": "OpenAQ",
+                    "location": f"sensor_{sensor_id}",
+                    "timestamp": period.get("datetimeFrom", {}).get("utc"),
+                    field: item.get("value")
+                })
+        return records
+
+    # ------------------------------------------------------------------
+
+    def _jobs(self, start, end, chunk_days, sources, openaq_sensors):
+        jobs = []
+        for chunk_start, chunk_end in split_range(start, end, chunk_days):
+            span = f"{chunk_start:%Y%m%d%H}_{chunk_end:%Y%m%d%H}"
+            if "openweathermap" in sources:
+                jobs.append((f"openweathermap_{OWM_LOCATION}_{span}", self.fetch_owm_chunk, (chunk_start, chunk_end)))
+            if "openaq" in sources:
+                for sensor_id in openaq_sensors:
+                    jobs.append((f"openaq_sensor_{sensor_id}_{span}", self.fetch_openaq_chunk,
+                                 (sensor_id, chunk_start, chunk_end)))
+        return jobs
+
+    def run(self, start, end, chunk_days=7, sources=("openweathermap",), openaq_sensors=()):
+        """
+        Загрузка истории за [start, end)
+
+        Returns:
+            dict: done / skipped / failed чанков, records записей
+        """
+        run_id = hashlib.sha1(
+            f"{start.isoformat()}|{end.isoformat()}|{chunk_days}|{sorted(sources)}|{sorted(map(str, openaq_sensors))}"
+            .encode('utf-8')
+        ).hexdigest()[:12]
+        checkpoint = Checkpoint(os.path.join(self.checkpoint_dir, f"checkpoint_{run_id}.json"))
+
+        jobs = self._jobs(start, end, chunk_days, sources, openaq_sensors)
+        pending = [job for job in jobs if job[0] not in checkpoint.done]
+
+        print(f"📦 Чанков: {len(jobs)} (уже загружено: {len(jobs) - len(pending)})")
+
+        summary = {"done": 0, "skipped": len(jobs) - len(pending), "failed": 0, "records": 0}
+
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            futures = {executor.submit(fetch, *args): job_key for job_key, fetch, args in pending}
+            for future in as_completed(futures):
+                job_key = futures[future]
+                try:
+                    records = future.result()
+                except Exception as e:
+                    summary["failed"] += 1
+                    print(f"❌ {job_key}: {e}")
+                    continue
+
+                # Запись пачкой, затем отметка в checkpoint
+                self.sink.write(job_key, records)
+                checkpoint.mark_done(job_key)
+                summary["done"] += 1
+                summary["records"] += len(records)
+                print(f"✅ {job_key}: {len(records)} записей")
+
+        return summary
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Загрузка исторических данных PM2.5 / метео')
+    parser.add_argument('--start', type=str, required=True, help='Начало периода (ISO, например 2024-12-01)')
+    parser.add_argument('--end', type=str, required=True, help='Конец периода (ISO, не включительно)')
+    parser.add_argument('--sources', nargs='+', choices=['openweathermap', 'openaq'],
+                        default=['openweathermap'], help='Источники (default: openweathermap)')
+    parser.add_argument('--openaq-sensors', nargs='+', default=[],
+                        help='ID датчиков OpenAQ v3 (PM2.5, температура, влажность)')
+    parser.add_argument('--chunk-days', type=int, default=7, help='Размер чанка в днях (default: 7)')
+    parser.add_argument('--workers', type=int, default=4, help='Параллельных чанков (default: 4)')
+    parser.add_argument('--owm-url', type=str, default=OWM_BASE_URL, help='Базовый URL OpenWeatherMap')
+    parser.add_argument('--openaq-url', type=str, default=OPENAQ_BASE_URL, help='Базовый URL OpenAQ')
+    parser.add_argument('--output', type=str, default='data/pm25/backfill',
+                        help='Директория результатов и checkpoint (default: data/pm25/backfill)')
+    parser.add_argument('--sink', choices=['store', 'jsonl'], default='store',
+                        help=f'Куда писать: хранилище рядов {STORE_DIR} или JSONL в --output (default: store)')
+
+    args = parser.parse_args()
+
+    owm_key = os.getenv('OPENWEATHER_API_KEY')
+    if 'openweathermap' in args.sources and (not owm_key or owm_key == 'your_openweather_api_key_here'):
+        print("❌ OpenWeatherMap API ключ не найден в .env файле")
+        print("   Добавьте: OPENWEATHER_API_KEY=ваш_ключ")
+        return
+
+    backfill = HistoricalBackfill(
+        owm_key=owm_key,
+        openaq_key=os.getenv('OPENAQ_API_KEY'),
+        owm_base_url=args.owm_url,
+        openaq_base_url=args.openaq_url,
+        sink=TimeSeriesStore() if args.sink == 'store' else JsonlSink(args.output),
+        checkpoint_dir=args.output,
+        max_workers=args.workers
+    )
+
+    print("=" * 80)
+    print("⏪ BACKFILL ИСТОРИЧЕСКИХ ДАННЫХ")
+    print("=" * 80)
+    print(f"  Период: {args.start} — {args.end}")
+    print(f"  Источники: {', '.join(args.sources)}")
+    print("=" * 80)
+
+    summary = backfill.run(
+        _parse_date(args.start),
+        _parse_date(args.end),
+        chunk_days=args.chunk_days,
+        sources=args.sources,
+        openaq_sensors=args.openaq_sensors
+    )
+
+    print("=" * 80)
+    print(f"📊 Загружено чанков: {summary['done']}, пропущено (checkpoint): {summary['skipped']}, "
+          f"ошибок: {summary['failed']}")
+    print(f"📊 Записей: {summary['records']}")
+    if summary['failed']:
+        print("   Перезапустите команду - загрузка продолжится с места остановки")
+    print("=" * 80)
+
+
+if __name__ == "__main__":
+    main()
@@ -5,9 +5,94 @@ Baseline модель для предсказания PM2.5 только по м
 
 import numpy as np
 import pandas as pd
-from pathlib import Path
 from datetime import datetime
 import json
+import os
+
+
+MODEL_DIR = "data/models"
+# Версия формата артефакта модели (save/load); растёт при несовместимых изменениях
+ARTIFACT_VERSION = 1
+
+# Дней до начала месяца (невисокосный год)
+_DAYS_BEFORE_MONTH = np.array([0, 0, 31, 59, 90, 120, 151, 181, 212, 243, 273, 304, 334])
+_DIGIT_POSITIONS = [0, 1, 2, 3, 5, 6, 8, 9, 11, 12]
+
+
+def _timestamp_fields(timestamps):
+    """
+    Час, день года и месяц по местному времени метки (смещение пояса не применяется,
+    как у datetime.fromisoformat в prepare_features)
+
+    Returns:
+        tuple: hour, day_of_year, month - массивы int
+    """
+    if isinstance(timestamps, (pd.Series, pd.DatetimeIndex)) and timestamps.dtype.kind == 'M':
+        stamps = pd.Series(timestamps)
+        return stamps.dt.hour.to_numpy(), stamps.dt.dayofyear.to_numpy(), stamps.dt.month.to_numpy()
+
+    values = np.asarray(timestamps)
+    if values.dtype.kind == 'M':
+        days = values.astype('datetime64[D]')
+        hour = (values - days) // np.timedelta64(1, 'h')
+        day_of_year = (days - values.astype('datetime64[Y]')).astype(np.int64) + 1
+        month = values.astype('datetime64[M]').astype(np.int64) % 12 + 1
+        return hour, day_of_year, month
+
+    if len(values):
+        # Быстрый путь: ISO строки 'YYYY-MM-DDTHH...' - поля читаются прямо из байтов
+        try:
+            raw = values.astype('S19')
+        except (UnicodeEncodeError, TypeError, ValueError):
+            raw = None
+        if raw is not None:
+            chars = raw.view(np.uint8).reshape(len(raw), 19)
+            digits = chars[:, _DIGIT_POSITIONS].astype(np.int32) - 48
+            if (((digits >= 0) & (digits <= 9)).all()
+                    and (chars[:, [4, 7]] == ord('-')).all() and (chars[:, 13] == ord(':')).all()):
+                year = digits[:, 0] * 1000 + digits[:, 1] * 100 + digits[:, 2] * 10 + digits[:, 3]
+                month = digits[:, 4] * 10 + digits[:, 5]
+                day = digits[:, 6] * 10 + digits[:, 7]
+                hour = digits[:, 8] * 10 + digits[:, 9]
+                leap = (year % 4 == 0) & ((year % 100 != 0) | (year % 400 == 0))
+                day_of_year = _DAYS_BEFORE_MONTH[month] + day + (leap & (month > 2))
+                return hour, day_of_year, month
+
+    # Прочие форматы (только дата, datetime с микросекундами и т.п.): время на часах метки
+    stamps = pd.to_datetime(pd.Series([
+        (v if isinstance(v, str) else v.isoformat())[:19] for v in values
+    ]), format='ISO8601')
+    return stamps.dt.hour.to_numpy(), stamps.dt.dayofyear.to_numpy(), stamps.dt.month.to_numpy()
+
+
+class _ArtifactScaler:
+    """StandardScaler из артефакта: только transform, та же арифметика, что в sklearn"""
+
+    def __init__(self, mean, scale, var, n_samples_seen):
+        self.mean_ = mean
+        self.scale_ = scale
+        self.var_ = var
+        self.n_samples_seen_ = n_samples_seen
+
+    def transform(self, X):
+        X = np.array(X, copy=True)
+        if X.dtype not in (np.float32, np.float64):
+            X = X.astype(np.float64)
+        X -= self.mean_.astype(X.dtype)
+        X /= self.scale_.astype(X.dtype)
+        return X
+
+
+class _ArtifactRidge:
+    """Ridge из артефакта: только predict (X @ coef_ + intercept_, как в sklearn)"""
+
+    def __init__(self, coef, intercept, alpha):
+        self.coef_ = coef
+        self.intercept_ = intercept
+        self.alpha = alpha
+
+    def predict(self, X):
+        return X @ self.coef_ + self.intercept_
 
 
 class BaselineWeatherModel:
@@ -27,6 +112,8 @@ class BaselineWeatherModel:
     def __init__(self):
         self.model = None
         self.scaler = None
+        # Снапшот датасета, на котором обучена модель (записывается в артефакт)
+        self.snapshot_id = None
         self.feature_names = [
             'temperature',
             'humidity',
@@ -70,6 +157,44 @@ class BaselineWeatherModel:
 
         return np.array(features)
 
+    def prepare_features_batch(self, weather):
+        """
+        Векторная подготовка признаков для многих образцов (без цикла по строкам)
+
+        Args:
+            weather: pd.DataFrame, dict колонок (массивы одной длины) или список dict
+                     с метеоданными; колонки как у prepare_features
+
+        Returns:
+            np.array (N, 6) float64 - те же значения, что prepare_features построчно
+        """
+        if isinstance(weather, (list, tuple)):
+            columns = {
+                name: [w.get(name) for w in weather]
+                for name in ('timestamp', 'temperature', 'humidity', 'wind_speed')
+            }
+        else:
+            columns = weather
+
+        n = len(columns['timestamp'])
+        X = np.empty((n, len(self.feature_names)), dtype=np.float64)
+
+        # Отсутствующая колонка или значение - те же значения по умолчанию, что в prepare_features
+        for j, (name, default) in enumerate((('temperature', 0), ('humidity', 50), ('wind_speed', 0))):
+            if name in columns:
+                values = pd.to_numeric(pd.Series(columns[name]), errors='coerce').to_numpy(dtype=np.float64)
+                X[:, j] = np.where(np.isnan(values), default, values)
+            else:
+                X[:, j] = default
+
+        hour, day_of_year, month = _timestamp_fields(columns['timestamp'])
+        X[:, 3] = hour
+        X[:, 4] = day_of_year
+        # Зима в Бишкеке: декабрь-февраль (основной сезон смога)
+        X[:, 5] = np.isin(month, (12, 1, 2))
+
+        return X
+
     def train(self, X, y):
         """
         Обучение модели
@@ -116,6 +241,80 @@ class BaselineWeatherModel:
         X_scaled = self.scaler.transform(X)
         return self.model.predict(X_scaled)
 
+    def save(self, path, snapshot_id=None):
+        """
+        Сохраняет обученную модель в артефакт .npz (без pickle)
+
+        Хранятся статистики StandardScaler, коэффициенты Ridge, имена признаков,
+        ID снапшота обучения и версия формата; load() восстанавливает модель без
+        обучения и без импорта sklearn
+
+        Args:
+            path: Путь к .npz
+            snapshot_id: ID снапшота датасета (None = self.snapshot_id)
+
+        Returns:
+            str: путь к артефакту
+        """
+        if self.model is None or self.scaler is None:
+            raise ValueError("Модель не обучена! Вызовите train() сначала")
+
+        if snapshot_id is not None:
+            self.snapshot_id = snapshot_id
+
+        info = {
+            "version": ARTIFACT_VERSION,
+            "model": "ridge",
+            "alpha": float(self.model.alpha),
+            "feature_names": list(self.feature_names),
+            "snapshot_id": self.snapshot_id,
+            "n_samples_seen": int(np.max(self.scaler.n_samples_seen_)),
+            "created_at": datetime.now().isoformat()
+        }
+
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        tmp_path = path + ".tmp.npz"
+        # Без сжатия: загрузка - чтение нескольких десятков байт массивов
+        np.savez(
+            tmp_path,
+            scaler_mean=self.scaler.mean_,
+            scaler_scale=self.scaler.scale_,
+            scaler_var=self.scaler.var_,
+            coef=np.asarray(self.model.coef_),
+            intercept=np.asarray(self.model.intercept_),
+            info=np.array(json.dumps(info))
+        )
+        os.replace(tmp_path, path)
+        return path
+
+    @classmethod
+    def load(cls, path):
+        """
+        Загружает модель из артефакта save() (без обучения)
+
+        Returns:
+            BaselineWeatherModel: predict() даёт те же значения бит в бит, что исходная модель
+        """
+        with np.load(path, allow_pickle=False) as data:
+            info = json.loads(str(data["info"]))
+            if info.get("version", 0) > ARTIFACT_VERSION:
+                raise ValueError(f"Артефакт {path} версии {info['version']}, "
+                                 f"поддерживается до {ARTIFACT_VERSION}: обновите код")
+
+            model = cls()
+            # prepare_features_batch строит признаки в порядке текущего кода: артефакт
+            # с другим набором признаков дал бы неверные предсказания без ошибки
+            if info["feature_names"] != list(model.feature_names):
+                raise ValueError(f"Артефакт {path} обучен на признаках {info['feature_names']}, "
+                                 f"код строит {list(model.feature_names)}: переобучите модель")
+            model.snapshot_id = info.get("snapshot_id")
+            model.scaler = _ArtifactScaler(data["scaler_mean"], data["scaler_scale"], data["scaler_var"],
+                                           info["n_samples_seen"])
+            intercept = data["intercept"]
+            model.model = _ArtifactRidge(data["coef"], intercept[()] if intercept.ndim == 0 else intercept,
+                                         info["alpha"])
+        return model
+
     def evaluate(self, X, y_true):
         """
         Оценка качества модели
@@ -145,112 +344,110 @@ class BaselineWeatherModel:
         }
 
 
-def load_dataset(data_dir="data"):
+def train_and_evaluate_baseline(data_dir="data", sample_filter=None, snapshot=None, pm25_source=None,
+                                cv=None, cv_splits=5, n_jobs=None, save_model=None, load_model=None):
     """
-    Загрузка датасета из собранных данных
+    Полный цикл обучения и оценки baseline модели
 
-    Returns:
-        tuple: (X, y, metadata)
+    Args:
+        data_dir: Директория данных
+        sample_filter: dataset.SampleFilter (камера, даты, сезон, качество)
+        snapshot: ID снапшота датасета (см. dataset_snapshot.py) - воспроизводимый запуск
+        pm25_source: Брать PM2.5 из хранилища рядов ('all' - все входные ряды без fusion/*,
+                     'fusion' - ряд по городу из fusion.py,
+                     'sightline'/'sightline_kriging' - вдоль линии зрения камеры (interpolation.py),
+                     или источник, см. timeseries_store.py)
+        cv: Кросс-валидация вместо одного разбиения: 'blocked' (rolling origin по времени)
+            или 'camera' (leave-one-camera-out), см. cross_validation.py
+        cv_splits: Число test блоков для 'blocked'
+        n_jobs: Процессов для фолдов (None = все ядра)
+        save_model: Сохранить обученную модель в артефакт (.npz, см. BaselineWeatherModel.save)
+        load_model: Взять модель из артефакта вместо обучения (только оценка)
     """
-    data_path = Path(data_dir)
-
-    # Ищем метаданные сборов
-    metadata_files = list(data_path.glob("metadata/*.json"))
-
-    if not metadata_files:
-        print("❌ Нет собранных данных! Запустите сбор данных сначала")
-        return None, None, None
-
-    print(f"📂 Найдено {len(metadata_files)} файлов метаданных")
-
-    # Загружаем данные
-    samples = []
-
-    for meta_file in metadata_files:
-        with open(meta_file, 'r', encoding='utf-8') as f:
-            meta = json.load(f)
-
-        # Проверяем что есть все необходимые данные
-        if 'pm25' not in meta or meta['pm25'] is None:
-            continue
-
-        if 'weather' not in meta:
-            continue
-
-        sample = {
-            'timestamp': meta['timestamp'],
-            'camera_id': meta['camera_id'],
-            'pm25': meta['pm25'],
-            'weather': meta['weather'],
-            'image_path': meta.get('image_path')
-        }
-
-        samples.append(sample)
-
-    if not samples:
-        print("❌ Нет образцов с PM2.5 данными!")
-        return None, None, None
-
-    print(f"✅ Загружено {len(samples)} образцов с PM2.5 данными")
-
-    return samples
+    from dataset import load_arrays
 
-
-def train_and_evaluate_baseline():
-    """
-    Полный цикл обучения и оценки baseline модели
-    """
     print("=" * 80)
     print("🤖 BASELINE MODEL: WEATHER → PM2.5")
     print("=" * 80)
     print()
 
-    # Загрузка данных
-    print("📂 Загрузка датасета...")
-    samples = load_dataset()
+    model = BaselineWeatherModel()
 
-    if samples is None:
+    if snapshot is not None:
+        # Снапшот: X/y и разбиение фиксированы, диск не сканируется
+        from dataset_snapshot import load_snapshot
+        print(f"📂 Загрузка снапшота {snapshot}...")
+        snap = load_snapshot(snapshot)
+        model.snapshot_id = snap.snapshot_id
+        X, y = snap.X, snap.y
+        camera_ids, timestamps = snap.camera_id, snap.timestamp
+    else:
+        # Потоковая загрузка данных блоками (без списка dict в памяти)
+        print("📂 Загрузка датасета...")
+        snap = None
+        pm25_store = None
+        if pm25_source is not None:
+            from timeseries_store import TimeSeriesStore
+            print(f"🗃️  PM2.5: часовые средние из хранилища рядов ({pm25_source})")
+            pm25_store = TimeSeriesStore()
+        X, y, camera_ids, timestamps = load_arrays(
+            data_dir, sample_filter, model=model,
+            pm25_store=pm25_store,
+            pm25_source=None if pm25_source == 'all' else pm25_source
+        )
+
+    if X is None:
         print("\n⚠️  Нет данных для обучения!")
         print("   Запустите сбор данных: python src/collect_data.py")
         return
 
-    # Подготовка данных
-    print(f"\n📊 Подготовка {len(samples)} образцов...")
-
-    model = BaselineWeatherModel()
-
-    X = []
-    y = []
-
-    for sample in samples:
-        features = model.prepare_features(sample['weather'])
-        X.append(features)
-        y.append(sample['pm25'])
-
-    X = np.array(X)
-    y = np.array(y)
+    print(f"\n📊 Подготовлено {len(y)} образцов")
 
     print(f"   X shape: {X.shape}")
     print(f"   y shape: {y.shape}")
     print(f"   PM2.5 range: {y.min():.1f} - {y.max():.1f} µg/m³")
     print(f"   PM2.5 mean: {y.mean():.1f} µg/m³")
 
+    if cv is not None:
+        from cross_validation import cross_validate, print_report
+        result = cross_validate(X, y, timestamps, camera_ids, scheme=cv, n_splits=cv_splits, n_jobs=n_jobs)
+        if result is None:
+            print(f"\n⚠️  Недостаточно данных для схемы {cv} (нужны разные периоды / камеры)")
+            return
+        print_report(result)
+        print("\n" + "=" * 80)
+        return result
+
     # Train/test split (80/20)
-    from sklearn.model_selection import train_test_split
-    X_train, X_test, y_train, y_test = train_test_split(
-        X, y, test_size=0.2, random_state=42
-    )
+    if snap is not None:
+        X_train, X_test, y_train, y_test = snap.train_test()
+    else:
+        from sklearn.model_selection import train_test_split
+        X_train, X_test, y_train, y_test = train_test_split(
+            X, y, test_size=0.2, random_state=42
+        )
 
     print(f"\n📊 Split:")
     print(f"   Train: {len(X_train)} образцов")
     print(f"   Test: {len(X_test)} образцов")
 
-    # Обучение
-    print("\n🏋️  Обучение модели...")
-    success = model.train(X_train, y_train)
+    if load_model is not None:
+        # Готовая модель: без обучения, только оценка
+        model = BaselineWeatherModel.load(load_model)
+        print(f"\n📦 Модель загружена: {load_model} (снапшот обучения: {model.snapshot_id or 'нет'})")
+        if snap is not None and model.snapshot_id not in (None, snap.snapshot_id):
+            print("   ⚠️  Модель обучена на другом снапшоте: train метрики не сопоставимы")
+    else:
+        # Обучение
+        print("\n🏋️  Обучение модели...")
+        success = model.train(X_train, y_train)
 
-    if not success:
-        return
+        if not success:
+            return
+
+        if save_model is not None:
+            model.save(save_model)
+            print(f"💾 Модель сохранена: {save_model}")
 
     # Оценка на train
     print("\n📈 Оценка на Train set:")
@@ -305,11 +502,63 @@ def train_and_evaluate_baseline():
     print("\n" + "=" * 80)
 
 
+def parse_args():
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Baseline модель: метеоданные → PM2.5')
+    parser.add_argument('--data-dir', type=str, default='data',
+                        help='Директория данных (default: data)')
+    parser.add_argument('--cameras', nargs='+', default=None,
+                        help='Только эти камеры')
+    parser.add_argument('--start', type=str, default=None,
+                        help='Начало периода (ISO, например 2025-12-01)')
+    parser.add_argument('--end', type=str, default=None,
+                        help='Конец периода (ISO)')
+    parser.add_argument('--season', choices=['winter', 'spring', 'summer', 'autumn'], default=None,
+                        help='Только один сезон')
+    parser.add_argument('--min-sharpness', type=float, default=None,
+                        help='Минимальная резкость кадра')
+    parser.add_argument('--min-sky-ratio', type=float, default=None,
+                        help='Минимальная доля неба')
+    parser.add_argument('--snapshot', type=str, default=None,
+                        help='ID снапшота датасета (фильтры игнорируются)')
+    parser.add_argument('--pm25-source', choices=['all', 'fusion', 'openaq', 'iqair', 'openweathermap',
+                                                  'sightline', 'sightline_kriging'], default=None,
+                        help='PM2.5 из хранилища рядов (часовое среднее) вместо метаданных образца; '
+                             'sightline - интерполяция вдоль линии зрения камеры')
+    parser.add_argument('--cv', choices=['blocked', 'camera'], default=None,
+                        help='Кросс-валидация вместо случайного train/test: blocked - rolling origin '
+                             'по времени, camera - leave-one-camera-out')
+    parser.add_argument('--cv-splits', type=int, default=5,
+                        help='Число test блоков для --cv blocked (default: 5)')
+    parser.add_argument('--n-jobs', type=int, default=None,
+                        help='Процессов для фолдов кросс-валидации (default: все ядра)')
+    parser.add_argument('--save-model', type=str, nargs='?', default=None, const=f"{MODEL_DIR}/baseline.npz",
+                        help=f'Сохранить обученную модель (.npz, default: {MODEL_DIR}/baseline.npz)')
+    parser.add_argument('--load-model', type=str, default=None,
+                        help='Оценить сохранённую модель без обучения')
+    return parser.parse_args()
+
+
 if __name__ == "__main__":
     # Проверяем наличие scikit-learn
     try:
         import sklearn
-        train_and_evaluate_baseline()
+        from dataset import SampleFilter
+
+        args = parse_args()
+        sample_filter = SampleFilter(
+            cameras=args.cameras,
+            start=args.start,
+            end=args.end,
+            season=args.season,
+            min_sharpness=args.min_sharpness,
+            min_sky_ratio=args.min_sky_ratio
+        )
+        train_and_evaluate_baseline(args.data_dir, sample_filter, snapshot=args.snapshot,
+                                    pm25_source=args.pm25_source, cv=args.cv,
+                                    cv_splits=args.cv_splits, n_jobs=args.n_jobs,
+                                    save_model=args.save_model, load_model=args.load_model)
     except ImportError:
         print("=" * 80)
         print("❌ ТРЕБУЕТСЯ SCIKIT-LEARN")
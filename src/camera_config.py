@@ -68,21 +68,43 @@ CAMERAS = {
 }
 
 
+def _registry():
+    """
+    Реестр камер data/cameras.json (camera_registry.py) - CAMERAS выше только его начальное
+    содержимое; None, если реестр ещё не создан (его создаёт сборщик или CLI реестра) или недоступен
+    """
+    from camera_registry import get_registry
+    try:
+        registry = get_registry()
+    except OSError as e:
+        print(f"⚠️  Реестр камер недоступен ({e}), используется camera_config.CAMERAS")
+        return None
+    return registry if registry.exists() else None
+
+
 def get_recommended_cameras():
-    """Возвращает список рекомендуемых камер для проекта"""
-    return {k: v for k, v in CAMERAS.items() if v["recommended"]}
+    """Возвращает список рекомендуемых камер для проекта (из реестра, включённые)"""
+    registry = _registry()
+    if registry is None:
+        return {k: v for k, v in CAMERAS.items() if v["recommended"]}
+    return registry.cameras(recommended_only=True)
 
 
 def get_camera_by_id(camera_id):
-    """Получить данные камеры по ID"""
-    return CAMERAS.get(camera_id)
+    """Получить данные камеры по ID (из реестра)"""
+    registry = _registry()
+    if registry is None:
+        return CAMERAS.get(camera_id)
+    return registry.get(camera_id)
 
 
 def list_all_cameras():
     """Вывести список всех камер"""
+    registry = _registry()
+    cameras = registry.cameras(include_disabled=True) if registry is not None else CAMERAS
     print("Доступные камеры:")
     print("=" * 80)
-    for camera_id, info in CAMERAS.items():
+    for camera_id, info in cameras.items():
         status = "✅ Рекомендуется" if info["recommended"] else "⚠️  Не рекомендуется"
         coords = f"{info['coordinates']}" if info['coordinates'] else "Неизвестно"
         filter_required = "🔍 Фильтрация" if info.get("require_quality_filter", False) else "Нет"
@@ -0,0 +1,212 @@
+"""
+Реестр камер в файле данных с горячей перезагрузкой
+camera_config.CAMERAS - словарь в коде: добавить или отключить поток можно было только
+правкой кода и перезапуском collect_continuous
+
+Реестр (data/cameras.json):
+    - заполняется из camera_config.CAMERAS при первом запуске сборщика или CLI реестра
+      (seed=True); функции чтения camera_config файл не создают - без реестра они читают CAMERAS
+    - если CAMERAS в коде разошёлся с реестром (новые или изменённые камеры),
+      выводится предупреждение: правки кода применяются только через --reseed
+    - поля записи те же, что в CAMERAS, плюс необязательные:
+        enabled           - False = камера не снимается (запись остаётся)
+        interval_minutes  - свой интервал съёмки камеры
+        quality_filter    - параметры FrameQualityFilter (min_brightness, ...)
+    - cameras() перечитывает файл, только если изменились mtime/размер;
+      reload() сообщает, какие камеры добавлены, удалены и изменены, - сборщик
+      пересоздаёт сессии только этих камер
+"""
+
+import os
+import json
+import argparse
+import threading
+
+
+REGISTRY_PATH = "data/cameras.json"
+
+
+def _normalize(info):
+    """Запись из JSON -> формат CAMERAS (координаты - кортеж)"""
+    info = dict(info)
+    if info.get("coordinates") is not None:
+        info["coordinates"] = tuple(info["coordinates"])
+    return info
+
+
+def config_divergence(cameras):
+    """
+    Расхождение реестра с camera_config.CAMERAS (поля, которых нет в коде, не сравниваются)
+
+    Args:
+        cameras: Камеры реестра (camera_id -> запись)
+
+    Returns:
+        dict: missing - камеры CAMERAS, которых нет в реестре; changed - камеры с другими полями
+    """
+    from camera_config import CAMERAS
+
+    missing = {camera_id for camera_id in CAMERAS if camera_id not in cameras}
+    changed = {
+        camera_id for camera_id, info in CAMERAS.items()
+        if camera_id in cameras and any(
+            _normalize({name: value})[name] != cameras[camera_id].get(name) for name, value in info.items()
+        )
+    }
+    return {"missing": missing, "changed": changed}
+
+
+def seed_registry(path=REGISTRY_PATH, overwrite=False):
+    """
+    Создаёт файл реестра из camera_config.CAMERAS
+
+    Returns:
+        bool: True если файл записан
+    """
+    if os.path.exists(path) and not overwrite:
+        return False
+    from camera_config import CAMERAS
+
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    with open(path + ".tmp", 'w', encoding='utf-8') as f:
+        json.dump({"cameras": CAMERAS}, f, indent=2, ensure_ascii=False)
+    os.replace(path + ".tmp", path)
+    return True
+
+
+class CameraRegistry:
+    """Камеры из файла реестра (перечитывается при изменении файла)"""
+
+    def __init__(self, path=REGISTRY_PATH, seed=False):
+        """
+        Args:
+            path: Файл реестра
+            seed: Создать файл из camera_config.CAMERAS, если его нет (сборщик и CLI реестра)
+        """
+        self.path = path
+        if seed:
+            seed_registry(path)
+
+        self._lock = threading.Lock()
+        self._signature = None
+        self._cameras = {}
+        self.reload()
+
+    def _file_signature(self):
+        try:
+            stat = os.stat(self.path)
+        except FileNotFoundError:
+            return None
+        return (stat.st_mtime_ns, stat.st_size)
+
+    def reload(self):
+        """
+        Перечитывает файл, если он изменился
+
+        Returns:
+            dict: added, removed, changed - множества camera_id (пустые, если файл не менялся)
+        """
+        changes = {"added": set(), "removed": set(), "changed": set()}
+        with self._lock:
+            signature = self._file_signature()
+            if signature == self._signature:
+                return changes
+
+            if signature is None:
+                cameras = {}
+            else:
+                try:
+                    with open(self.path, 'r', encoding='utf-8') as f:
+                        data = json.load(f)
+                except (OSError, json.JSONDecodeError) as e:
+                    # Файл правят руками: при ошибке остаётся прежний набор камер
+                    print(f"⚠️  Реестр камер {self.path} не прочитан: {e}")
+                    return changes
+                cameras = {camera_id: _normalize(info) for camera_id, info in data.get("cameras", {}).items()}
+
+            old = self._cameras
+            changes["added"] = set(cameras) - set(old)
+            changes["removed"] = set(old) - set(cameras)
+            changes["changed"] = {camera_id for camera_id in set(cameras) & set(old) if cameras[camera_id] != old[camera_id]}
+
+            self._cameras = cameras
+            self._signature = signature
+
+        if signature is not None:
+            self._warn_divergence(cameras)
+        return changes
+
+    def exists(self):
+        return os.path.exists(self.path)
+
+    def _warn_divergence(self, cameras):
+        divergence = config_divergence(cameras)
+        if divergence["missing"] or divergence["changed"]:
+            details = ", ".join(
+                f"{title}: {', '.join(sorted(ids))}"
+                for title, ids in (("нет в реестре", divergence["missing"]), ("изменены", divergence["changed"]))
+                if ids
+            )
+            print(f"⚠️  camera_config.CAMERAS расходится с реестром {self.path} ({details}); "
+                  f"используется реестр, применить правки кода: python src/camera_registry.py --reseed")
+
+    def cameras(self, recommended_only=False, include_disabled=False):
+        """
+        Актуальные камеры (файл перечитывается, если изменился)
+
+        Returns:
+            dict: camera_id -> запись в формате CAMERAS
+        """
+        self.reload()
+        with self._lock:
+            return {
+                camera_id: info for camera_id, info in self._cameras.items()
+                if (include_disabled or info.get("enabled", True))
+                and (not recommended_only or info.get("recommended", False))
+            }
+
+    def get(self, camera_id):
+        return self.cameras(include_disabled=True).get(camera_id)
+
+
+_default_registry = None
+_default_lock = threading.Lock()
+
+
+def get_registry():
+    """Общий реестр по умолчанию (data/cameras.json) только для чтения: файл не создаётся"""
+    global _default_registry
+    with _default_lock:
+        if _default_registry is None:
+            _default_registry = CameraRegistry(seed=False)
+        return _default_registry
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Реестр камер (data/cameras.json)')
+    parser.add_argument('--path', type=str, default=REGISTRY_PATH)
+    parser.add_argument('--reseed', action='store_true', help='Перезаписать реестр из camera_config.CAMERAS')
+    args = parser.parse_args()
+
+    if args.reseed:
+        seed_registry(args.path, overwrite=True)
+        print(f"🔄 Реестр перезаписан из camera_config.CAMERAS: {args.path}")
+
+    registry = CameraRegistry(args.path, seed=True)
+    cameras = registry.cameras(include_disabled=True)
+    print(f"📹 Камер в реестре: {len(cameras)} ({args.path})")
+    for camera_id, info in cameras.items():
+        flags = []
+        if not info.get("enabled", True):
+            flags.append("отключена")
+        if info.get("recommended"):
+            flags.append("рекомендуется")
+        if info.get("interval_minutes"):
+            flags.append(f"интервал {info['interval_minutes']} мин")
+        if info.get("quality_filter"):
+            flags.append("свой фильтр")
+        print(f"  {camera_id}: {info['name']}" + (f" [{', '.join(flags)}]" if flags else ""))
+
+
+if __name__ == "__main__":
+    main()
@@ -7,6 +7,33 @@ import json
 from pathlib import Path
 
 
+# Пороги по умолчанию (find_sensors.recommend_camera_sensor_pairs), если однородность не измерена
+DEFAULT_EXCELLENT_KM = 2.0
+DEFAULT_ACCEPTABLE_KM = 5.0
+
+
+def distance_cutoffs():
+    """
+    Пороги расстояния камера-датчик
+
+    Измеренные по корреляции между датчиками (correlation.py: расстояния, на которых
+    корреляция PM2.5 падает до 0.9 / 0.75), иначе фиксированные 2 км / 5 км
+
+    Returns:
+        tuple: (отличная пара км, приемлемо км, измерены ли пороги)
+    """
+    try:
+        from correlation import homogeneity_cutoffs
+        cutoffs = homogeneity_cutoffs()
+    except Exception as e:
+        print(f"⚠️  Однородность PM2.5 не измерена: {e}")
+        cutoffs = None
+
+    if cutoffs is None:
+        return DEFAULT_EXCELLENT_KM, DEFAULT_ACCEPTABLE_KM, False
+    return cutoffs[0], cutoffs[1], True
+
+
 def check_sensor_camera_distances():
     """
     Проверяет расстояния между камерами и датчиками
@@ -35,13 +62,21 @@ def check_sensor_camera_distances():
         print("\n❌ FATAL: Нет рекомендаций по парам камера-датчик!")
         return False
 
+    excellent_km, acceptable_km, measured = distance_cutoffs()
+    if measured:
+        print(f"\n📏 Пороги по измеренной однородности PM2.5: отлично < {excellent_km:.1f} км, "
+              f"приемлемо < {acceptable_km:.1f} км")
+    else:
+        print(f"\n📏 Пороги по умолчанию: отлично < {excellent_km:.0f} км, приемлемо < {acceptable_km:.0f} км")
+        print("   (измерить однородность: python src/correlation.py)")
+
     # Подсчёт
     viable_cameras = []
     problematic_cameras = []
 
     for camera_id, rec in recommendations.items():
         dist = rec["distance_km"]
-        use = rec["use_for_paper"]
+        use = dist < acceptable_km
 
         if use:
             viable_cameras.append((camera_id, rec["sensor"], dist))
@@ -121,7 +156,8 @@ def estimate_required_data():
     if sensor_file.exists():
         with open(sensor_file, 'r', encoding='utf-8') as f:
             data = json.load(f)
-        viable_count = sum(1 for r in data.get("recommendations", {}).values() if r["use_for_paper"])
+        _, acceptable_km, _ = distance_cutoffs()
+        viable_count = sum(1 for r in data.get("recommendations", {}).values() if r["distance_km"] < acceptable_km)
     else:
         viable_count = 2  # Предполагаем 2 камеры
 
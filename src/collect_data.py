@@ -6,38 +6,183 @@
 
 import cv2
 import os
+import sys
+import math
+import signal
 from datetime import datetime, time as dt_time
 import time
 from concurrent.futures import ThreadPoolExecutor, as_completed
 import argparse
-from camera_config import CAMERAS, get_recommended_cameras
-from frame_quality import get_default_filter
+from camera_registry import CameraRegistry, REGISTRY_PATH
+from frame_quality import FrameQualityFilter, get_default_filter, get_strict_filter, get_lenient_filter
+from image_archive import ShardedArchiveWriter
+from frame_index import FrameIndex, partitioned_path, DEFAULT_INDEX_FILENAME
+
+
+QUALITY_FILTER_PRESETS = {
+    "default": get_default_filter,
+    "strict": get_strict_filter,
+    "lenient": get_lenient_filter,
+}
+
+
+class CameraSession:
+    """
+    Состояние сборщика для одной камеры: фильтр качества и расписание съёмки
+    Пересоздаётся только при изменении записи камеры в реестре
+    """
+
+    def __init__(self, camera_id, camera_info):
+        self.camera_id = camera_id
+        self.camera_info = camera_info
+        self.interval_minutes = camera_info.get("interval_minutes")
+        self.last_capture = None
+
+        # quality_filter в реестре: имя пресета или параметры FrameQualityFilter
+        settings = camera_info.get("quality_filter")
+        if isinstance(settings, dict):
+            self.quality_filter = FrameQualityFilter(**settings)
+        else:
+            self.quality_filter = QUALITY_FILTER_PRESETS[settings or "default"]()
+
+    def seconds_until_due(self, default_interval_minutes, now=None):
+        if self.last_capture is None:
+            return 0.0
+        now = time.time() if now is None else now
+        interval = (self.interval_minutes or default_interval_minutes) * 60
+        return max(0.0, self.last_capture + interval - now)
 
 
 class MultiCameraCapture:
     """Класс для одновременного захвата кадров с нескольких камер"""
 
-    def __init__(self, cameras, output_dir="data/images", daylight_start=8, daylight_end=18):
+    def __init__(self, cameras, output_dir="data/images", daylight_start=8, daylight_end=18,
+                 archive_dir=None, tick_listeners=None, cluster=None, registry=None, recommended_only=True,
+                 align_ticks=None):
         """
         Args:
             cameras: dict с данными камер из camera_config.py
             output_dir: Базовая директория для сохранения изображений
             daylight_start: Начало светового дня (час, 0-23)
             daylight_end: Конец светового дня (час, 0-23)
+            archive_dir: Директория шардированного архива (None = отдельные JPEG-файлы)
+            tick_listeners: Функции f(tick_id, timestamp), вызываемые на каждом такте
+                            одновременно с захватом кадров (например ReadingsPoller)
+            cluster: collector_cluster.CollectorWorker - снимать только камеры, аренда которых
+                     у этого процесса (None = все камеры)
+            registry: camera_registry.CameraRegistry - набор камер перечитывается на каждом
+                      такте без перезапуска (None = фиксированный cameras)
+            recommended_only: Брать из реестра только рекомендуемые камеры
+            align_ticks: Время такта - по общей сетке (см. tick_grid_seconds), а не по часам процесса:
+                         сборщики кластера получают одинаковый tick_id и кадры всех сборщиков
+                         связываются с показаниями, которые опросил один из них
+                         (None = включено, если задан cluster)
         """
         self.cameras = cameras
+        self.registry = registry
+        self.recommended_only = recommended_only
+        self.sessions = {camera_id: CameraSession(camera_id, info) for camera_id, info in cameras.items()}
         self.output_dir = output_dir
         self.daylight_start = daylight_start
         self.daylight_end = daylight_end
-
-        # Фильтр качества для поворотных камер
-        self.quality_filter = get_default_filter()
+        self.tick_listeners = list(tick_listeners or [])
+        self.cluster = cluster
+        self.align_ticks = cluster is not None if align_ticks is None else align_ticks
+
+        # Шардированный архив вместо миллионов мелких файлов
+        self.archive = None
+        if archive_dir:
+            # В кластере кадр пишется, только пока аренда камеры у этого процесса
+            self.archive = ShardedArchiveWriter(archive_dir, guard=cluster.holds if cluster is not None else None)
+        if cluster is not None and self.archive is not None:
+            # Камера ушла другому сборщику - её шард закрывается, смещение не переиспользуется
+            cluster.on_release = self._release_cameras
+
+        # Индекс кадров по времени (для партиционированной раскладки файлов)
+        self.frame_index = None if self.archive else FrameIndex(os.path.join(output_dir, DEFAULT_INDEX_FILENAME))
 
         # Создаём директории для каждой камеры
         for camera_id in cameras.keys():
             camera_dir = os.path.join(output_dir, camera_id)
             os.makedirs(camera_dir, exist_ok=True)
 
+    def refresh_cameras(self):
+        """
+        Применяет изменения реестра камер: сессии пересоздаются только у добавленных
+        и изменённых камер, у удалённых/отключённых - закрываются
+
+        Returns:
+            dict: added, removed, changed - списки camera_id
+        """
+        if self.registry is None:
+            return {"added": [], "removed": [], "changed": []}
+
+        cameras = self.registry.cameras(recommended_only=self.recommended_only)
+        changes = {
+            "added": sorted(set(cameras) - set(self.sessions)),
+            "removed": sorted(set(self.sessions) - set(cameras)),
+            "changed": sorted(
+                camera_id for camera_id in set(cameras) & set(self.sessions)
+                if cameras[camera_id] != self.sessions[camera_id].camera_info
+            ),
+        }
+
+        for camera_id in changes["removed"]:
+            del self.sessions[camera_id]
+        for camera_id in changes["added"] + changes["changed"]:
+            previous = self.sessions.get(camera_id)
+            self.sessions[camera_id] = CameraSession(camera_id, cameras[camera_id])
+            if previous is not None:
+                # Новые настройки не сбивают расписание камеры
+                self.sessions[camera_id].last_capture = previous.last_capture
+            os.makedirs(os.path.join(self.output_dir, camera_id), exist_ok=True)
+
+        self.cameras = cameras
+        if self.cluster is not None:
+            self.cluster.cameras = cameras
+
+        for label, key in (("➕ Добавлены", "added"), ("➖ Убраны", "removed"), ("🔧 Изменены", "changed")):
+            if changes[key]:
+                print(f"{label} камеры из реестра: {', '.join(changes[key])}")
+        return changes
+
+    def _release_cameras(self, camera_ids, terminate):
+        for camera_id in camera_ids:
+            self.archive.close_camera(camera_id, terminate=terminate)
+        if camera_ids:
+            print(f"🖧 Камеры переданы другому сборщику: {', '.join(sorted(camera_ids))}")
+
+    def close(self):
+        """Закрывает шарды архива (блоки конца tar) и индекс кадров"""
+        if self.archive is not None:
+            self.archive.close()
+        if self.frame_index is not None:
+            self.frame_index.close()
+
+    def seconds_until_due(self, interval_minutes):
+        """Время до ближайшей камеры, которой пора снимать (свои интервалы камер из реестра)"""
+        # В кластере ждём только свои камеры: чужие этот процесс не снимает
+        sessions = [
+            session for camera_id, session in self.sessions.items()
+            if self.cluster is None or self.cluster.holds(camera_id)
+        ]
+        if not sessions:
+            return interval_minutes * 60
+        return min(session.seconds_until_due(interval_minutes) for session in sessions)
+
+    def tick_grid_seconds(self, interval_minutes=None):
+        """
+        Шаг общей сетки тактов: НОД интервалов камер, секунд
+
+        Такт выравнивается вниз по сетке от начала эпохи: все сборщики с теми же
+        интервалами снимают в одни и те же моменты, а кадры одной камеры с разными
+        интервалами не получают одно время
+        """
+        minutes = [int(interval_minutes or 1)] + [
+            int(session.interval_minutes) for session in self.sessions.values() if session.interval_minutes
+        ]
+        return math.gcd(*minutes) * 60
+
     def is_daylight(self):
         """
         Проверяет, является ли текущее время дневным
@@ -80,7 +225,8 @@ class MultiCameraCapture:
             # Проверяем качество кадра (для камер с фильтрацией)
             quality_metrics = None
             if camera_info.get("require_quality_filter", False):
-                is_useful, quality_metrics = self.quality_filter.filter_frame(frame)
+                session = self.sessions.get(camera_id) or CameraSession(camera_id, camera_info)
+                is_useful, quality_metrics = session.quality_filter.filter_frame(frame)
                 if not is_useful:
                     return {
                         "camera_id": camera_id,
@@ -92,12 +238,25 @@ class MultiCameraCapture:
 
             # Формируем путь к файлу
             timestamp_str = timestamp.strftime('%Y%m%d_%H%M%S')
-            filename = f"{camera_id}_{timestamp_str}.jpg"
-            camera_dir = os.path.join(self.output_dir, camera_id)
-            filepath = os.path.join(camera_dir, filename)
 
-            # Сохраняем изображение
-            cv2.imwrite(filepath, frame)
+            if self.archive is not None:
+                # Сохраняем изображение в шард архива
+                ok, encoded = cv2.imencode('.jpg', frame)
+                if not ok:
+                    return {
+                        "camera_id": camera_id,
+                        "success": False,
+                        "error": "Не удалось закодировать кадр"
+                    }
+                entry = self.archive.append(camera_id, timestamp, encoded.tobytes())
+                filepath = f"{os.path.join(self.archive.archive_dir, camera_id, entry['shard'])}@{timestamp_str}"
+            else:
+                # Партиция <camera_id>/<YYYY>/<MM>/<DD>/
+                filepath = partitioned_path(self.output_dir, camera_id, timestamp)
+                os.makedirs(os.path.dirname(filepath), exist_ok=True)
+
+                # Сохраняем изображение
+                cv2.imwrite(filepath, frame)
 
             result = {
                 "camera_id": camera_id,
@@ -123,35 +282,70 @@ class MultiCameraCapture:
                 "error": str(e)
             }
 
-    def capture_all_cameras(self, max_workers=5):
+    def capture_all_cameras(self, max_workers=5, interval_minutes=None, now=None):
         """
         Одновременный захват кадров со всех камер
 
         Args:
             max_workers: Максимальное количество потоков
+            interval_minutes: Снимать только камеры, которым пора по их интервалу
+                              (interval_minutes из реестра, иначе этот); None = все камеры
+            now: Время такта, unix (None = текущее)
 
         Returns:
             list: список результатов для каждой камеры
         """
-        timestamp = datetime.now()
+        # Изменения реестра камер применяются без перезапуска
+        self.refresh_cameras()
+
+        # В кластере набор камер пересчитывается на каждом такте (упавшие/новые сборщики)
+        now = time.time() if now is None else now
+        cameras = self.cluster.rebalance(now) if self.cluster is not None else self.cameras
+
+        if self.align_ticks:
+            now -= now % self.tick_grid_seconds(interval_minutes)
+
+        if interval_minutes is not None:
+            cameras = {
+                camera_id: info for camera_id, info in cameras.items()
+                if self.sessions[camera_id].seconds_until_due(interval_minutes, now) == 0
+            }
+        for camera_id in cameras:
+            self.sessions[camera_id].last_capture = now
+
+        timestamp = datetime.fromtimestamp(now).replace(microsecond=0)
+        # ID такта = время такта: кадры и показания такта связываются точным совпадением
+        # (в кластере время выровнено по общей сетке - показания опрашивает один сборщик)
+        tick_id = timestamp.strftime('%Y%m%d_%H%M%S')
         results = []
 
         print(f"🎥 Начинаем захват кадров...")
         print(f"⏰ Время: {timestamp.strftime('%Y-%m-%d %H:%M:%S')}")
-        print(f"📹 Количество камер: {len(self.cameras)}")
+        print(f"📹 Количество камер: {len(cameras)}")
         print("-" * 80)
 
+        # Слушатели такта (опрос PM2.5/метео) стартуют одновременно с захватом кадров
+        listener_executor = None
+        listener_futures = []
+        if self.tick_listeners:
+            listener_executor = ThreadPoolExecutor(max_workers=len(self.tick_listeners))
+            listener_futures = [
+                listener_executor.submit(listener, tick_id, timestamp)
+                for listener in self.tick_listeners
+            ]
+
         # Используем ThreadPoolExecutor для параллельного захвата
         with ThreadPoolExecutor(max_workers=max_workers) as executor:
             # Запускаем захват для каждой камеры
             future_to_camera = {
                 executor.submit(self.capture_single_camera, camera_id, camera_info, timestamp): camera_id
-                for camera_id, camera_info in self.cameras.items()
+                for camera_id, camera_info in cameras.items()
             }
 
             # Собираем результаты по мере готовности
             for future in as_completed(future_to_camera):
                 result = future.result()
+                result["tick_id"] = tick_id
                 results.append(result)
 
                 # Выводим результат
@@ -172,6 +366,21 @@ class MultiCameraCapture:
                         print(f"❌ {result['camera_id']}")
                         print(f"   Ошибка: {result['error']}")
 
+        # Ждём слушателей такта
+        for future in listener_futures:
+            try:
+                future.result()
+            except Exception as e:
+                print(f"❌ Ошибка слушателя такта {tick_id}: {e}")
+        if listener_executor is not None:
+            listener_executor.shutdown()
+
+        # Регистрируем новые кадры в индексе одним батчем
+        if self.frame_index is not None:
+            self.frame_index.add_many(
+                (r["camera_id"], r["timestamp"], r["filepath"]) for r in results if r["success"]
+            )
+
         print("-" * 80)
         successful = sum(1 for r in results if r["success"])
         filtered = sum(1 for r in results if r.get("filtered", False))
@@ -247,8 +456,8 @@ class MultiCameraCapture:
                 print(f"📸 Сбор #{collection_count} (☀️  Дневное время)")
                 print(f"{'='*80}")
 
-                # Захватываем кадры со всех камер
-                results = self.capture_all_cameras()
+                # Захватываем кадры со всех камер, которым пора по их интервалу
+                results = self.capture_all_cameras(interval_minutes=interval_minutes)
 
                 # Сохраняем метаданные
                 self._save_metadata(results, collection_count)
@@ -262,12 +471,13 @@ class MultiCameraCapture:
                             print(f"🌙 Пропущено ночных интервалов: {skipped_count}")
                         break
 
-                # Ждём до следующего сбора
-                next_collection_time = datetime.fromtimestamp(time.time() + interval_minutes * 60)
-                print(f"\n⏳ Следующий сбор через {interval_minutes} минут...")
+                # Ждём до следующего сбора (ближайшая камера по её интервалу)
+                wait_seconds = self.seconds_until_due(interval_minutes)
+                next_collection_time = datetime.fromtimestamp(time.time() + wait_seconds)
+                print(f"\n⏳ Следующий сбор через {wait_seconds / 60:.0f} минут...")
                 print(f"⏰ Следующий сбор: {next_collection_time.strftime('%H:%M:%S')}")
                 print("=" * 80)
-                time.sleep(interval_minutes * 60)
+                time.sleep(wait_seconds)
 
         except KeyboardInterrupt:
             print(f"\n\n⚠️  Сбор остановлен пользователем")
@@ -281,10 +491,14 @@ class MultiCameraCapture:
         os.makedirs(metadata_dir, exist_ok=True)
 
         timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-        metadata_file = os.path.join(metadata_dir, f"collection_{timestamp}.txt")
+        # Сборщики кластера пишут в одну директорию - имя файла включает ID сборщика
+        suffix = f"_{self.cluster.worker_id}" if self.cluster is not None else ""
+        metadata_file = os.path.join(metadata_dir, f"collection_{timestamp}{suffix}.txt")
 
         with open(metadata_file, 'w', encoding='utf-8') as f:
             f.write(f"Сбор #{collection_count}\n")
+            if results:
+                f.write(f"Такт: {results[0]['tick_id']}\n")
             f.write(f"Время: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}\n")
             f.write(f"Камер: {len(results)}\n")
             f.write(f"Успешно: {sum(1 for r in results if r['success'])}\n")
@@ -316,35 +530,93 @@ def main():
                         help='Конец светового дня, час (default: 18)')
     parser.add_argument('--24-7', action='store_true',
                         help='Собирать данные 24/7 (включая ночь, не рекомендуется)')
+    parser.add_argument('--archive', type=str, default=None,
+                        help='Писать кадры в шардированный архив (например data/archive)')
+    parser.add_argument('--with-pm25', action='store_true',
+                        help='Опрашивать PM2.5/метео на каждом такте сбора (ключи из .env)')
+    parser.add_argument('--retention-full-days', type=int, default=None,
+                        help='Фоновая компакция архива: дней в полном разрешении (требует --archive)')
+    parser.add_argument('--cluster', action='store_true',
+                        help='Делить камеры с другими сборщиками (consistent hashing + аренды, см. collector_cluster.py)')
+    parser.add_argument('--cluster-db', type=str, default='data/cluster/cluster.sqlite',
+                        help='Общая база координации кластера')
+    parser.add_argument('--worker-id', type=str, default=None,
+                        help='ID сборщика в кластере (default: <host>-<pid>)')
+    parser.add_argument('--registry', type=str, default=REGISTRY_PATH,
+                        help='Реестр камер; правки файла применяются на следующем такте без перезапуска')
 
     args = parser.parse_args()
 
-    # Выбираем камеры
+    # Выбираем камеры (реестр data/cameras.json, заполняется из camera_config.CAMERAS)
+    registry = CameraRegistry(args.registry, seed=True)
+    cameras = registry.cameras(recommended_only=not args.all_cameras)
     if args.all_cameras:
-        cameras = CAMERAS
         print("⚠️  Используются ВСЕ камеры (включая поворотную)")
     else:
-        cameras = get_recommended_cameras()
         print("✅ Используются только рекомендованные камеры")
 
+    # Кластер: этот процесс снимает только свою долю камер
+    cluster = None
+    if args.cluster:
+        from collector_cluster import CollectorWorker, POLLER_LEASE
+        cluster = CollectorWorker(cameras, db_path=args.cluster_db, worker_id=args.worker_id,
+                                  extra_leases=(POLLER_LEASE,) if args.with_pm25 else ()).start()
+        print(f"🖧 Сборщик {cluster.worker_id}: {len(cluster.owned_cameras())}/{len(cameras)} камер")
+
+    # Опрос PM2.5/метео синхронно с тактами камер
+    tick_listeners = []
+    if args.with_pm25:
+        from readings_poller import ReadingsPoller
+        poller = ReadingsPoller.from_env()
+        if cluster is not None:
+            # В кластере API опрашивает один сборщик - тот, у кого аренда опроса
+            from collector_cluster import lease_gated
+            poller = lease_gated(cluster, POLLER_LEASE, poller)
+        tick_listeners.append(poller)
+        print("🌍 PM2.5/метео опрашиваются на каждом такте сбора")
+
     # Создаём объект для сбора
     collector = MultiCameraCapture(
         cameras,
         output_dir=args.output,
         daylight_start=args.daylight_start,
-        daylight_end=args.daylight_end
+        daylight_end=args.daylight_end,
+        archive_dir=args.archive,
+        tick_listeners=tick_listeners,
+        cluster=cluster,
+        registry=registry,
+        recommended_only=not args.all_cameras
     )
 
-    if args.mode == 'test':
-        print("\n🧪 РЕЖИМ ТЕСТИРОВАНИЯ\n")
-        collector.capture_all_cameras()
-    else:
-        skip_night = not args.__dict__.get('24_7', False)
-        collector.collect_continuous(
-            interval_minutes=args.interval,
-            duration_hours=args.duration,
-            skip_night=skip_night
+    # Фоновая компакция архива (см. retention.py)
+    if args.archive and args.retention_full_days is not None:
+        from retention import RetentionEngine, RetentionPolicy
+        policy = RetentionPolicy(
+            full_days=args.retention_full_days,
+            reduced_days=max(180, args.retention_full_days)
         )
+        RetentionEngine(args.archive, policy).start_background()
+
+    # SIGTERM (systemd, docker stop) завершает сбор через finally, как Ctrl+C
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+
+    try:
+        if args.mode == 'test':
+            print("\n🧪 РЕЖИМ ТЕСТИРОВАНИЯ\n")
+            collector.capture_all_cameras()
+        else:
+            skip_night = not args.__dict__.get('24_7', False)
+            collector.collect_continuous(
+                interval_minutes=args.interval,
+                duration_hours=args.duration,
+                skip_night=skip_night
+            )
+    finally:
+        # Шарды закрываются до передачи камер: следующий владелец получает целый tar
+        collector.close()
+        # Камеры сразу передаются остальным сборщикам, без ожидания истечения аренд
+        if cluster is not None:
+            cluster.stop()
 
 
 if __name__ == "__main__":
@@ -0,0 +1,271 @@
+"""
+Распределение камер между несколькими процессами-сборщиками
+collect_data.main запускал один MultiCameraCapture со всеми камерами; масштабирование -
+только ростом max_workers в одном процессе
+
+Координация через общую SQLite базу (data/cluster/cluster.sqlite):
+    - каждый сборщик (CollectorWorker) пишет heartbeat в таблицу workers
+    - камеры распределяются консистентным хэшированием по живым сборщикам:
+      при добавлении/падении сборщика переезжает только ~1/N камер
+    - право снимать камеру - аренда (lease) с истечением; фоновый поток продлевает
+      аренды своих камер и отпускает ушедшие другому сборщику
+    - камеры упавшего сборщика (heartbeat устарел) переходят к остальным,
+      как только истекут его аренды
+    - все сборщики пишут в одну директорию и общий индекс кадров (frame_index.py);
+      при передаче камеры старый владелец закрывает её шард архива (on_release)
+    - задачи "одна на кластер" (опрос API показаний) - тоже аренда по ключу
+      (POLLER_LEASE): её выполняет только сборщик, у которого аренда
+
+Несколько машин: база и директория данных на общем диске с корректными
+блокировками файлов (SQLite не рассчитан на NFS без них)
+"""
+
+import os
+import time
+import bisect
+import socket
+import sqlite3
+import hashlib
+import argparse
+import threading
+
+
+CLUSTER_DB = "data/cluster/cluster.sqlite"
+DEFAULT_LEASE_TTL = 180.0       # секунд
+DEFAULT_HEARTBEAT_INTERVAL = 30.0
+VIRTUAL_NODES = 64
+
+# Аренда опроса PM2.5/метео: опрашивает API только один сборщик кластера
+POLLER_LEASE = "__readings_poller__"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS workers (
+    worker_id TEXT PRIMARY KEY,
+    host TEXT,
+    pid INTEGER,
+    heartbeat REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS leases (
+    camera_id TEXT PRIMARY KEY,
+    worker_id TEXT NOT NULL,
+    expires REAL NOT NULL
+);
+"""
+
+
+def _hash(key):
+    return int.from_bytes(hashlib.sha1(key.encode('utf-8')).digest()[:8], 'big')
+
+
+class HashRing:
+    """Кольцо консистентного хэширования (виртуальные узлы для равномерности)"""
+
+    def __init__(self, nodes, virtual_nodes=VIRTUAL_NODES):
+        points = sorted(
+            (_hash(f"{node}#{replica}"), node)
+            for node in nodes
+            for replica in range(virtual_nodes)
+        )
+        self._hashes = [h for h, _ in points]
+        self._nodes = [node for _, node in points]
+
+    def owner(self, key):
+        if not self._nodes:
+            return None
+        index = bisect.bisect(self._hashes, _hash(key)) % len(self._hashes)
+        return self._nodes[index]
+
+
+def default_worker_id():
+    return f"{socket.gethostname()}-{os.getpid()}"
+
+
+class CollectorWorker:
+    """Участник кластера сборщиков: какие камеры снимает этот процесс"""
+
+    def __init__(self, cameras, db_path=CLUSTER_DB, worker_id=None, lease_ttl=DEFAULT_LEASE_TTL,
+                 heartbeat_interval=DEFAULT_HEARTBEAT_INTERVAL, extra_leases=(), on_release=None):
+        """
+        Args:
+            cameras: dict всех камер кластера (camera_config)
+            db_path: Общая база координации
+            worker_id: ID сборщика (None = <host>-<pid>)
+            lease_ttl: Срок аренды камеры и жизни heartbeat, секунд
+            heartbeat_interval: Период продления (должен быть заметно меньше lease_ttl)
+            extra_leases: Ключи задач "одна на кластер" (например POLLER_LEASE),
+                          распределяются по кольцу вместе с камерами
+            on_release: f(camera_ids, terminate) - камеры ушли другому сборщику.
+                        terminate=True: отдаём сами (вызов внутри транзакции, до того как
+                        аренду сможет взять другой); False: аренда уже истекла и перехвачена -
+                        в шард пишет новый владелец, трогать файл нельзя
+        """
+        self.cameras = cameras
+        self.extra_leases = tuple(extra_leases)
+        self.on_release = on_release
+        self.db_path = db_path
+        self.worker_id = worker_id or default_worker_id()
+        self.lease_ttl = lease_ttl
+        self.heartbeat_interval = heartbeat_interval
+
+        os.makedirs(os.path.dirname(db_path) or ".", exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(db_path, timeout=30, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript(SCHEMA)
+
+        self._owned = set()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def rebalance(self, now=None):
+        """
+        Heartbeat, пересчёт кольца по живым сборщикам, продление/захват/освобождение аренд
+
+        Returns:
+            dict: камеры, аренда которых сейчас у этого сборщика
+        """
+        now = time.time() if now is None else now
+        with self._lock:
+            conn = self._conn
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                conn.execute(
+                    "INSERT INTO workers (worker_id, host, pid, heartbeat) VALUES (?, ?, ?, ?) "
+                    "ON CONFLICT(worker_id) DO UPDATE SET heartbeat = excluded.heartbeat",
+                    (self.worker_id, socket.gethostname(), os.getpid(), now)
+                )
+                live = [row[0] for row in conn.execute(
+                    "SELECT worker_id FROM workers WHERE heartbeat >= ?", (now - self.lease_ttl,)
+                )]
+                ring = HashRing(live)
+                keys = list(self.cameras) + list(self.extra_leases)
+                wanted = [key for key in keys if ring.owner(key) == self.worker_id]
+
+                # Камеры, ушедшие другому сборщику, отпускаются сразу
+                held = {row[0] for row in conn.execute(
+                    "SELECT camera_id FROM leases WHERE worker_id = ?", (self.worker_id,)
+                )}
+                released = held - set(wanted)
+                # holds() перестаёт разрешать запись до закрытия шардов: кадр, снятый
+                # до передачи, не откроет шард заново (проверка под блокировкой записи архива)
+                self._owned = self._owned - released
+                if released and self.on_release is not None:
+                    # Шарды закрываются до COMMIT: новый владелец получит аренду уже после
+                    self.on_release(released & set(self.cameras), True)
+                conn.executemany("DELETE FROM leases WHERE camera_id = ? AND worker_id = ?",
+                                 [(camera_id, self.worker_id) for camera_id in released])
+
+                # Захват свободных/истёкших аренд и продление своих
+                conn.executemany(
+                    "INSERT INTO leases (camera_id, worker_id, expires) VALUES (?, ?, ?) "
+                    "ON CONFLICT(camera_id) DO UPDATE SET worker_id = excluded.worker_id, expires = excluded.expires "
+                    "WHERE leases.worker_id = excluded.worker_id OR leases.expires < ?",
+                    [(camera_id, self.worker_id, now + self.lease_ttl, now) for camera_id in wanted]
+                )
+                owned = {row[0] for row in conn.execute(
+                    "SELECT camera_id FROM leases WHERE worker_id = ? AND expires >= ?", (self.worker_id, now)
+                )}
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+
+            # Аренды, перехваченные другим сборщиком после истечения (процесс завис, сеть)
+            lost = (self._owned - owned - released) & set(self.cameras)
+            self._owned = owned & set(keys)
+
+        if lost and self.on_release is not None:
+            self.on_release(lost, False)
+        return self.owned_cameras()
+
+    def owned_cameras(self):
+        """Камеры с аренды на момент последнего rebalance (порядок как в self.cameras)"""
+        return {camera_id: info for camera_id, info in self.cameras.items() if camera_id in self._owned}
+
+    def holds(self, key):
+        """Есть ли у сборщика аренда ключа (камеры или задачи из extra_leases)"""
+        return key in self._owned
+
+    def _run(self):
+        while not self._stop.wait(self.heartbeat_interval):
+            try:
+                self.rebalance()
+            except sqlite3.Error as e:
+                print(f"⚠️  Кластер: не удалось продлить аренды ({e})")
+
+    def start(self):
+        """Первый rebalance и фоновое продление аренд"""
+        self.rebalance()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        """Остановка с передачей камер: аренды и запись сборщика удаляются сразу, без ожидания TTL"""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+        with self._lock:
+            self._conn.execute("DELETE FROM leases WHERE worker_id = ?", (self.worker_id,))
+            self._conn.execute("DELETE FROM workers WHERE worker_id = ?", (self.worker_id,))
+            self._owned = set()
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+def lease_gated(worker, key, func):
+    """Обёртка: func вызывается, только пока у сборщика аренда key (иначе None)"""
+    def gated(*args, **kwargs):
+        if worker.holds(key):
+            return func(*args, **kwargs)
+        return None
+    return gated
+
+
+def cluster_status(db_path=CLUSTER_DB, lease_ttl=DEFAULT_LEASE_TTL):
+    """
+    Returns:
+        dict: worker_id -> {host, pid, age_s, alive, cameras: [...]}
+    """
+    now = time.time()
+    conn = sqlite3.connect(db_path, timeout=30)
+    try:
+        conn.executescript(SCHEMA)
+        status = {
+            worker_id: {"host": host, "pid": pid, "age_s": now - heartbeat,
+                        "alive": heartbeat >= now - lease_ttl, "cameras": []}
+            for worker_id, host, pid, heartbeat in conn.execute("SELECT worker_id, host, pid, heartbeat FROM workers")
+        }
+        for camera_id, worker_id, expires in conn.execute(
+                "SELECT camera_id, worker_id, expires FROM leases ORDER BY camera_id"):
+            if expires >= now:
+                status.setdefault(worker_id, {"host": None, "pid": None, "age_s": None,
+                                              "alive": False, "cameras": []})["cameras"].append(camera_id)
+        return status
+    finally:
+        conn.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Состояние кластера сборщиков кадров')
+    parser.add_argument('--db', type=str, default=CLUSTER_DB)
+    parser.add_argument('--lease-ttl', type=float, default=DEFAULT_LEASE_TTL)
+    args = parser.parse_args()
+
+    status = cluster_status(args.db, args.lease_ttl)
+    if not status:
+        print("📭 Нет зарегистрированных сборщиков")
+        return
+
+    print(f"🖧 Сборщиков: {sum(1 for w in status.values() if w['alive'])} живых из {len(status)}")
+    for worker_id, info in sorted(status.items()):
+        state = "✅" if info["alive"] else "💀"
+        age = f"{info['age_s']:.0f} с назад" if info["age_s"] is not None else "нет heartbeat"
+        print(f"\n{state} {worker_id} (heartbeat {age})")
+        print(f"   Камер: {len(info['cameras'])}: {', '.join(info['cameras'])}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,512 @@
+"""
+Пространственная однородность PM2.5: корреляции между датчиками Бишкека
+docs/PHYSICS_VISIBILITY_PM25.md ("Эмпирическая валидация", п. 1) требует проверить,
+насколько PM2.5 однороден по городу; пороги 2 км / 5 км в find_sensors и
+check_feasibility были заданы без измерений
+
+По часовым rollup'ам хранилища рядов (timeseries_store.py); датчик - локация каталога,
+ряды живого опроса и backfill одной локации объединяются:
+    - накопленная корреляция всех пар датчиков (суммы по парам)
+    - скользящая корреляция: окно window_hours с шагом step_hours, все окна
+      одним einsum по представлению sliding_window_view (без копий)
+    - корреляция со сдвигом (lag) - запаздывание шлейфа между датчиками
+    - зависимость корреляции от расстояния: r(d) = r0 · exp(-d / L) и расстояния,
+      на которых корреляция падает ниже порогов (для check_feasibility)
+
+Состояние (data/analysis/correlation.npz) обновляется инкрементально: по журналу
+изменений хранилища (TimeSeriesStore.changes) перечитываются только часы, куда
+записаны показания, - в том числе прошлые часы от backfill. Часовая матрица в состоянии
+позволяет заменить вклад этих часов в суммы по парам и пересчитать задетые окна
+"""
+
+import os
+import argparse
+
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+from timeseries_store import TimeSeriesStore, RESOLUTIONS, merge_ranges
+
+
+STATE_PATH = "data/analysis/correlation.npz"
+STATE_VERSION = 2
+SENSOR_SOURCES = ("openaq",)
+
+WINDOW_HOURS = 168   # Неделя
+STEP_HOURS = 24
+MIN_PERIODS = 24
+MAX_LAG_HOURS = 6
+
+# Пороги корреляции для расстояний "отличная пара" / "приемлемо" в check_feasibility
+STRONG_CORRELATION = 0.9
+ACCEPTABLE_CORRELATION = 0.75
+DECAY_BIN_KM = 1.0
+MIN_DECAY_PAIRS = 3
+
+_STAT_NAMES = ("n", "sx", "sy", "sxx", "syy", "sxy")
+
+
+def masked_pair_stats(values):
+    """
+    Суммы по парам датчиков с учётом пропусков: для пары (i, j) только часы, где есть оба
+
+    Args:
+        values: (..., время, датчики), NaN - нет показания
+
+    Returns:
+        np.ndarray: (6, ..., датчики, датчики) - n, Σx_i, Σx_j, Σx_i², Σx_j², Σx_i·x_j
+    """
+    present = ~np.isnan(values)
+    mask = present.astype(np.float64)
+    x = np.where(present, values, 0.0)
+
+    n = np.einsum('...ti,...tj->...ij', mask, mask)
+    sx = np.einsum('...ti,...tj->...ij', x, mask)
+    sxx = np.einsum('...ti,...tj->...ij', x * x, mask)
+    sxy = np.einsum('...ti,...tj->...ij', x, x)
+    return np.stack([n, sx, np.swapaxes(sx, -1, -2), sxx, np.swapaxes(sxx, -1, -2), sxy])
+
+
+def pair_correlation(stats, min_periods=MIN_PERIODS):
+    """
+    Корреляция Пирсона из сумм masked_pair_stats
+
+    Returns:
+        np.ndarray: (..., датчики, датчики), NaN где общих часов меньше min_periods
+    """
+    n, sx, sy, sxx, syy, sxy = stats
+    with np.errstate(invalid='ignore', divide='ignore'):
+        cov = sxy - sx * sy / n
+        var_x = sxx - sx * sx / n
+        var_y = syy - sy * sy / n
+        corr = cov / np.sqrt(var_x * var_y)
+    return np.where((n >= min_periods) & (var_x > 0) & (var_y > 0), np.clip(corr, -1.0, 1.0), np.nan)
+
+
+def lagged_correlation(values, max_lag=MAX_LAG_HOURS, min_periods=MIN_PERIODS):
+    """
+    Корреляция со сдвигом: [l, i, j] = corr(x_i(t), x_j(t + lag_l))
+
+    Args:
+        values: (время, датчики) на равномерной часовой сетке
+
+    Returns:
+        tuple: (lags (L,), np.ndarray (L, датчики, датчики))
+    """
+    lags = np.arange(-max_lag, max_lag + 1)
+    n_hours, n_sensors = values.shape
+    result = np.full((len(lags), n_sensors, n_sensors), np.nan)
+
+    for index, lag in enumerate(lags):
+        if abs(lag) >= n_hours:
+            continue
+        lead = values[:n_hours - lag] if lag >= 0 else values[-lag:]
+        follow = values[lag:] if lag >= 0 else values[:n_hours + lag]
+        both = ~np.isnan(lead)[:, :, None] & ~np.isnan(follow)[:, None, :]
+        # Суммы по парам с разными рядами слева и справа
+        mask = both.astype(np.float64)
+        x = np.where(np.isnan(lead), 0.0, lead)
+        y = np.where(np.isnan(follow), 0.0, follow)
+        n = mask.sum(axis=0)
+        sx = np.einsum('ti,tij->ij', x, mask)
+        sy = np.einsum('tj,tij->ij', y, mask)
+        sxx = np.einsum('ti,tij->ij', x * x, mask)
+        syy = np.einsum('tj,tij->ij', y * y, mask)
+        sxy = np.einsum('ti,tj->ij', x, y)
+        result[index] = pair_correlation(np.stack([n, sx, sy, sxx, syy, sxy]), min_periods)
+
+    return lags, result
+
+
+def distance_decay(corr, distances, bin_km=DECAY_BIN_KM):
+    """
+    Зависимость корреляции от расстояния между датчиками
+
+    Args:
+        corr: (датчики, датчики) корреляции
+        distances: (датчики, датчики) расстояния, км (NaN - координаты неизвестны)
+
+    Returns:
+        dict: bins_km, mean_corr, pairs (по корзинам), r0, length_km (None если подгонка невозможна),
+              max_distance_km, n_pairs
+    """
+    upper = np.triu_indices_from(corr, k=1)
+    r = corr[upper]
+    d = distances[upper]
+    valid = ~np.isnan(r) & ~np.isnan(d)
+    r, d = r[valid], d[valid]
+
+    result = {"bins_km": [], "mean_corr": [], "pairs": [], "r0": None, "length_km": None,
+              "max_distance_km": float(d.max()) if len(d) else None, "n_pairs": int(len(r))}
+    if not len(r):
+        return result
+
+    bins = np.floor(d / bin_km).astype(np.int64)
+    for b in np.unique(bins):
+        in_bin = bins == b
+        result["bins_km"].append(float(b * bin_km))
+        result["mean_corr"].append(float(r[in_bin].mean()))
+        result["pairs"].append(int(in_bin.sum()))
+
+    positive = r > 0
+    if positive.sum() >= MIN_DECAY_PAIRS and np.ptp(d[positive]) > 0:
+        slope, intercept = np.polyfit(d[positive], np.log(r[positive]), 1)
+        result["r0"] = float(min(np.exp(intercept), 1.0))
+        # Корреляция не убывает на измеренных расстояниях - длина затухания не определена (∞)
+        result["length_km"] = float(-1.0 / slope) if slope < 0 else float('inf')
+    return result
+
+
+def decay_cutoff_km(decay, threshold):
+    """
+    Расстояние, на котором подогнанная корреляция падает до threshold
+    (не дальше самой дальней измеренной пары - без экстраполяции)
+    """
+    if decay["length_km"] is None:
+        return None
+    if decay["r0"] <= threshold:
+        return 0.0
+    distance = decay["length_km"] * np.log(decay["r0"] / threshold)
+    return float(min(distance, decay["max_distance_km"]))
+
+
+class CorrelationEngine:
+    """Инкрементальный расчёт корреляций между датчиками по хранилищу рядов"""
+
+    def __init__(self, store=None, state_path=STATE_PATH, sources=SENSOR_SOURCES, window_hours=WINDOW_HOURS,
+                 step_hours=STEP_HOURS, min_periods=MIN_PERIODS, sensors=None):
+        """
+        Args:
+            store: TimeSeriesStore (None = хранилище по умолчанию)
+            state_path: Файл состояния (None = без сохранения)
+            sources: Источники, ряды которых считаются датчиками
+            window_hours, step_hours: Окно и шаг скользящей корреляции
+            min_periods: Минимум общих часов для корреляции пары
+            sensors: Каталог датчиков (None = sensor_catalog.load_sensors при первом обращении)
+        """
+        self.store = store if store is not None else TimeSeriesStore()
+        self.state_path = state_path
+        self.sources = tuple(s.lower() for s in sources)
+        self.window_hours = window_hours
+        self.step_hours = step_hours
+        self.min_periods = min_periods
+        self._sensors = sensors
+        self.state = self._load_state()
+
+    def _load_state(self):
+        if self.state_path and os.path.exists(self.state_path):
+            with np.load(self.state_path, allow_pickle=False) as data:
+                state = {name: data[name] for name in data.files}
+            if int(state.get("version", 0)) == STATE_VERSION:
+                return state
+            print(f"⚠️  {self.state_path}: состояние старого формата, корреляции пересчитываются с нуля")
+        return {
+            "version": np.array(STATE_VERSION, dtype=np.int64),
+            "names": np.array([], dtype=str),
+            "first_bucket": np.array(-1, dtype=np.int64),
+            "values": np.empty((0, 0)),
+            "revision_ids": np.array([], dtype=str),
+            "revision_values": np.array([], dtype=np.int64),
+            "pair_stats": np.zeros((len(_STAT_NAMES), 0, 0)),
+            "window_end": np.array([], dtype=np.int64),
+            "rolling": np.zeros((0, 0, 0)),
+        }
+
+    def save(self):
+        if not self.state_path:
+            return
+        os.makedirs(os.path.dirname(self.state_path) or ".", exist_ok=True)
+        tmp_path = self.state_path + ".tmp.npz"
+        np.savez(tmp_path, **self.state)
+        os.replace(tmp_path, self.state_path)
+
+    @property
+    def names(self):
+        return self.state["names"].tolist()
+
+    @property
+    def sensors(self):
+        if self._sensors is None:
+            from sensor_catalog import load_sensors
+            self._sensors = load_sensors(refresh=False)
+        return self._sensors
+
+    @property
+    def last_bucket(self):
+        """Последний час в состоянии (-1 = пусто)"""
+        first = int(self.state["first_bucket"])
+        if first < 0:
+            return -1
+        return first + (len(self.state["values"]) - 1) * RESOLUTIONS["hour"]
+
+    def station_series(self):
+        """
+        Ряды хранилища по станциям: живой опрос и backfill одной локации каталога -
+        один датчик (sensor_catalog.series_locations); ряды вне каталога - отдельные датчики
+
+        Returns:
+            dict: имя датчика -> список location его рядов
+        """
+        from sensor_catalog import series_owners
+
+        owners = series_owners(self.sensors)
+        stations = {}
+        for series in self.store.series():
+            if series["source"] not in self.sources:
+                continue
+            owner = owners.get(series["location"])
+            name = series["location"] if owner is None else str(self.sensors[owner].get("name") or series["location"])
+            stations.setdefault(name, []).append(series["location"])
+        return stations
+
+    def align(self, start=None, end=None):
+        """
+        Часовая матрица PM2.5 датчиков на равномерной сетке (пропуски - NaN)
+
+        Returns:
+            tuple: (buckets (n,) int64 секунды, имена датчиков, values (n, датчики))
+        """
+        step = RESOLUTIONS["hour"]
+        columns = {}
+        for name, locations in self.station_series().items():
+            agg = self.store.aggregate(self.sources, locations, start=start, end=end,
+                                       resolution="hour", metrics=["pm25"])
+            has_pm25 = agg["pm25_count"] > 0
+            if has_pm25.any():
+                columns[name] = (agg["bucket"][has_pm25].astype(np.int64), agg["pm25_mean"][has_pm25])
+
+        if not columns:
+            return np.empty(0, dtype=np.int64), [], np.empty((0, 0))
+
+        first = min(c[0][0] for c in columns.values())
+        last = max(c[0][-1] for c in columns.values())
+        buckets = np.arange(first, last + step, step, dtype=np.int64)
+        names = sorted(columns)
+        values = np.full((len(buckets), len(names)), np.nan)
+        for j, name in enumerate(names):
+            sensor_buckets, means = columns[name]
+            values[(sensor_buckets - first) // step, j] = means
+        return buckets, names, values
+
+    def _columns(self, names):
+        """Индексы датчиков в состоянии; новые датчики добавляются (матрицы расширяются)"""
+        known = self.names
+        added = [name for name in names if name not in known]
+        if added:
+            old, new = len(known), len(known) + len(added)
+            stats = np.zeros((len(_STAT_NAMES), new, new))
+            stats[:, :old, :old] = self.state["pair_stats"]
+            rolling = np.full((len(self.state["window_end"]), new, new), np.nan)
+            rolling[:, :old, :old] = self.state["rolling"]
+            values = np.full((len(self.state["values"]), new), np.nan)
+            values[:, :old] = self.state["values"]
+            self.state.update(names=np.array(known + added, dtype=str), pair_stats=stats, rolling=rolling,
+                              values=values)
+            known = known + added
+        return np.array([known.index(name) for name in names], dtype=np.int64)
+
+    def _rows(self, buckets):
+        """Строки часовой матрицы состояния для buckets; матрица расширяется в обе стороны"""
+        step = RESOLUTIONS["hour"]
+        values = self.state["values"]
+        first, last = int(buckets[0]), int(buckets[-1])
+        if int(self.state["first_bucket"]) >= 0:
+            first = min(first, int(self.state["first_bucket"]))
+            last = max(last, self.last_bucket)
+
+        n_hours = (last - first) // step + 1
+        if n_hours != len(values):
+            grown = np.full((n_hours, values.shape[1]), np.nan)
+            if len(values):
+                offset = (int(self.state["first_bucket"]) - first) // step
+                grown[offset:offset + len(values)] = values
+            self.state.update(values=grown, first_bucket=np.array(first, dtype=np.int64))
+        return (buckets - first) // step
+
+    def _window_ends(self, intervals):
+        """Концы окон [end - окно, end), кратные шагу, задевающие изменённые часы"""
+        step = RESOLUTIONS["hour"]
+        window_s = self.window_hours * step
+        stride_s = self.step_hours * step
+        first, last = int(self.state["first_bucket"]), self.last_bucket
+
+        ends = []
+        for low, high in intervals:
+            lo = max(low + step, first + window_s)
+            hi = min(high + window_s, last + step)
+            lo = -(-lo // stride_s) * stride_s
+            if lo <= hi:
+                ends.append(np.arange(lo, hi + 1, stride_s, dtype=np.int64))
+        return np.unique(np.concatenate(ends)) if ends else np.empty(0, dtype=np.int64)
+
+    def update(self):
+        """
+        Пересчитывает часы, в которые с прошлого запуска записаны показания
+        (новые, запоздавшие и загруженные backfill'ом в прошлое), и окна, которые их задевают
+
+        Накопленные суммы по парам поправляются разностью: вклад прежних значений
+        этих часов (из часовой матрицы состояния) вычитается, вклад новых - добавляется
+
+        Returns:
+            dict: new_hours, new_windows, sensors
+        """
+        step = RESOLUTIONS["hour"]
+        since = dict(zip(self.state["revision_ids"].tolist(), self.state["revision_values"].tolist()))
+        revisions, changed = self.store.changes(since, source=self.sources)
+        intervals = merge_ranges([(lo - lo % step, hi - hi % step) for lo, hi in changed], gap=step)
+
+        summary = {"new_hours": 0, "new_windows": 0, "sensors": len(self.names)}
+        dirty = []
+        for low, high in intervals:
+            buckets, names, values = self.align(low, high + step - 1)
+            if not len(buckets):
+                continue
+            cols = self._columns(names)
+            rows = self._rows(buckets)
+
+            block = np.full((len(buckets), len(self.names)), np.nan)
+            block[:, cols] = values
+            self.state["pair_stats"] += masked_pair_stats(block) - masked_pair_stats(self.state["values"][rows])
+            self.state["values"][rows] = block
+
+            summary["new_hours"] += int(np.count_nonzero(~np.isnan(values).all(axis=1)))
+            dirty.append((int(buckets[0]), int(buckets[-1])))
+        summary["sensors"] = len(self.names)
+
+        # Скользящие окна, задевающие изменённые часы, - заново по часовой матрице
+        ends = self._window_ends(dirty)
+        if len(ends):
+            window_s = self.window_hours * step
+            windows = sliding_window_view(self.state["values"], self.window_hours, axis=0)  # (окна, датчики, часы)
+            starts = (ends - window_s - int(self.state["first_bucket"])) // step
+            corr = pair_correlation(masked_pair_stats(np.swapaxes(windows[starts], 1, 2)), self.min_periods)
+
+            old_ends = self.state["window_end"]
+            all_ends = np.union1d(old_ends, ends)
+            n_sensors = len(self.names)
+            rolling = np.full((len(all_ends), n_sensors, n_sensors), np.nan)
+            rolling[np.searchsorted(all_ends, old_ends)] = self.state["rolling"]
+            rolling[np.searchsorted(all_ends, ends)] = corr
+            self.state.update(window_end=all_ends, rolling=rolling)
+            summary["new_windows"] = len(ends)
+
+        self.state["revision_ids"] = np.array(list(revisions), dtype=str)
+        self.state["revision_values"] = np.array(list(revisions.values()), dtype=np.int64)
+        self.save()
+        return summary
+
+    def correlation(self):
+        """Накопленная корреляция всех пар (датчики × датчики)"""
+        return pair_correlation(self.state["pair_stats"], self.min_periods)
+
+    def rolling(self):
+        """
+        Returns:
+            tuple: (концы окон datetime64[s], np.ndarray (окна, датчики, датчики))
+        """
+        return self.state["window_end"].astype('datetime64[s]'), self.state["rolling"]
+
+    def lagged(self, days=30, max_lag=MAX_LAG_HOURS):
+        """Корреляция со сдвигом за последние days суток (по хранилищу, не по состоянию)"""
+        last = self.last_bucket
+        start = None if last < 0 else last - days * RESOLUTIONS["day"]
+        buckets, names, values = self.align(start)
+        lags, corr = lagged_correlation(values, max_lag, self.min_periods)
+        return names, lags, corr
+
+    def homogeneity(self, sensors=None, bin_km=DECAY_BIN_KM):
+        """
+        Зависимость корреляции от расстояния по накопленной корреляции
+
+        Args:
+            sensors: Датчики с координатами (None = каталог движка)
+
+        Returns:
+            dict: см. distance_decay, плюс strong_km / acceptable_km - расстояния порогов корреляции
+        """
+        sensors = sensors if sensors is not None else self.sensors
+        from find_sensors import haversine_matrix
+
+        # Датчики состояния названы по имени локации каталога (station_series)
+        coords = {str(s["name"]): (s["latitude"], s["longitude"]) for s in sensors}
+        points = np.array([coords.get(name, (np.nan, np.nan)) for name in self.names], dtype=np.float64).reshape(-1, 2)
+        distances = haversine_matrix(points[:, 0], points[:, 1], points[:, 0], points[:, 1])
+
+        decay = distance_decay(self.correlation(), distances, bin_km)
+        decay["strong_km"] = decay_cutoff_km(decay, STRONG_CORRELATION)
+        decay["acceptable_km"] = decay_cutoff_km(decay, ACCEPTABLE_CORRELATION)
+        return decay
+
+
+def homogeneity_cutoffs(state_path=STATE_PATH, sensors=None):
+    """
+    Измеренные пороги расстояния камера-датчик для check_feasibility
+
+    Returns:
+        tuple: (strong_km, acceptable_km) или None, если данных для подгонки мало
+    """
+    if not os.path.exists(state_path):
+        return None
+    engine = CorrelationEngine(state_path=state_path)
+    decay = engine.homogeneity(sensors)
+    if decay["strong_km"] is None or decay["acceptable_km"] is None:
+        return None
+    return decay["strong_km"], decay["acceptable_km"]
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Корреляции PM2.5 между датчиками (однородность по городу)')
+    parser.add_argument('--state', type=str, default=STATE_PATH)
+    parser.add_argument('--reset', action='store_true', help='Пересчитать с нуля')
+    parser.add_argument('--lag-days', type=int, default=30, help='Период для корреляции со сдвигом')
+    parser.add_argument('--max-lag', type=int, default=MAX_LAG_HOURS, help='Максимальный сдвиг, часов')
+    args = parser.parse_args()
+
+    if args.reset and os.path.exists(args.state):
+        os.remove(args.state)
+
+    engine = CorrelationEngine(state_path=args.state)
+    summary = engine.update()
+    print(f"🔄 Обновлено: {summary['new_hours']} новых часов, {summary['new_windows']} новых окон, "
+          f"{summary['sensors']} датчиков")
+
+    names = engine.names
+    corr = engine.correlation()
+    print("\n📈 Накопленная корреляция пар:")
+    for i, j in zip(*np.triu_indices(len(names), k=1)):
+        if not np.isnan(corr[i, j]):
+            print(f"  {names[i]} ↔ {names[j]}: {corr[i, j]:.2f}")
+
+    window_end, rolling = engine.rolling()
+    if len(window_end):
+        upper = np.triu_indices(len(names), k=1)
+        latest = rolling[-1][upper]
+        latest = latest[~np.isnan(latest)]
+        if len(latest):
+            print(f"\n🪟 Последнее окно ({window_end[-1]}): медиана корреляции {np.median(latest):.2f}, "
+                  f"минимум {latest.min():.2f}")
+
+    lag_names, lags, lagged = engine.lagged(args.lag_days, args.max_lag)
+    if len(lag_names) > 1:
+        print(f"\n⏱️  Сдвиг максимальной корреляции (за {args.lag_days} дней):")
+        for i, j in zip(*np.triu_indices(len(lag_names), k=1)):
+            pair = lagged[:, i, j]
+            if np.isnan(pair).all():
+                continue
+            best = int(np.nanargmax(pair))
+            print(f"  {lag_names[i]} → {lag_names[j]}: {lags[best]:+d} ч (r={pair[best]:.2f})")
+
+    decay = engine.homogeneity()
+    print(f"\n📏 Корреляция vs расстояние ({decay['n_pairs']} пар):")
+    for bin_km, mean_corr, pairs in zip(decay["bins_km"], decay["mean_corr"], decay["pairs"]):
+        print(f"  {bin_km:>4.0f}-{bin_km + DECAY_BIN_KM:<4.0f} км: r={mean_corr:.2f} ({pairs} пар)")
+    if decay["length_km"] is not None:
+        print(f"  r(d) = {decay['r0']:.2f} · exp(-d / {decay['length_km']:.1f} км)")
+        print(f"  r ≥ {STRONG_CORRELATION}: до {decay['strong_km']:.1f} км, "
+              f"r ≥ {ACCEPTABLE_CORRELATION}: до {decay['acceptable_km']:.1f} км")
+    else:
+        print("  ⚠️  Мало пар для подгонки затухания")
+
+
+if __name__ == "__main__":
+    main()
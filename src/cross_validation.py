@@ -0,0 +1,252 @@
+"""
+Кросс-валидация baseline с учётом времени и камер
+train_and_evaluate_baseline делил выборку случайным train_test_split: соседние часы
+одного эпизода смога попадали и в train, и в test (утечка через автокорреляцию),
+а оценка качества была одна и шумная
+
+Схемы:
+    blocked - rolling origin: образцы по времени делятся на n_splits+1 блоков,
+              фолд k обучается на блоках 0..k и проверяется на блоке k+1;
+              образцы за gap_hours до начала test блока в train не берутся
+    camera  - leave-one-camera-out: обучение на остальных камерах, проверка на одной
+
+Фолды считаются параллельно (ProcessPoolExecutor): X и y передаются в процесс один раз
+(initializer) вместе с разметкой фолдов, в задачу - только номер фолда
+Разметка фолдов кэшируется в data/analysis/cv_folds/<ключ>.npz, ключ - хэш меток времени
+(или камер) и параметров схемы: повторный запуск на том же датасете не пересчитывает разбиение
+"""
+
+import os
+import hashlib
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+
+CV_CACHE_DIR = "data/analysis/cv_folds"
+SCHEMES = ("blocked", "camera")
+METRICS = ("mae", "rmse", "r2")
+
+# Меньше - фолды считаются в текущем процессе: запуск пула и передача X
+# дороже самого обучения Ridge
+PARALLEL_MIN_SAMPLES = 50000
+
+
+def to_datetime64(timestamps):
+    """Метки времени (ISO строки / datetime / datetime64) -> datetime64[s] по часам метки"""
+    values = np.asarray(timestamps)
+    if values.dtype.kind == 'M':
+        return values.astype('datetime64[s]')
+    return np.array([
+        (v if isinstance(v, str) else v.isoformat())[:19] for v in values
+    ], dtype='datetime64[s]')
+
+
+def blocked_assignment(timestamps, n_splits=5, gap_hours=24):
+    """
+    Rolling origin: фолд f проверяется на блоке f+1 по времени и обучается на всём,
+    что раньше начала этого блока минус gap_hours
+
+    Returns:
+        tuple: test_fold (N,) - фолд, где образец в test (-1 = нигде),
+               train_from (N,) - первый фолд, где образец в train (далее - во всех)
+    """
+    times = to_datetime64(timestamps)
+    order = np.argsort(times, kind='stable')
+    bounds = np.linspace(0, len(order), n_splits + 2).astype(int)
+
+    test_fold = np.full(len(order), -1, dtype=np.int16)
+    for f in range(n_splits):
+        test_fold[order[bounds[f + 1]:bounds[f + 2]]] = f
+
+    starts = times[order[np.minimum(bounds[1:-1], len(order) - 1)]]
+    cutoffs = starts - np.timedelta64(int(gap_hours * 3600), 's')
+    train_from = np.searchsorted(cutoffs, times, side='right').astype(np.int16)
+    return test_fold, train_from
+
+
+def camera_assignment(camera_ids):
+    """
+    Leave-one-camera-out: фолд f проверяется на камере cameras[f], обучается на остальных
+
+    Returns:
+        tuple: test_fold (N,), train_from (N,) - как у blocked_assignment; cameras
+    """
+    cameras, codes = np.unique(np.asarray(camera_ids), return_inverse=True)
+    return codes.astype(np.int16), np.zeros(len(codes), dtype=np.int16), cameras
+
+
+def fold_masks(test_fold, train_from, fold):
+    """
+    Returns:
+        tuple: train_idx, test_idx фолда
+    """
+    return np.flatnonzero((train_from <= fold) & (test_fold != fold)), np.flatnonzero(test_fold == fold)
+
+
+def _assignment_key(scheme, values, n_splits, gap_hours):
+    h = hashlib.sha1(f"{scheme}:{n_splits}:{gap_hours}".encode('utf-8'))
+    if scheme == "blocked":
+        h.update(to_datetime64(values).view(np.int64).tobytes())
+    else:
+        h.update(np.ascontiguousarray(np.asarray(values, dtype=str)).tobytes())
+    return h.hexdigest()[:16]
+
+
+_assignment_cache = {}
+
+
+def fold_assignment(scheme, timestamps=None, camera_ids=None, n_splits=5, gap_hours=24,
+                    cache_dir=CV_CACHE_DIR):
+    """
+    Разметка фолдов схемы (из кэша в памяти / на диске или пересчёт)
+
+    На диске хранится не список индексов, а два int16 массива на образец:
+    индексы фолда восстанавливаются fold_masks за один проход
+
+    Returns:
+        dict: test_fold, train_from, n_folds, labels (названия фолдов)
+    """
+    if scheme not in SCHEMES:
+        raise ValueError(f"Неизвестная схема кросс-валидации: {scheme} (есть: {', '.join(SCHEMES)})")
+    values = timestamps if scheme == "blocked" else camera_ids
+    if values is None:
+        raise ValueError("Схема blocked требует метки времени образцов" if scheme == "blocked"
+                         else "Схема camera требует camera_id образцов")
+
+    key = _assignment_key(scheme, values, n_splits, gap_hours)
+    if key in _assignment_cache:
+        return _assignment_cache[key]
+
+    path = os.path.join(cache_dir, f"{key}.npz") if cache_dir else None
+    if path and os.path.exists(path):
+        with np.load(path) as data:
+            assignment = {name: data[name] for name in ("test_fold", "train_from", "labels")}
+    else:
+        if scheme == "blocked":
+            test_fold, train_from = blocked_assignment(timestamps, n_splits, gap_hours)
+            labels = np.array([f"фолд {f + 1}" for f in range(n_splits)])
+        else:
+            test_fold, train_from, labels = camera_assignment(camera_ids)
+            if len(labels) < 2:
+                test_fold = np.full(len(test_fold), -1, dtype=np.int16)
+        assignment = {"test_fold": test_fold, "train_from": train_from, "labels": labels.astype(str)}
+
+        if path:
+            os.makedirs(cache_dir, exist_ok=True)
+            tmp_path = path + ".tmp.npz"
+            np.savez(tmp_path, **assignment)
+            os.replace(tmp_path, path)
+
+    assignment["n_folds"] = len(assignment["labels"])
+    _assignment_cache[key] = assignment
+    return assignment
+
+
+_worker_data = {}
+
+
+def _init_worker(X, y, test_fold, train_from):
+    _worker_data.update(X=X, y=y, test_fold=test_fold, train_from=train_from)
+
+
+def _evaluate_fold(fold):
+    from baseline_model import BaselineWeatherModel
+
+    train_idx, test_idx = fold_masks(_worker_data["test_fold"], _worker_data["train_from"], fold)
+    X, y = _worker_data["X"], _worker_data["y"]
+
+    model = BaselineWeatherModel()
+    model.train(X[train_idx], y[train_idx])
+    metrics = model.evaluate(X[test_idx], y[test_idx])
+    return {
+        "n_train": int(len(train_idx)),
+        "n_test": int(len(test_idx)),
+        **{name: float(metrics[name]) for name in METRICS}
+    }
+
+
+def summarize(folds):
+    """
+    Распределение метрик по фолдам
+
+    Returns:
+        dict: metric -> {mean, std, min, median, max}
+    """
+    summary = {}
+    for name in METRICS:
+        values = np.array([fold[name] for fold in folds], dtype=np.float64)
+        summary[name] = {
+            "mean": float(values.mean()),
+            "std": float(values.std(ddof=1)) if len(values) > 1 else 0.0,
+            "min": float(values.min()),
+            "median": float(np.median(values)),
+            "max": float(values.max())
+        }
+    return summary
+
+
+def cross_validate(X, y, timestamps=None, camera_ids=None, scheme="blocked", n_splits=5,
+                   gap_hours=24, n_jobs=None, cache_dir=CV_CACHE_DIR):
+    """
+    Кросс-валидация BaselineWeatherModel
+
+    Args:
+        X, y: Признаки и PM2.5
+        timestamps: Метки времени образцов (для blocked)
+        camera_ids: Камеры образцов (для camera)
+        scheme: 'blocked' или 'camera'
+        n_splits: Число test блоков (blocked)
+        gap_hours: Зазор между train и test (blocked)
+        n_jobs: Процессов (None = все ядра, 1 = без пула)
+
+    Returns:
+        dict: scheme, folds (метрики каждого фолда), summary (распределение метрик)
+              или None если фолдов нет
+    """
+    assignment = fold_assignment(scheme, timestamps, camera_ids, n_splits, gap_hours, cache_dir)
+    test_fold, train_from = assignment["test_fold"], assignment["train_from"]
+
+    # Фолды без train (начало ряда) или без test не считаются
+    test_counts = np.bincount(test_fold[test_fold >= 0], minlength=assignment["n_folds"])
+    train_counts = np.cumsum(np.bincount(train_from, minlength=assignment["n_folds"] + 1))[:-1]
+    if scheme == "camera":
+        train_counts = len(test_fold) - test_counts
+    folds = [f for f in range(assignment["n_folds"]) if test_counts[f] and train_counts[f]]
+    if not folds:
+        return None
+
+    args = (X, y, test_fold, train_from)
+    n_jobs = min(n_jobs or os.cpu_count() or 1, len(folds))
+    if n_jobs == 1 or len(y) < PARALLEL_MIN_SAMPLES:
+        _init_worker(*args)
+        results = [_evaluate_fold(f) for f in folds]
+    else:
+        # sklearn загружается до создания пула: дочерние процессы получают его готовым
+        import sklearn.linear_model  # noqa: F401
+        with ProcessPoolExecutor(max_workers=n_jobs, initializer=_init_worker, initargs=args) as pool:
+            results = list(pool.map(_evaluate_fold, folds))
+
+    for result, f in zip(results, folds):
+        result["fold"] = str(assignment["labels"][f])
+
+    return {
+        "scheme": scheme,
+        "folds": results,
+        "summary": summarize(results)
+    }
+
+
+def print_report(result):
+    """Метрики по фолдам и их распределение"""
+    titles = {"blocked": "rolling origin по времени", "camera": "leave-one-camera-out"}
+    print(f"\n🔁 Кросс-валидация: {titles[result['scheme']]}, фолдов: {len(result['folds'])}")
+
+    for fold in result["folds"]:
+        print(f"   {fold['fold']}: train {fold['n_train']}, test {fold['n_test']} | "
+              f"MAE {fold['mae']:.2f}, RMSE {fold['rmse']:.2f}, R² {fold['r2']:.3f}")
+
+    print("\n📈 Распределение метрик (mean ± std [min / median / max]):")
+    for name, title in (("mae", "MAE "), ("rmse", "RMSE"), ("r2", "R²  ")):
+        s = result["summary"][name]
+        print(f"   {title}: {s['mean']:.3f} ± {s['std']:.3f} [{s['min']:.3f} / {s['median']:.3f} / {s['max']:.3f}]")
@@ -0,0 +1,299 @@
+"""
+Потоковое чтение датасета (метаданные образцов → NumPy блоки)
+Все образцы в памяти не держатся:
+образцы читаются по одному и отдаются готовыми блоками X/y фиксированного размера
+
+Фильтры по камере, дате и сезону применяются ДО чтения файла
+(по имени файла <camera_id>_<YYYYmmdd_HHMMSS>.json), поэтому
+отфильтрованная выборка не трогает лишние файлы
+
+Образцу без PM2.5/метео подставляются показания такта сбора (readings_poller.py,
+data/pm25/ticks/<tick_id>.json): кадр и показания связаны ID такта
+"""
+
+import os
+import json
+from datetime import datetime
+
+import numpy as np
+
+from image_archive import TIMESTAMP_FORMAT
+
+
+SEASONS = {
+    "winter": (12, 1, 2),
+    "spring": (3, 4, 5),
+    "summer": (6, 7, 8),
+    "autumn": (9, 10, 11)
+}
+
+
+def parse_sample_filename(filename):
+    """
+    Разбирает имя файла метаданных <camera_id>_<YYYYmmdd>_<HHMMSS>.json
+
+    Returns:
+        tuple: (camera_id, datetime) или None если имя в другом формате
+    """
+    stem, ext = os.path.splitext(filename)
+    if ext != '.json':
+        return None
+
+    parts = stem.rsplit('_', 2)
+    if len(parts) != 3:
+        return None
+
+    try:
+        dt = datetime.strptime(f"{parts[1]}_{parts[2]}", TIMESTAMP_FORMAT)
+    except ValueError:
+        return None
+
+    return parts[0], dt
+
+
+def _to_datetime(value):
+    if value is None or isinstance(value, datetime):
+        return value
+    dt = datetime.fromisoformat(str(value).replace('Z', '+00:00'))
+    return dt.replace(tzinfo=None)
+
+
+class SampleFilter:
+    """Фильтр образцов: камера, диапазон дат, сезон, пороги качества кадра"""
+
+    def __init__(
+        self,
+        cameras=None,
+        start=None,
+        end=None,
+        season=None,
+        min_brightness=None,
+        max_brightness=None,
+        min_contrast=None,
+        min_sharpness=None,
+        min_sky_ratio=None
+    ):
+        """
+        Args:
+            cameras: список camera_id (None = все камеры)
+            start, end: datetime или ISO-строки, границы включительно (None = без границы)
+            season: 'winter' / 'spring' / 'summer' / 'autumn' или кортеж месяцев
+            min_*/max_*: пороги метрик качества кадра (см. frame_quality.py)
+        """
+        self.cameras = set(cameras) if cameras else None
+        self.start = _to_datetime(start)
+        self.end = _to_datetime(end)
+
+        if isinstance(season, str):
+            if season not in SEASONS:
+                raise ValueError(f"Неизвестный сезон: {season}")
+            season = SEASONS[season]
+        self.months = set(season) if season else None
+
+        # Метрика -> (min, max)
+        self.quality_thresholds = {
+            name: bounds for name, bounds in {
+                "brightness": (min_brightness, max_brightness),
+                "contrast": (min_contrast, None),
+                "sharpness": (min_sharpness, None),
+                "sky_ratio": (min_sky_ratio, None)
+            }.items()
+            if bounds != (None, None)
+        }
+
+    def match_key(self, camera_id, dt):
+        """Проверка по (camera_id, время) - без чтения файла"""
+        if self.cameras is not None and camera_id not in self.cameras:
+            return False
+        if self.start is not None and dt < self.start:
+            return False
+        if self.end is not None and dt > self.end:
+            return False
+        if self.months is not None and dt.month not in self.months:
+            return False
+        return True
+
+    def match_quality(self, quality_metrics):
+        """
+        Проверка порогов качества
+
+        Образцы без метрик (камеры без фильтрации) проходят
+        """
+        if not self.quality_thresholds or not quality_metrics:
+            return True
+
+        for name, (low, high) in self.quality_thresholds.items():
+            value = quality_metrics.get(name)
+            if value is None:
+                continue
+            if low is not None and value < low:
+                return False
+            if high is not None and value > high:
+                return False
+        return True
+
+    def match_sample(self, sample):
+        dt = _to_datetime(sample['timestamp'])
+        return self.match_key(sample['camera_id'], dt) and self.match_quality(sample.get('quality_metrics'))
+
+
+def _join_tick(meta, ticks_dir):
+    """Метаданные образца, дополненные показаниями его такта (None - такт не опрашивался)"""
+    from readings_poller import load_tick_readings, tick_sample_fields
+
+    tick_id = meta.get('tick_id') or _to_datetime(meta['timestamp']).strftime(TIMESTAMP_FORMAT)
+    record = load_tick_readings(tick_id, ticks_dir)
+    if record is None:
+        return None
+
+    fields = tick_sample_fields(record)
+    meta = dict(meta)
+    if meta.get('pm25') is None:
+        meta['pm25'] = fields['pm25']
+    if 'weather' not in meta and fields['weather'] is not None:
+        meta['weather'] = fields['weather']
+    return meta
+
+
+def iter_samples(data_dir="data", sample_filter=None, ticks_dir=None):
+    """
+    Генератор образцов с PM2.5 и метеоданными
+
+    Args:
+        data_dir: Директория данных (ищется data_dir/metadata/*.json)
+        sample_filter: SampleFilter (None = без фильтрации)
+        ticks_dir: Показания тактов (None = data_dir/pm25/ticks)
+
+    Yields:
+        dict: timestamp, camera_id, pm25, weather, image_path, quality_metrics, metadata_path
+    """
+    metadata_dir = os.path.join(data_dir, "metadata")
+    if not os.path.isdir(metadata_dir):
+        return
+    ticks_dir = ticks_dir if ticks_dir is not None else os.path.join(data_dir, "pm25", "ticks")
+
+    with os.scandir(metadata_dir) as it:
+        for dir_entry in it:
+            if not dir_entry.name.endswith('.json'):
+                continue
+
+            # Фильтр по имени файла - файл даже не открывается
+            key = parse_sample_filename(dir_entry.name)
+            if sample_filter is not None and key is not None and not sample_filter.match_key(*key):
+                continue
+
+            with open(dir_entry.path, 'r', encoding='utf-8') as f:
+                meta = json.load(f)
+
+            if meta.get('pm25') is None or 'weather' not in meta:
+                meta = _join_tick(meta, ticks_dir)
+                if meta is None or meta.get('pm25') is None or 'weather' not in meta:
+                    continue
+
+            sample = {
+                'timestamp': meta['timestamp'],
+                'camera_id': meta['camera_id'],
+                'pm25': meta['pm25'],
+                'weather': meta['weather'],
+                'image_path': meta.get('image_path'),
+                'quality_metrics': meta.get('quality_metrics'),
+                'metadata_path': dir_entry.path
+            }
+
+            if sample_filter is not None and not sample_filter.match_sample(sample):
+                continue
+
+            yield sample
+
+
+def iter_batches(data_dir="data", sample_filter=None, chunk_size=1024, model=None,
+                 pm25_store=None, pm25_source=None):
+    """
+    Генератор готовых NumPy блоков для обучения
+
+    Память ограничена размером блока независимо от объёма архива
+
+    Args:
+        data_dir: Директория данных
+        sample_filter: SampleFilter (None = без фильтрации)
+        chunk_size: Образцов в блоке
+        model: BaselineWeatherModel для подготовки признаков (None = новая)
+        pm25_store: TimeSeriesStore - целевой PM2.5 берётся как среднее за час
+                    из хранилища рядов (None = pm25 из метаданных образца)
+        pm25_source: Источник рядов в хранилище (None = все входные ряды, без результатов fusion.py);
+                     'sightline' / 'sightline_kriging' - интерполяция вдоль линии зрения
+                     камеры образца по всем датчикам (interpolation.py)
+
+    Yields:
+        dict: X (n, n_features), y (n,), camera_id (n,), timestamp (n,)
+    """
+    if model is None:
+        from baseline_model import BaselineWeatherModel
+        model = BaselineWeatherModel()
+
+    if pm25_store is not None and pm25_source is None:
+        # Ряды fusion/* строятся из тех же показаний: метка не должна меняться после слияния
+        from fusion import input_series
+        pm25_source = tuple(sorted({source for source, _ in input_series(pm25_store)}))
+
+    chunk = []
+    for sample in iter_samples(data_dir, sample_filter):
+        chunk.append(sample)
+        if len(chunk) >= chunk_size:
+            yield _build_block(chunk, model, pm25_store, pm25_source)
+            chunk = []
+
+    if chunk:
+        yield _build_block(chunk, model, pm25_store, pm25_source)
+
+
+def sample_id(camera_id, timestamp):
+    """Стабильный ID образца: <camera_id>_<YYYYmmdd_HHMMSS>"""
+    dt = _to_datetime(timestamp)
+    return f"{camera_id}_{dt.strftime(TIMESTAMP_FORMAT)}"
+
+
+def _build_block(samples, model, pm25_store=None, pm25_source=None):
+    X = model.prepare_features_batch([s['weather'] for s in samples])
+    y = np.array([s['pm25'] for s in samples], dtype=np.float64)
+
+    timestamps = np.array([s['timestamp'] for s in samples])
+    camera_ids = np.array([s['camera_id'] for s in samples])
+
+    if pm25_store is not None:
+        from interpolation import LABEL_SOURCES
+        if pm25_source in LABEL_SOURCES:
+            # Оценка вдоль линии зрения: матрица (час × камера) на весь блок
+            from interpolation import sightline_labels
+            hourly = sightline_labels(pm25_store, timestamps, camera_ids, method=LABEL_SOURCES[pm25_source])
+        else:
+            # Один векторный lookup по часовым агрегатам на весь блок
+            hourly = pm25_store.lookup('pm25', timestamps, source=pm25_source)
+        y = np.where(np.isnan(hourly), y, hourly)
+
+    return {
+        'X': X,
+        'y': y,
+        'camera_id': camera_ids,
+        'timestamp': timestamps
+    }
+
+
+def load_arrays(data_dir="data", sample_filter=None, chunk_size=1024, model=None,
+                pm25_store=None, pm25_source=None):
+    """
+    Собирает все блоки в массивы X, y (для небольших выборок)
+
+    Returns:
+        tuple: (X, y, camera_ids, timestamps) или (None, None, None, None) если образцов нет
+    """
+    blocks = list(iter_batches(data_dir, sample_filter, chunk_size, model, pm25_store, pm25_source))
+    if not blocks:
+        return None, None, None, None
+
+    return (
+        np.concatenate([b['X'] for b in blocks]),
+        np.concatenate([b['y'] for b in blocks]),
+        np.concatenate([b['camera_id'] for b in blocks]),
+        np.concatenate([b['timestamp'] for b in blocks])
+    )
@@ -0,0 +1,266 @@
+"""
+Снапшоты датасета: неизменяемый манифест образцов для воспроизводимых экспериментов
+Результаты baseline зависят от того, что лежит на диске в момент запуска;
+снапшот фиксирует ID образцов, хэши содержимого, разбиение train/test и готовые X/y
+
+Хранение: data/snapshots/<snapshot_id>.npz (сжатые NumPy массивы)
+    sample_id   - ID образцов (<camera_id>_<YYYYmmdd_HHMMSS>), отсортированы
+    content_hash - SHA-1 файла метаданных (+ изображения, если указано)
+    split       - 0 = train, 1 = test
+    X, y        - признаки и PM2.5 (перезагрузка без пересканирования)
+
+snapshot_id - хэш от (sample_id, content_hash, split), т.е. снапшот адресуется по содержимому
+"""
+
+import os
+import json
+import time
+import hashlib
+import argparse
+from datetime import datetime
+
+import numpy as np
+
+from dataset import SampleFilter, iter_samples, parse_sample_filename, sample_id as make_sample_id
+
+
+SNAPSHOT_DIR = "data/snapshots"
+SPLIT_TRAIN = 0
+SPLIT_TEST = 1
+
+
+def assign_split(sample_ids, test_size=0.2, seed=42):
+    """
+    Детерминированное разбиение по хэшу ID образца
+
+    Образец всегда попадает в одну и ту же часть, даже если датасет пополнился
+
+    Returns:
+        np.array (N,) uint8: 0 = train, 1 = test
+    """
+    threshold = int(test_size * 10000)
+    split = np.empty(len(sample_ids), dtype=np.uint8)
+    for i, sid in enumerate(sample_ids):
+        digest = hashlib.sha1(f"{seed}:{sid}".encode('utf-8')).digest()
+        split[i] = SPLIT_TEST if int.from_bytes(digest[:4], 'big') % 10000 < threshold else SPLIT_TRAIN
+    return split
+
+
+def content_hash(sample, include_images=False):
+    """SHA-1 содержимого образца (файл метаданных и, опционально, изображение)"""
+    h = hashlib.sha1()
+    with open(sample['metadata_path'], 'rb') as f:
+        h.update(f.read())
+
+    image_path = sample.get('image_path')
+    if include_images and image_path and os.path.exists(image_path):
+        with open(image_path, 'rb') as f:
+            for block in iter(lambda: f.read(1 << 20), b''):
+                h.update(block)
+
+    return h.digest()
+
+
+class DatasetSnapshot:
+    """Загруженный снапшот (все массивы в памяти, отсортированы по sample_id)"""
+
+    def __init__(self, snapshot_id, sample_id, content_hash, split, X, y, info):
+        self.snapshot_id = snapshot_id
+        self.sample_id = sample_id
+        self.content_hash = content_hash
+        self.split = split
+        self.X = X
+        self.y = y
+        self.info = info
+
+    def __len__(self):
+        return len(self.sample_id)
+
+    def train_test(self):
+        """
+        Returns:
+            tuple: (X_train, X_test, y_train, y_test)
+        """
+        test = self.split == SPLIT_TEST
+        return self.X[~test], self.X[test], self.y[~test], self.y[test]
+
+    @property
+    def camera_id(self):
+        return np.array([sid.rsplit('_', 2)[0] for sid in self.sample_id])
+
+    @property
+    def timestamp(self):
+        return np.array([parse_sample_filename(f"{sid}.json")[1] for sid in self.sample_id], dtype='datetime64[s]')
+
+
+def compute_snapshot_id(sample_ids, hashes, split):
+    h = hashlib.sha1()
+    h.update("\n".join(sample_ids.tolist()).encode('utf-8'))
+    h.update(hashes.tobytes())
+    h.update(split.tobytes())
+    return h.hexdigest()[:16]
+
+
+def create_snapshot(data_dir="data", sample_filter=None, test_size=0.2, seed=42,
+                    include_images=False, snapshot_dir=SNAPSHOT_DIR):
+    """
+    Сканирует датасет один раз и сохраняет снапшот
+
+    Returns:
+        DatasetSnapshot или None если образцов нет
+    """
+    from baseline_model import BaselineWeatherModel
+
+    model = BaselineWeatherModel()
+
+    ids, hashes, weather, targets = [], [], [], []
+    for sample in iter_samples(data_dir, sample_filter):
+        ids.append(make_sample_id(sample['camera_id'], sample['timestamp']))
+        hashes.append(content_hash(sample, include_images))
+        weather.append(sample['weather'])
+        targets.append(sample['pm25'])
+
+    if not ids:
+        return None
+
+    # Сортировка по ID; дубликаты ID (повторные файлы метаданных) отбрасываются
+    _, order = np.unique(np.array(ids), return_index=True)
+    sample_ids = np.array(ids)[order]
+    content_hashes = np.array(hashes, dtype='S20')[order]
+    X = model.prepare_features_batch(weather)[order]
+    y = np.array(targets, dtype=np.float64)[order]
+    split = assign_split(sample_ids, test_size, seed)
+
+    snapshot_id = compute_snapshot_id(sample_ids, content_hashes, split)
+    info = {
+        "snapshot_id": snapshot_id,
+        "created_at": datetime.now().isoformat(),
+        "data_dir": data_dir,
+        "n_samples": int(len(sample_ids)),
+        "n_test": int(split.sum()),
+        "test_size": test_size,
+        "seed": seed,
+        "include_images": include_images,
+        "feature_names": model.feature_names
+    }
+
+    os.makedirs(snapshot_dir, exist_ok=True)
+    path = os.path.join(snapshot_dir, f"{snapshot_id}.npz")
+
+    # Снапшот неизменяем: тот же snapshot_id = то же содержимое
+    if not os.path.exists(path):
+        tmp_path = path + ".tmp.npz"
+        np.savez_compressed(
+            tmp_path,
+            sample_id=sample_ids,
+            content_hash=content_hashes,
+            split=split,
+            X=X,
+            y=y,
+            info=np.array(json.dumps(info))
+        )
+        os.replace(tmp_path, path)
+
+    return DatasetSnapshot(snapshot_id, sample_ids, content_hashes, split, X, y, info)
+
+
+def load_snapshot(snapshot, snapshot_dir=SNAPSHOT_DIR):
+    """
+    Загружает снапшот без сканирования датасета
+
+    Args:
+        snapshot: snapshot_id или путь к .npz
+    """
+    path = snapshot if snapshot.endswith(".npz") else os.path.join(snapshot_dir, f"{snapshot}.npz")
+
+    with np.load(path, allow_pickle=False) as data:
+        info = json.loads(str(data["info"]))
+        return DatasetSnapshot(
+            info["snapshot_id"],
+            data["sample_id"],
+            data["content_hash"],
+            data["split"],
+            data["X"],
+            data["y"],
+            info
+        )
+
+
+def list_snapshots(snapshot_dir=SNAPSHOT_DIR):
+    if not os.path.isdir(snapshot_dir):
+        return []
+    return sorted(name[:-len(".npz")] for name in os.listdir(snapshot_dir) if name.endswith(".npz"))
+
+
+def diff_snapshots(old, new):
+    """
+    Разница между двумя снапшотами (векторно, по отсортированным ID)
+
+    Returns:
+        dict: added, removed, changed (другой хэш), moved (другая часть split)
+    """
+    common, old_idx, new_idx = np.intersect1d(old.sample_id, new.sample_id, assume_unique=True, return_indices=True)
+
+    changed = old.content_hash[old_idx] != new.content_hash[new_idx]
+    moved = old.split[old_idx] != new.split[new_idx]
+
+    return {
+        "added": np.setdiff1d(new.sample_id, old.sample_id, assume_unique=True),
+        "removed": np.setdiff1d(old.sample_id, new.sample_id, assume_unique=True),
+        "changed": common[changed],
+        "moved": common[moved]
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Снапшоты датасета')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    create_parser = subparsers.add_parser('create', help='Создать снапшот')
+    create_parser.add_argument('--data-dir', type=str, default='data')
+    create_parser.add_argument('--cameras', nargs='+', default=None)
+    create_parser.add_argument('--start', type=str, default=None)
+    create_parser.add_argument('--end', type=str, default=None)
+    create_parser.add_argument('--season', choices=['winter', 'spring', 'summer', 'autumn'], default=None)
+    create_parser.add_argument('--test-size', type=float, default=0.2)
+    create_parser.add_argument('--seed', type=int, default=42)
+    create_parser.add_argument('--include-images', action='store_true',
+                               help='Включать байты изображений в хэш содержимого')
+
+    subparsers.add_parser('list', help='Список снапшотов')
+
+    diff_parser = subparsers.add_parser('diff', help='Сравнить два снапшота')
+    diff_parser.add_argument('old')
+    diff_parser.add_argument('new')
+
+    args = parser.parse_args()
+
+    if args.command == 'create':
+        sample_filter = SampleFilter(cameras=args.cameras, start=args.start, end=args.end, season=args.season)
+        snapshot = create_snapshot(args.data_dir, sample_filter, args.test_size, args.seed, args.include_images)
+        if snapshot is None:
+            print("❌ Нет образцов с PM2.5 данными!")
+            return
+        print(f"✅ Снапшот: {snapshot.snapshot_id}")
+        print(f"   Образцов: {snapshot.info['n_samples']} (test: {snapshot.info['n_test']})")
+
+    elif args.command == 'list':
+        for snapshot_id in list_snapshots():
+            info = load_snapshot(snapshot_id).info
+            print(f"{snapshot_id}  {info['created_at']}  {info['n_samples']} образцов")
+
+    elif args.command == 'diff':
+        old, new = load_snapshot(args.old), load_snapshot(args.new)
+        start = time.perf_counter()
+        diff = diff_snapshots(old, new)
+        elapsed_ms = (time.perf_counter() - start) * 1000
+
+        print(f"📊 {old.snapshot_id} → {new.snapshot_id} ({elapsed_ms:.1f} мс)")
+        print(f"   Добавлено: {len(diff['added'])}")
+        print(f"   Удалено: {len(diff['removed'])}")
+        print(f"   Изменено: {len(diff['changed'])}")
+        print(f"   Сменили split: {len(diff['moved'])}")
+
+
+if __name__ == "__main__":
+    main()
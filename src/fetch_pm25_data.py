@@ -4,21 +4,51 @@
 """
 
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 import json
-from datetime import datetime, timedelta
+from datetime import datetime, timedelta, timezone
 import time
 import os
 from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor
 from dotenv import load_dotenv
+from rate_limiter import QuotaRateLimiter, PRIORITY_REALTIME
+from http_cache import ResponseCache
+import aqi as aqi_module
+from timeseries_store import TimeSeriesStore
 
 # Загрузка API ключей из .env файла
 load_dotenv()
 
+# Базовые URL API (переопределяются для локального replay-сервера, см. replay_server.py)
+DEFAULT_BASE_URLS = {
+    "openaq": "https://api.openaq.org",
+    "iqair": "http://api.airvisual.com",
+    "openweathermap": "https://api.openweathermap.org",
+}
+
+# Ряд OpenWeatherMap в хранилище (одна точка - центр города); тот же ключ пишет backfill
+OWM_LOCATION = "bishkek"
+
 
 class PM25DataCollector:
     """Класс для сбора данных о качестве воздуха"""
 
-    def __init__(self, output_dir="data/pm25"):
+    def __init__(self, output_dir="data/pm25", max_connections_per_host=4, rate_limiter=None,
+                 priority=PRIORITY_REALTIME, response_cache=None, timeseries_store=None,
+                 base_urls=None, max_retries=0):
+        """
+        Args:
+            output_dir: Директория для сохранения JSON
+            max_connections_per_host: Лимит keep-alive соединений на один хост
+            rate_limiter: QuotaRateLimiter (None = общий лимитер data/api_usage.json)
+            priority: Приоритет вызовов этого коллектора ('realtime' или 'backfill')
+            response_cache: ResponseCache (None = data/cache/http)
+            timeseries_store: TimeSeriesStore (None = data/timeseries)
+            base_urls: dict источник -> базовый URL (None = DEFAULT_BASE_URLS)
+            max_retries: Повторы при 429/5xx с экспоненциальной паузой (учитывается Retry-After)
+        """
         self.output_dir = output_dir
         os.makedirs(output_dir, exist_ok=True)
 
@@ -28,35 +58,108 @@ class PM25DataCollector:
             "lon": 74.5698
         }
 
+        self.base_urls = dict(DEFAULT_BASE_URLS, **(base_urls or {}))
+
+        # Общая сессия с пулом keep-alive соединений (pool_block=True - жёсткий лимит на хост)
+        self.session = requests.Session()
+        adapter = HTTPAdapter(
+            pool_connections=8,
+            pool_maxsize=max_connections_per_host,
+            pool_block=True,
+            max_retries=Retry(
+                total=max_retries,
+                backoff_factor=0.5,
+                status_forcelist=(429, 500, 502, 503, 504),
+                raise_on_status=False
+            )
+        )
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+        # Латентность последнего сбора по источникам (секунды)
+        self.last_latencies = {}
+
+        # Учёт квот API (token bucket, состояние сохраняется на диск)
+        self.rate_limiter = rate_limiter if rate_limiter is not None else QuotaRateLimiter()
+        self.priority = priority
+
+        # Кэш ответов с TTL по источникам + условные запросы
+        self.response_cache = response_cache if response_cache is not None else ResponseCache()
+
+        # Хранилище временных рядов (колоночные чанки + часовые/дневные агрегаты)
+        self.timeseries_store = timeseries_store if timeseries_store is not None else TimeSeriesStore()
+
+        # Последние сохранённые показания по источникам (для дедупликации)
+        self._last_saved_path = os.path.join(output_dir, ".last_saved.json")
+
+    def _allow_call(self, source_name, api_key=None, cost=1):
+        """Проверка квоты перед запросом к API"""
+        if self.rate_limiter.try_acquire(source_name, api_key, cost=cost, priority=self.priority):
+            return True
+        print(f"⏸️  {source_name}: лимит квоты API, запрос пропущен")
+        return False
+
+    def _get(self, source_name, url, params, api_key=None):
+        """
+        GET через кэш: свежий ответ из кэша не тратит квоту
+
+        Returns:
+            Response / CachedResponse или None если квота исчерпана
+        """
+        cached = self.response_cache.get_fresh(source_name, url, params)
+        if cached is not None:
+            return cached
+
+        if not self._allow_call(source_name, api_key):
+            return None
+
+        return self.response_cache.fetch(self.session, source_name, url, params, timeout=10)
+
+    def _get_all(self, source_name, calls, api_key=None):
+        """
+        Несколько GET одного источника параллельно: квота на все промахи кэша списывается
+        разом, до отправки первого запроса (иначе на последнем токене один запрос
+        уходит и тратит квоту, а парный ему отклоняется)
+
+        Args:
+            calls: [(url, params)]
+
+        Returns:
+            list: ответы в порядке calls или None если квоты не хватает на все
+        """
+        responses = [self.response_cache.get_fresh(source_name, url, params) for url, params in calls]
+        missing = [i for i, response in enumerate(responses) if response is None]
+        if not missing:
+            return responses
+
+        if not self._allow_call(source_name, api_key, cost=len(missing)):
+            return None
+
+        with ThreadPoolExecutor(max_workers=len(missing)) as executor:
+            futures = {
+                i: executor.submit(self.response_cache.fetch, self.session, source_name, *calls[i], timeout=10)
+                for i in missing
+            }
+            for i, future in futures.items():
+                responses[i] = future.result()
+        return responses
+
     @staticmethod
     def aqi_to_ugm3(aqi):
         """
         Конвертация US AQI в µg/m³ для PM2.5
-        Формула из EPA (Environmental Protection Agency)
+        Формула из EPA (Environmental Protection Agency), см. aqi.py
         """
         if aqi is None:
             return None
-
-        # Breakpoints для PM2.5
-        if aqi <= 50:
-            return aqi * 12.0 / 50
-        elif aqi <= 100:
-            return 12.1 + (aqi - 51) * 23.9 / 49
-        elif aqi <= 150:
-            return 35.5 + (aqi - 101) * 19.4 / 49
-        elif aqi <= 200:
-            return 55.5 + (aqi - 151) * 94.4 / 49
-        elif aqi <= 300:
-            return 150.5 + (aqi - 201) * 99.4 / 99
-        else:
-            return 250.5 + (aqi - 301) * 99.9 / 99
+        return aqi_module.aqi_to_ugm3(aqi)
 
     def fetch_openaq_current(self):
         """
         Получить текущие данные PM2.5 из OpenAQ API
         https://docs.openaq.org/docs
         """
-        url = "https://api.openaq.org/v2/latest"
+        url = f"{self.base_urls['openaq']}/v2/latest"
 
         params = {
             "city": "Bishkek",
@@ -66,7 +169,9 @@ class PM25DataCollector:
 
         try:
             print("🌍 Запрос данных из OpenAQ...")
-            response = requests.get(url, params=params, timeout=10)
+            response = self._get("openaq", url, params)
+            if response is None:
+                return None
 
             if response.status_code == 200:
                 data = response.json()
@@ -120,7 +225,7 @@ class PM25DataCollector:
             return None
 
         # Попробуем через координаты (nearest city)
-        url = "http://api.airvisual.com/v2/nearest_city"
+        url = f"{self.base_urls['iqair']}/v2/nearest_city"
 
         params = {
             "lat": self.bishkek_coords["lat"],
@@ -130,7 +235,9 @@ class PM25DataCollector:
 
         try:
             print("🌍 Запрос данных из IQAir...")
-            response = requests.get(url, params=params, timeout=10)
+            response = self._get("iqair", url, params, api_key)
+            if response is None:
+                return None
 
             if response.status_code == 200:
                 data = response.json()
@@ -189,8 +296,8 @@ class PM25DataCollector:
             return None
 
         # Air Pollution API
-        pollution_url = "http://api.openweathermap.org/data/2.5/air_pollution"
-        weather_url = "https://api.openweathermap.org/data/2.5/weather"
+        pollution_url = f"{self.base_urls['openweathermap']}/data/2.5/air_pollution"
+        weather_url = f"{self.base_urls['openweathermap']}/data/2.5/weather"
 
         params = {
             "lat": self.bishkek_coords["lat"],
@@ -201,9 +308,11 @@ class PM25DataCollector:
         try:
             print("🌍 Запрос данных из OpenWeatherMap...")
 
-            # Получаем PM2.5
-            pollution_response = requests.get(pollution_url, params=params, timeout=10)
-            weather_response = requests.get(weather_url, params=params, timeout=10)
+            # PM2.5 и погода нужны парой: квота на оба запроса резервируется вместе
+            responses = self._get_all("openweathermap", [(pollution_url, params), (weather_url, params)], api_key)
+            if responses is None:
+                return None
+            pollution_response, weather_response = responses
 
             if pollution_response.status_code == 200 and weather_response.status_code == 200:
                 pollution_data = pollution_response.json()
@@ -215,6 +324,9 @@ class PM25DataCollector:
 
                 result = {
                     "source": "OpenWeatherMap",
+                    "location": OWM_LOCATION,
+                    "latitude": self.bishkek_coords["lat"],
+                    "longitude": self.bishkek_coords["lon"],
                     "pm25": pm_components.get("pm2_5"),
                     "pm10": pm_components.get("pm10"),
                     "temperature": main.get("temp") - 273.15,  # Kelvin → Celsius
@@ -223,7 +335,7 @@ class PM25DataCollector:
                     "wind_speed": wind.get("speed"),
                     "clouds": weather_data.get("clouds", {}).get("all"),
                     "visibility": weather_data.get("visibility"),
-                    "timestamp": datetime.fromtimestamp(pollution_data["list"][0]["dt"]).isoformat(),
+                    "timestamp": datetime.fromtimestamp(pollution_data["list"][0]["dt"], tz=timezone.utc).isoformat(),
                     "fetched_at": datetime.now().isoformat()
                 }
 
@@ -241,11 +353,38 @@ class PM25DataCollector:
             print(f"❌ Ошибка при запросе OpenWeatherMap: {e}")
             return None
 
+    @staticmethod
+    def _readings_fingerprint(data):
+        """Отпечаток показаний: (location, timestamp источника) каждой записи"""
+        return sorted(
+            f"{record.get('location', record.get('city', ''))}|{record.get('timestamp')}"
+            for record in data
+        )
+
+    def _load_last_saved(self):
+        if os.path.exists(self._last_saved_path):
+            with open(self._last_saved_path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        return {}
+
     def save_data(self, data, source_name):
-        """Сохранение данных в JSON файл"""
+        """
+        Сохранение данных в JSON файл
+
+        Показания с тем же timestamp источника, что и в прошлый раз, не пишутся повторно
+
+        Returns:
+            str: путь к файлу или None если сохранять нечего
+        """
         if not data:
             print("⚠️  Нет данных для сохранения")
-            return
+            return None
+
+        fingerprint = self._readings_fingerprint(data)
+        last_saved = self._load_last_saved()
+        if last_saved.get(source_name) == fingerprint:
+            print(f"♻️  {source_name}: показания не изменились, файл не создаётся")
+            return None
 
         timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
         filename = f"{source_name}_{timestamp}.json"
@@ -254,44 +393,100 @@ class PM25DataCollector:
         with open(filepath, 'w', encoding='utf-8') as f:
             json.dump(data, f, indent=2, ensure_ascii=False)
 
+        last_saved[source_name] = fingerprint
+        with open(self._last_saved_path, 'w', encoding='utf-8') as f:
+            json.dump(last_saved, f, ensure_ascii=False)
+
         print(f"💾 Данные сохранены: {filepath}")
+        return filepath
 
-    def collect_all(self, iqair_key=None, openweather_key=None):
-        """Сбор данных из всех доступных источников"""
+    def _timed(self, source_name, fetch, *args):
+        """Вызов fetch-метода с замером латентности"""
+        start = time.perf_counter()
+        try:
+            return fetch(*args)
+        finally:
+            self.last_latencies[source_name] = time.perf_counter() - start
+
+    def collect_all(self, iqair_key=None, openweather_key=None, save=True):
+        """
+        Сбор данных из всех доступных источников
+
+        Источники опрашиваются параллельно: время сбора = время самого медленного источника
+
+        Args:
+            save: Сохранять файлы по источникам (ReadingsPoller пишет сам, по ID такта)
+        """
         print("=" * 80)
         print("📊 СБОР ДАННЫХ PM2.5 И МЕТЕОДАННЫХ")
         print("=" * 80)
         print()
 
         all_data = []
+        self.last_latencies = {}
+        round_start = time.perf_counter()
+
+        with ThreadPoolExecutor(max_workers=3) as executor:
+            # OpenAQ (бесплатно, без API ключа)
+            openaq_future = executor.submit(self._timed, "openaq", self.fetch_openaq_current)
+            # IQAir (требует бесплатный API ключ)
+            iqair_future = executor.submit(self._timed, "iqair", self.fetch_iqair_current, iqair_key)
+            # OpenWeatherMap (требует бесплатный API ключ)
+            owm_future = executor.submit(self._timed, "openweathermap", self.fetch_openweathermap, openweather_key)
+
+            openaq_data = openaq_future.result()
+            iqair_data = iqair_future.result()
+            owm_data = owm_future.result()
+
+        round_time = time.perf_counter() - round_start
+        print()
 
-        # OpenAQ (бесплатно, без API ключа)
         print("[1/3] OpenAQ API")
         print("-" * 80)
-        openaq_data = self.fetch_openaq_current()
         if openaq_data:
-            self.save_data(openaq_data, "openaq")
+            if save:
+                self.save_data(openaq_data, "openaq")
             all_data.extend(openaq_data)
         print()
 
-        # IQAir (требует бесплатный API ключ)
         print("[2/3] IQAir API")
         print("-" * 80)
-        iqair_data = self.fetch_iqair_current(iqair_key)
         if iqair_data:
-            self.save_data([iqair_data], "iqair")
+            if save:
+                self.save_data([iqair_data], "iqair")
             all_data.append(iqair_data)
         print()
 
-        # OpenWeatherMap (требует бесплатный API ключ)
         print("[3/3] OpenWeatherMap API")
         print("-" * 80)
-        owm_data = self.fetch_openweathermap(openweather_key)
         if owm_data:
-            self.save_data([owm_data], "openweathermap")
+            if save:
+                self.save_data([owm_data], "openweathermap")
             all_data.append(owm_data)
         print()
 
+        # Показания всех источников - в хранилище рядов (повторы не дописываются)
+        if all_data:
+            written = self.timeseries_store.append_records(all_data)
+            print(f"🗃️  Хранилище рядов: {written} новых строк")
+            print()
+
+        print("⏱️  Латентность источников:")
+        for source_name, latency in self.last_latencies.items():
+            print(f"   {source_name}: {latency * 1000:.0f} мс")
+        print(f"   Весь сбор: {round_time * 1000:.0f} мс")
+        print()
+
+        cache_stats = self.response_cache.stats
+        print(f"🗄️  Кэш: {cache_stats['hits']} из кэша, {cache_stats['revalidated']} не изменились (304), "
+              f"{cache_stats['misses']} запросов")
+        print()
+
+        print("📈 Квоты API:")
+        for key, info in self.rate_limiter.usage().items():
+            print(f"   {key}: {info['used']}/{info['quota']} за {info['window']}")
+        print()
+
         print("=" * 80)
         print(f"📊 Всего собрано записей: {len(all_data)}")
         print("=" * 80)
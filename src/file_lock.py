@@ -0,0 +1,81 @@
+"""
+Межпроцессная блокировка на файле
+Общие файлы данных (манифест рядов, состояние лимитера, индекс архива) пишут
+несколько процессов сразу: сборщики кластера, backfill, компакция
+
+Блокировка - flock на отдельном файле <path>.lock (в Windows - msvcrt.locking).
+Повторный захват из того же процесса не блокируется (счётчик вложенности),
+поэтому под блокировкой можно вызывать методы, которые тоже её берут
+"""
+
+import os
+import threading
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+
+def file_signature(path):
+    """(mtime_ns, size, inode) файла или None: меняется при каждой перезаписи через os.replace"""
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return (stat.st_mtime_ns, stat.st_size, stat.st_ino)
+
+
+class FileLock:
+    """Эксклюзивная блокировка файла: with FileLock(path): ..."""
+
+    def __init__(self, path):
+        """
+        Args:
+            path: Файл блокировки (создаётся при первом захвате)
+        """
+        self.path = path
+        self._thread_lock = threading.RLock()
+        self._depth = 0
+        self._file = None
+
+    def acquire(self):
+        self._thread_lock.acquire()
+        if self._depth == 0:
+            try:
+                os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+                self._file = open(self.path, 'a+b')
+                if fcntl is not None:
+                    fcntl.flock(self._file.fileno(), fcntl.LOCK_EX)
+                else:
+                    self._file.seek(0)
+                    msvcrt.locking(self._file.fileno(), msvcrt.LK_LOCK, 1)
+            except BaseException:
+                if self._file is not None:
+                    self._file.close()
+                    self._file = None
+                self._thread_lock.release()
+                raise
+        self._depth += 1
+        return self
+
+    def release(self):
+        self._depth -= 1
+        if self._depth == 0:
+            try:
+                if fcntl is not None:
+                    fcntl.flock(self._file.fileno(), fcntl.LOCK_UN)
+                else:
+                    self._file.seek(0)
+                    msvcrt.locking(self._file.fileno(), msvcrt.LK_UNLCK, 1)
+            finally:
+                self._file.close()
+                self._file = None
+        self._thread_lock.release()
+
+    def __enter__(self):
+        return self.acquire()
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.release()
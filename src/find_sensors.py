@@ -6,9 +6,16 @@
 import requests
 import json
 from math import radians, cos, sin, asin, sqrt
+import numpy as np
 from camera_config import CAMERAS, get_recommended_cameras
 
 
+OPENAQ_BASE_URL = "https://api.openaq.org"
+
+# Сколько ближайших датчиков печатать для каждой камеры
+MAX_PRINTED_NEIGHBORS = 10
+
+
 def haversine(lon1, lat1, lon2, lat2):
     """
     Расчёт расстояния между двумя точками на Земле (формула гаверсинусов)
@@ -28,26 +35,108 @@ def haversine(lon1, lat1, lon2, lat2):
     return c * r
 
 
-def find_sensors_openaq_v3(lat=42.8746, lon=74.5698, radius_km=20):
+EARTH_RADIUS_KM = 6371
+
+
+def haversine_matrix(lat1, lon1, lat2, lon2):
+    """
+    Матрица расстояний между двумя наборами точек (одна broadcast-операция)
+
+    Args:
+        lat1, lon1: координаты первого набора (n,) в градусах
+        lat2, lon2: координаты второго набора (m,) в градусах
+
+    Returns:
+        np.array (n, m): расстояния в километрах
+    """
+    lat1 = np.radians(np.asarray(lat1, dtype=np.float64))[:, None]
+    lon1 = np.radians(np.asarray(lon1, dtype=np.float64))[:, None]
+    lat2 = np.radians(np.asarray(lat2, dtype=np.float64))[None, :]
+    lon2 = np.radians(np.asarray(lon2, dtype=np.float64))[None, :]
+
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    # clip: ошибки округления могут дать a чуть больше 1
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.clip(a, 0.0, 1.0)))
+
+
+def sorted_neighbors(distance_matrix, k=None, max_km=None):
+    """
+    Списки соседей по возрастанию расстояния для каждой строки матрицы
+
+    Args:
+        distance_matrix: np.array (n, m) из haversine_matrix
+        k: Только k ближайших (argpartition вместо полной сортировки)
+        max_km: Только соседи не дальше max_km
+
+    Returns:
+        list: для каждой строки - (индексы (k,), расстояния (k,)), отсортированы по расстоянию
+    """
+    n, m = distance_matrix.shape
+    if k is not None and k < m:
+        candidates = np.argpartition(distance_matrix, k - 1, axis=1)[:, :k]
+    else:
+        candidates = np.broadcast_to(np.arange(m), (n, m))
+
+    candidate_dist = np.take_along_axis(distance_matrix, candidates, axis=1)
+    order = np.argsort(candidate_dist, axis=1, kind='stable')
+    indices = np.take_along_axis(candidates, order, axis=1)
+    dists = np.take_along_axis(candidate_dist, order, axis=1)
+
+    neighbors = []
+    for row_indices, row_dists in zip(indices, dists):
+        if max_km is not None:
+            keep = row_dists <= max_km
+            row_indices, row_dists = row_indices[keep], row_dists[keep]
+        neighbors.append((row_indices, row_dists))
+    return neighbors
+
+
+def parse_openaq_location(location):
+    """
+    Локация OpenAQ v3 → запись датчика
+
+    Returns:
+        dict или None если у локации нет PM2.5 или координат
+    """
+    sensor_info = {
+        "id": location.get("id"),
+        "name": location.get("name"),
+        "locality": location.get("locality"),
+        "country": (location.get("country") or {}).get("name"),
+        "latitude": (location.get("coordinates") or {}).get("latitude"),
+        "longitude": (location.get("coordinates") or {}).get("longitude"),
+        "sensors": location.get("sensors", []),
+        "provider": (location.get("provider") or {}).get("name"),
+        "datetime_last": (location.get("datetimeLast") or {}).get("utc"),
+    }
+
+    # Проверяем что есть PM2.5
+    has_pm25 = any(s.get("parameter", {}).get("name") == "pm25" for s in sensor_info["sensors"])
+
+    if has_pm25 and sensor_info["latitude"] and sensor_info["longitude"]:
+        return sensor_info
+    return None
+
+
+def find_sensors_openaq_v3(lat=42.8746, lon=74.5698, radius_km=20, base_url=OPENAQ_BASE_URL, session=None,
+                           api_key=None):
     """
-    Поиск датчиков PM2.5 в Бишкеке через OpenAQ API v3
+    Поиск датчиков PM2.5 в Бишкеке через OpenAQ API v3 (все страницы результатов)
+
+    Для повторных запусков используйте sensor_catalog.SensorCatalog - он хранит
+    результаты на диске и не ходит в сеть, пока каталог свежий
 
     Args:
         lat, lon: координаты центра поиска (центр Бишкека)
         radius_km: радиус поиска в км
+        base_url: базовый URL OpenAQ (для локального replay-сервера)
+        session: requests.Session (None = новая сессия)
+        api_key: API ключ OpenAQ v3 (заголовок X-API-Key)
 
     Returns:
         list: список датчиков с координатами
     """
-    # OpenAQ API v3 endpoint
-    url = "https://api.openaq.org/v3/locations"
-
-    params = {
-        "coordinates": f"{lat},{lon}",
-        "radius": radius_km * 1000,  # Конвертируем в метры
-        "limit": 100,
-        "parameter": "pm25"  # Только PM2.5 датчики
-    }
+    from sensor_catalog import fetch_openaq_locations
 
     try:
         print(f"🌍 Поиск датчиков PM2.5 в радиусе {radius_km} км от Бишкека...")
@@ -55,43 +144,16 @@ def find_sensors_openaq_v3(lat=42.8746, lon=74.5698, radius_km=20):
         print(f"   API: OpenAQ v3")
         print("-" * 80)
 
-        response = requests.get(url, params=params, timeout=10)
-
-        if response.status_code == 200:
-            data = response.json()
-            results = data.get("results", [])
-
-            if not results:
-                print("⚠️  Датчики не найдены через OpenAQ API v3")
-                return []
-
-            sensors = []
-            for location in results:
-                # Извлекаем данные о датчике
-                sensor_info = {
-                    "id": location.get("id"),
-                    "name": location.get("name"),
-                    "locality": location.get("locality"),
-                    "country": location.get("country", {}).get("name"),
-                    "latitude": location.get("coordinates", {}).get("latitude"),
-                    "longitude": location.get("coordinates", {}).get("longitude"),
-                    "sensors": location.get("sensors", []),
-                    "provider": location.get("provider", {}).get("name"),
-                }
+        locations = fetch_openaq_locations(lat, lon, radius_km, base_url=base_url, session=session, api_key=api_key)
 
-                # Проверяем что есть PM2.5
-                has_pm25 = any(s.get("parameter", {}).get("name") == "pm25" for s in sensor_info["sensors"])
-
-                if has_pm25 and sensor_info["latitude"] and sensor_info["longitude"]:
-                    sensors.append(sensor_info)
+        if not locations:
+            print("⚠️  Датчики не найдены через OpenAQ API v3")
+            return []
 
-            print(f"✅ Найдено {len(sensors)} датчиков PM2.5")
-            return sensors
+        sensors = [info for info in map(parse_openaq_location, locations) if info is not None]
 
-        else:
-            print(f"❌ Ошибка OpenAQ API: {response.status_code}")
-            print(f"   Response: {response.text[:200]}")
-            return []
+        print(f"✅ Найдено {len(sensors)} датчиков PM2.5")
+        return sensors
 
     except Exception as e:
         print(f"❌ Ошибка при запросе: {e}")
@@ -135,16 +197,20 @@ def get_known_sensors_manual():
     ]
 
 
-def calculate_distances_to_cameras(sensors):
+def calculate_distances_to_cameras(sensors=None):
     """
     Рассчитывает расстояния от каждого датчика до каждой камеры
 
     Args:
-        sensors: список датчиков с координатами
+        sensors: список датчиков с координатами (None = каталог датчиков с диска, без сети)
 
     Returns:
         dict: расстояния для каждой пары камера-датчик
     """
+    if sensors is None:
+        from sensor_catalog import load_sensors
+        sensors = load_sensors(refresh=False)
+
     cameras = get_recommended_cameras()
     distances = {}
 
@@ -152,11 +218,21 @@ def calculate_distances_to_cameras(sensors):
     print("📏 РАССТОЯНИЯ КАМЕРА → ДАТЧИК")
     print("=" * 80)
 
-    for camera_id, camera_info in cameras.items():
-        if not camera_info["coordinates"]:
+    located = {camera_id: info for camera_id, info in cameras.items() if info["coordinates"]}
+    for camera_id in cameras:
+        if camera_id not in located:
             print(f"\n⚠️  {camera_id}: координаты не известны")
-            continue
 
+    if not located or not sensors:
+        return distances
+
+    # Все пары камера × датчик одной матрицей, соседи уже отсортированы
+    camera_coords = np.array([info["coordinates"] for info in located.values()], dtype=np.float64)
+    sensor_coords = np.array([(s["latitude"], s["longitude"]) for s in sensors], dtype=np.float64)
+    matrix = haversine_matrix(camera_coords[:, 0], camera_coords[:, 1], sensor_coords[:, 0], sensor_coords[:, 1])
+    neighbors = sorted_neighbors(matrix)
+
+    for (camera_id, camera_info), (indices, dists) in zip(located.items(), neighbors):
         cam_lat, cam_lon = camera_info["coordinates"]
         camera_name = camera_info["name"]
 
@@ -167,19 +243,21 @@ def calculate_distances_to_cameras(sensors):
 
         distances[camera_id] = []
 
-        for sensor in sensors:
+        for rank, (index, dist_km) in enumerate(zip(indices.tolist(), dists.tolist())):
+            sensor = sensors[index]
             sensor_lat = sensor["latitude"]
             sensor_lon = sensor["longitude"]
 
-            # Рассчитываем расстояние
-            dist_km = haversine(cam_lon, cam_lat, sensor_lon, sensor_lat)
-
             distances[camera_id].append({
                 "sensor_name": sensor["name"],
                 "distance_km": dist_km,
                 "sensor_coords": (sensor_lat, sensor_lon)
             })
 
+            # Большой региональный каталог: печатаем только ближайшие
+            if rank >= MAX_PRINTED_NEIGHBORS:
+                continue
+
             # Оценка качества (критично для статьи!)
             if dist_km < 1:
                 status = "✅ ОТЛИЧНО"
@@ -192,18 +270,41 @@ def calculate_distances_to_cameras(sensors):
 
             print(f"   {status} {sensor['name']}: {dist_km:.2f} км")
 
-        # Сортируем по расстоянию
-        distances[camera_id].sort(key=lambda x: x["distance_km"])
+        if len(indices) > MAX_PRINTED_NEIGHBORS:
+            print(f"   ... ещё {len(indices) - MAX_PRINTED_NEIGHBORS} датчиков дальше")
 
     return distances
 
 
-def recommend_camera_sensor_pairs(distances):
+def _closest_sensors(distances=None, sensor_index=None):
+    """Ближайший датчик для каждой камеры: из пространственного индекса или из списков расстояний"""
+    if sensor_index is None:
+        return {camera_id: sensor_list[0] for camera_id, sensor_list in distances.items() if sensor_list}
+
+    closest = {}
+    for camera_id, camera_info in get_recommended_cameras().items():
+        if not camera_info["coordinates"]:
+            continue
+        nearest = sensor_index.nearest(*camera_info["coordinates"], k=1)
+        if nearest:
+            key, dist_km = nearest[0]
+            sensor = sensor_index.payloads[key]
+            closest[camera_id] = {
+                "sensor_name": sensor["name"],
+                "distance_km": dist_km,
+                "sensor_coords": (sensor["latitude"], sensor["longitude"])
+            }
+    return closest
+
+
+def recommend_camera_sensor_pairs(distances=None, sensor_index=None):
     """
     Рекомендует лучшие пары камера-датчик на основе расстояния
 
     Args:
         distances: результат calculate_distances_to_cameras()
+        sensor_index: spatial_index.SensorIndex - ближайший датчик запросом к индексу
+                      (без полных списков расстояний; имеет приоритет над distances)
 
     Returns:
         dict: рекомендованные пары
@@ -214,12 +315,7 @@ def recommend_camera_sensor_pairs(distances):
 
     recommendations = {}
 
-    for camera_id, sensor_list in distances.items():
-        if not sensor_list:
-            continue
-
-        # Берём ближайший датчик
-        closest = sensor_list[0]
+    for camera_id, closest in _closest_sensors(distances, sensor_index).items():
         dist = closest["distance_km"]
 
         if dist < 2:
@@ -247,8 +343,8 @@ def recommend_camera_sensor_pairs(distances):
     return recommendations
 
 
-def save_sensor_data(sensors, distances, recommendations, filename="data/sensor_locations.json"):
-    """Сохраняет данные о датчиках и расстояниях"""
+def save_sensor_data(sensors, distances, recommendations, filename="data/sensor_locations.json", sightlines=None):
+    """Сохраняет данные о датчиках и расстояниях (sightlines - веса датчиков секторов обзора, sightline.py)"""
     import os
     os.makedirs("data", exist_ok=True)
 
@@ -256,6 +352,7 @@ def save_sensor_data(sensors, distances, recommendations, filename="data/sensor_
         "sensors": sensors,
         "distances": distances,
         "recommendations": recommendations,
+        "sightlines": sightlines,
         "generated_at": str(requests.Session().hooks)  # timestamp
     }
 
@@ -271,15 +368,11 @@ def main():
     print("=" * 80)
     print()
 
-    # Пробуем OpenAQ API v3
-    sensors = find_sensors_openaq_v3()
-
-    # Если не работает - используем известные датчики
-    if not sensors:
-        print("\n⚠️  OpenAQ API не вернул результаты")
-        print("   Используем известные датчики из других источников")
-        sensors = get_known_sensors_manual()
-        print(f"✅ Загружено {len(sensors)} известных датчиков")
+    # Каталог датчиков OpenAQ v3 (обновляется из сети, только если устарел);
+    # пустой каталог - известные датчики из других источников
+    from sensor_catalog import load_sensors
+    sensors = load_sensors()
+    print(f"✅ Загружено {len(sensors)} датчиков")
 
     if not sensors:
         print("\n❌ КРИТИЧЕСКАЯ ПРОБЛЕМА: Датчики не найдены!")
@@ -301,11 +394,16 @@ def main():
     # Рассчитываем расстояния
     distances = calculate_distances_to_cameras(sensors)
 
-    # Рекомендации
-    recommendations = recommend_camera_sensor_pairs(distances)
+    # Рекомендации: ближайший датчик из пространственного индекса
+    from spatial_index import SensorIndex
+    recommendations = recommend_camera_sensor_pairs(sensor_index=SensorIndex.from_sensors(sensors))
+
+    # Датчики в секторах обзора камер (PM2.5 вдоль линии зрения)
+    from sightline import camera_cones, sector_weights
+    sightlines = sector_weights(camera_cones(), sensors)
 
     # Сохраняем
-    save_sensor_data(sensors, distances, recommendations)
+    save_sensor_data(sensors, distances, recommendations, sightlines=sightlines)
 
     # Критическая оценка
     print("\n" + "=" * 80)
@@ -0,0 +1,245 @@
+"""
+Партиционированное хранение кадров по времени + индекс для запросов по диапазону
+Раскладка: data/images/<camera_id>/<YYYY>/<MM>/<DD>/<camera_id>_<YYYYmmdd_HHMMSS>.jpg
+Индекс (SQLite, data/images/frame_index.sqlite) отвечает на запрос
+"кадры камеры X между t1 и t2" без обхода директорий
+"""
+
+import os
+import shutil
+import sqlite3
+import argparse
+import threading
+from datetime import datetime, timedelta
+
+from image_archive import TIMESTAMP_FORMAT, format_timestamp, parse_frame_filename
+
+
+DEFAULT_INDEX_FILENAME = "frame_index.sqlite"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS frames (
+    camera_id TEXT NOT NULL,
+    timestamp TEXT NOT NULL,
+    path TEXT NOT NULL,
+    PRIMARY KEY (camera_id, timestamp)
+) WITHOUT ROWID;
+"""
+
+
+def partition_dir(output_dir, camera_id, timestamp):
+    """Директория партиции <camera_id>/<YYYY>/<MM>/<DD> для кадра"""
+    if not isinstance(timestamp, datetime):
+        timestamp = datetime.strptime(str(timestamp), TIMESTAMP_FORMAT)
+    return os.path.join(
+        output_dir, camera_id,
+        f"{timestamp.year:04d}", f"{timestamp.month:02d}", f"{timestamp.day:02d}"
+    )
+
+
+def partitioned_path(output_dir, camera_id, timestamp, ext="jpg"):
+    """Полный путь кадра в партиционированной раскладке"""
+    filename = f"{camera_id}_{format_timestamp(timestamp)}.{ext}"
+    return os.path.join(partition_dir(output_dir, camera_id, timestamp), filename)
+
+
+def winter_season_range(winter_year):
+    """
+    Границы зимнего сезона смога (декабрь-февраль)
+
+    Args:
+        winter_year: год декабря (2025 → 2025-12-01 .. 2026-02-28/29)
+
+    Returns:
+        tuple: (start, end) datetime
+    """
+    start = datetime(winter_year, 12, 1)
+    end = datetime(winter_year + 1, 3, 1) - timedelta(seconds=1)
+    return start, end
+
+
+class FrameIndex:
+    """
+    Индекс кадров (camera_id, timestamp) → путь
+
+    Первичный ключ (camera_id, timestamp) в SQLite - это B-tree,
+    поэтому запрос по диапазону времени - один range scan
+    """
+
+    def __init__(self, index_path=os.path.join("data/images", DEFAULT_INDEX_FILENAME)):
+        self.index_path = index_path
+        os.makedirs(os.path.dirname(index_path) or ".", exist_ok=True)
+
+        self._lock = threading.Lock()
+        # timeout: индекс общий для нескольких процессов-сборщиков (collector_cluster.py)
+        self._conn = sqlite3.connect(index_path, timeout=30, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript(SCHEMA)
+
+    def add(self, camera_id, timestamp, path):
+        self.add_many([(camera_id, timestamp, path)])
+
+    def add_many(self, rows):
+        """
+        Args:
+            rows: iterable (camera_id, timestamp, path)
+        """
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO frames (camera_id, timestamp, path) VALUES (?, ?, ?)",
+                [(camera_id, format_timestamp(ts), path) for camera_id, ts, path in rows]
+            )
+            self._conn.commit()
+
+    def remove(self, camera_id, timestamp):
+        with self._lock:
+            self._conn.execute(
+                "DELETE FROM frames WHERE camera_id = ? AND timestamp = ?",
+                (camera_id, format_timestamp(timestamp))
+            )
+            self._conn.commit()
+
+    def query(self, camera_id, start=None, end=None):
+        """
+        Кадры камеры в диапазоне [start, end]
+
+        Args:
+            start, end: datetime или строки YYYYmmdd_HHMMSS (None = без границы)
+
+        Returns:
+            list: [(timestamp_str, path)] по возрастанию времени
+        """
+        sql = "SELECT timestamp, path FROM frames WHERE camera_id = ?"
+        params = [camera_id]
+        if start is not None:
+            sql += " AND timestamp >= ?"
+            params.append(format_timestamp(start))
+        if end is not None:
+            sql += " AND timestamp <= ?"
+            params.append(format_timestamp(end))
+        sql += " ORDER BY timestamp"
+
+        with self._lock:
+            return self._conn.execute(sql, params).fetchall()
+
+    def query_winter(self, camera_id, winter_year):
+        """Кадры камеры за зимний сезон (декабрь winter_year - февраль)"""
+        return self.query(camera_id, *winter_season_range(winter_year))
+
+    def get(self, camera_id, timestamp):
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT path FROM frames WHERE camera_id = ? AND timestamp = ?",
+                (camera_id, format_timestamp(timestamp))
+            ).fetchone()
+        return row[0] if row else None
+
+    def cameras(self):
+        with self._lock:
+            return [row[0] for row in self._conn.execute("SELECT DISTINCT camera_id FROM frames ORDER BY camera_id")]
+
+    def count(self, camera_id=None):
+        with self._lock:
+            if camera_id is None:
+                return self._conn.execute("SELECT COUNT(*) FROM frames").fetchone()[0]
+            return self._conn.execute(
+                "SELECT COUNT(*) FROM frames WHERE camera_id = ?", (camera_id,)
+            ).fetchone()[0]
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+def migrate_flat_layout(images_dir="data/images", index_path=None, dry_run=False):
+    """
+    Переносит кадры из плоских директорий <camera_id>/*.jpg в партиции
+    <camera_id>/<YYYY>/<MM>/<DD>/ и заносит их в индекс
+
+    Также индексирует кадры, уже лежащие в партициях (повторный запуск безопасен)
+
+    Returns:
+        dict: количество кадров по камерам
+    """
+    index = FrameIndex(index_path or os.path.join(images_dir, DEFAULT_INDEX_FILENAME))
+    migrated = {}
+
+    for camera_id in sorted(os.listdir(images_dir)):
+        camera_dir = os.path.join(images_dir, camera_id)
+        if not os.path.isdir(camera_dir) or camera_id == "metadata":
+            continue
+
+        # Список файлов фиксируется до переноса, иначе перенесённые кадры попадут в обход повторно
+        files = [(root, filename) for root, _, names in os.walk(camera_dir) for filename in names]
+
+        rows = []
+        moved = 0
+        for root, filename in files:
+            parsed = parse_frame_filename(filename)
+            if parsed is None:
+                continue
+
+            _, timestamp_str = parsed
+            source = os.path.join(root, filename)
+            ext = os.path.splitext(filename)[1].lstrip('.')
+            target = partitioned_path(images_dir, camera_id, timestamp_str, ext=ext)
+
+            if os.path.abspath(source) != os.path.abspath(target):
+                moved += 1
+                if not dry_run:
+                    os.makedirs(os.path.dirname(target), exist_ok=True)
+                    shutil.move(source, target)
+
+            rows.append((camera_id, timestamp_str, target))
+
+        if not dry_run:
+            index.add_many(rows)
+
+        migrated[camera_id] = len(rows)
+        print(f"📁 {camera_id}: {len(rows)} кадров (перемещено {moved})")
+
+    index.close()
+    return migrated
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Партиционированная раскладка кадров и индекс по времени')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    migrate_parser = subparsers.add_parser('migrate', help='Перенести плоские директории в партиции')
+    migrate_parser.add_argument('--images', type=str, default='data/images',
+                                help='Директория изображений (default: data/images)')
+    migrate_parser.add_argument('--dry-run', action='store_true',
+                                help='Только показать, что будет перенесено')
+
+    query_parser = subparsers.add_parser('query', help='Кадры камеры за период')
+    query_parser.add_argument('camera_id')
+    query_parser.add_argument('--images', type=str, default='data/images')
+    query_parser.add_argument('--start', type=str, default=None, help='YYYYmmdd_HHMMSS')
+    query_parser.add_argument('--end', type=str, default=None, help='YYYYmmdd_HHMMSS')
+    query_parser.add_argument('--winter', type=int, default=None,
+                              help='Зимний сезон (год декабря), например 2025')
+
+    args = parser.parse_args()
+
+    if args.command == 'migrate':
+        print("=" * 80)
+        print("📁 МИГРАЦИЯ В ПАРТИЦИОНИРОВАННУЮ РАСКЛАДКУ")
+        print("=" * 80)
+        migrated = migrate_flat_layout(args.images, dry_run=args.dry_run)
+        print("-" * 80)
+        print(f"✅ Всего кадров в индексе: {sum(migrated.values())}")
+
+    elif args.command == 'query':
+        index = FrameIndex(os.path.join(args.images, DEFAULT_INDEX_FILENAME))
+        if args.winter is not None:
+            rows = index.query_winter(args.camera_id, args.winter)
+        else:
+            rows = index.query(args.camera_id, args.start, args.end)
+        for timestamp_str, path in rows:
+            print(f"{timestamp_str}  {path}")
+        print(f"\n📊 Найдено кадров: {len(rows)}")
+
+
+if __name__ == "__main__":
+    main()
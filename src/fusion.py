@@ -0,0 +1,316 @@
+"""
+Слияние показаний PM2.5 из нескольких источников в один ряд по городу
+Станции OpenAQ, IQAir и OpenWeatherMap пересекаются по времени, но имеют разную
+частоту и систематическое смещение; датасет брал первый попавшийся pm25
+
+Этапы (на часовой сетке хранилища рядов, см. timeseries_store.py):
+    1. Выравнивание: часовые средние каждого ряда (источник, локация) → матрица час × датчик
+    2. Смещение: для каждого датчика - среднее отклонение от медианы (копится инкрементально, по Хуберу)
+    3. Выбросы: |x - медиана| > k · 1.4826 · MAD в пределах часа → отбрасываются
+    4. Результат: среднее по оставшимся датчикам → ряд fusion/city,
+       исправленные ряды датчиков → fusion_sensor/<источник>/<локация>
+
+Инкрементальность: по журналу изменений хранилища (TimeSeriesStore.changes) пересчитываются
+только бакеты, куда с прошлого запуска записаны показания, - новые, запоздавшие и прошлые
+от backfill. Смещения копятся только по бакетам, которые ещё не сливались (state["fused"])
+"""
+
+import os
+import json
+import argparse
+from datetime import datetime, timezone
+
+import numpy as np
+
+from timeseries_store import TimeSeriesStore, RESOLUTIONS, bucket_start, merge_ranges
+
+
+FUSION_SOURCE = "fusion"
+SENSOR_SOURCE = "fusion_sensor"
+CITY_LOCATION = "city"
+
+STATE_PATH = "data/fusion/state.json"
+
+# Порог выброса в робастных σ (1.4826 · MAD) и минимальный разброс, µg/m³
+MAD_THRESHOLD = 3.5
+MIN_SCALE = 2.0
+MAD_TO_SIGMA = 1.4826
+
+
+def robust_consensus(values, min_sensors=3, threshold=MAD_THRESHOLD, min_scale=MIN_SCALE):
+    """
+    Медиана по строке, робастный разброс и маска выбросов (MAD)
+
+    Args:
+        values: np.array (n_buckets, n_sensors), NaN = нет показания
+
+    Returns:
+        tuple: (median (n_buckets,), scale (n_buckets,) - NaN если датчиков меньше min_sensors,
+                outlier mask (n_buckets, n_sensors))
+    """
+    present = ~np.isnan(values)
+    n_present = present.sum(axis=1)
+
+    median = np.full(len(values), np.nan)
+    scale = np.full(len(values), np.nan)
+    outliers = np.zeros(values.shape, dtype=bool)
+
+    rows = n_present > 0
+    if not rows.any():
+        return median, scale, outliers
+
+    median[rows] = np.nanmedian(values[rows], axis=1)
+    deviation = np.abs(values - median[:, None])
+
+    # MAD имеет смысл только при достаточном числе датчиков в часе
+    robust = n_present >= min_sensors
+    if robust.any():
+        mad = np.nanmedian(deviation[robust], axis=1)
+        scale[robust] = np.maximum(MAD_TO_SIGMA * mad, min_scale)
+        with np.errstate(invalid='ignore'):
+            outliers[robust] = deviation[robust] > threshold * scale[robust, None]
+
+    return median, scale, outliers
+
+
+def input_series(store):
+    """Ряды-источники хранилища: всё, кроме результатов самого слияния - [(source, location)]"""
+    return [
+        (info["source"], info["location"]) for info in store.series()
+        if info["source"] not in (FUSION_SOURCE, SENSOR_SOURCE)
+    ]
+
+
+class FusionEngine:
+    """Инкрементальное слияние рядов PM2.5 хранилища в ряд по городу"""
+
+    def __init__(self, store=None, state_path=STATE_PATH, resolution="hour", min_sensors=3,
+                 mad_threshold=MAD_THRESHOLD):
+        """
+        Args:
+            store: TimeSeriesStore (None = data/timeseries)
+            state_path: Файл состояния (ревизии рядов, слитые бакеты, накопленные смещения датчиков)
+            resolution: Шаг сетки ('hour' или 'day')
+            min_sensors: Минимум датчиков в бакете для оценки смещения и выбросов
+            mad_threshold: Порог выброса в робастных σ
+        """
+        self.store = store if store is not None else TimeSeriesStore()
+        self.state_path = state_path
+        self.resolution = resolution
+        self.step = RESOLUTIONS[resolution]
+        self.min_sensors = min_sensors
+        self.mad_threshold = mad_threshold
+
+        self.state = self._load_state()
+
+    def _load_state(self):
+        state = {"watermark": None, "bias": {}, "revisions": {}, "fused": []}
+        if self.state_path and os.path.exists(self.state_path):
+            with open(self.state_path, 'r', encoding='utf-8') as f:
+                state.update(json.load(f))
+            # Состояние до журнала изменений: слито всё до watermark
+            if not state["fused"] and state["watermark"] is not None:
+                state["fused"] = [[0, state["watermark"]]]
+        return state
+
+    def _save_state(self):
+        if not self.state_path:
+            return
+        os.makedirs(os.path.dirname(self.state_path) or ".", exist_ok=True)
+        with open(self.state_path + ".tmp", 'w', encoding='utf-8') as f:
+            json.dump(self.state, f, indent=2, ensure_ascii=False)
+        os.replace(self.state_path + ".tmp", self.state_path)
+
+    def input_series(self):
+        """Ряды-источники: всё, кроме результатов самого слияния"""
+        return input_series(self.store)
+
+    def align(self, start=None, end=None):
+        """
+        Матрица средних PM2.5 на общей сетке (бакеты в [start, end])
+
+        Returns:
+            tuple: (buckets (n,) int64 секунды, keys [(source, location)], values (n, n_sensors))
+        """
+        keys, columns = [], []
+        for source, location in self.input_series():
+            agg = self.store.aggregate(source, location, start=start, end=end, resolution=self.resolution,
+                                       metrics=["pm25"])
+            has_pm25 = agg["pm25_count"] > 0
+            if has_pm25.any():
+                keys.append((source, location))
+                columns.append((agg["bucket"][has_pm25].astype(np.int64), agg["pm25_mean"][has_pm25]))
+
+        if not keys:
+            return np.empty(0, dtype=np.int64), [], np.empty((0, 0))
+
+        buckets = np.unique(np.concatenate([c[0] for c in columns]))
+        values = np.full((len(buckets), len(keys)), np.nan)
+        for j, (sensor_buckets, means) in enumerate(columns):
+            values[np.searchsorted(buckets, sensor_buckets), j] = means
+
+        return buckets, keys, values
+
+    def _bias_vector(self, keys):
+        bias = np.zeros(len(keys))
+        for j, key in enumerate(keys):
+            stats = self.state["bias"].get("/".join(key))
+            if stats and stats["n"] > 0:
+                bias[j] = stats["sum"] / stats["n"]
+        return bias
+
+    def _update_bias(self, keys, values, new_rows):
+        """
+        Копит отклонения датчиков от консенсуса по новым бакетам
+
+        Отклонение от текущей оценки смещения обрезается до ±k·σ (Huber):
+        разовый выброс почти не сдвигает оценку, а постоянное смещение
+        (которое поначалу целиком выглядит выбросом) набирается за несколько бакетов
+        """
+        block = values[new_rows]
+        if not len(block):
+            return
+
+        bias = self._bias_vector(keys)
+        corrected = block - bias[None, :]
+        median, scale, _ = robust_consensus(corrected, self.min_sensors, self.mad_threshold)
+
+        usable = ~np.isnan(corrected) & ~np.isnan(scale)[:, None]
+        limit = self.mad_threshold * scale[:, None]
+        with np.errstate(invalid='ignore'):
+            clipped = np.clip(corrected - median[:, None], -limit, limit)
+        residual = np.where(usable, bias[None, :] + clipped, 0.0)
+
+        for j, key in enumerate(keys):
+            n = int(usable[:, j].sum())
+            if n == 0:
+                continue
+            stats = self.state["bias"].setdefault("/".join(key), {"sum": 0.0, "n": 0})
+            stats["sum"] += float(residual[:, j].sum())
+            stats["n"] += n
+
+    def fuse(self, keys, values):
+        """
+        Исправление смещения и отбраковка выбросов
+
+        Returns:
+            tuple: (city (n,), corrected (n, n_sensors) с NaN на месте выбросов, число выбросов)
+        """
+        corrected = values - self._bias_vector(keys)[None, :]
+        _, _, outliers = robust_consensus(corrected, self.min_sensors, self.mad_threshold)
+        corrected[outliers] = np.nan
+
+        with np.errstate(invalid='ignore'):
+            counts = (~np.isnan(corrected)).sum(axis=1)
+            city = np.where(counts > 0, np.nansum(corrected, axis=1) / np.maximum(counts, 1), np.nan)
+
+        return city, corrected, int(outliers.sum())
+
+    def _fused_mask(self, buckets):
+        """Бакеты, которые уже сливались (их отклонения уже в смещениях)"""
+        fused = self.state["fused"]
+        if not fused:
+            return np.zeros(len(buckets), dtype=bool)
+        low = np.array([r[0] for r in fused], dtype=np.int64)
+        high = np.array([r[1] for r in fused], dtype=np.int64)
+        pos = np.searchsorted(low, buckets, side='right') - 1
+        return (pos >= 0) & (buckets <= high[np.maximum(pos, 0)])
+
+    def run(self):
+        """
+        Сливает бакеты, в которые с прошлого запуска записаны показания, и пишет результат в хранилище
+
+        Returns:
+            dict: buckets (пересчитано), new_buckets, sensors, outliers
+        """
+        inputs = {source for source, _ in self.input_series()}
+        revisions, changed = self.store.changes(self.state["revisions"], source=inputs)
+        intervals = merge_ranges([(bucket_start(lo, self.step), bucket_start(hi, self.step)) for lo, hi in changed],
+                                 gap=self.step)
+
+        summary = {"buckets": 0, "new_buckets": 0, "sensors": 0, "outliers": 0}
+        for low, high in intervals:
+            buckets, keys, values = self.align(low, high + self.step - 1)
+            if not len(buckets):
+                continue
+
+            new_rows = ~self._fused_mask(buckets)
+            summary["buckets"] += int(len(buckets))
+            summary["new_buckets"] += int(new_rows.sum())
+            summary["sensors"] = max(summary["sensors"], len(keys))
+
+            # Смещения копятся только по новым бакетам (повторное слияние не учитывает их дважды)
+            self._update_bias(keys, values, new_rows)
+            city, corrected, outliers = self.fuse(keys, values)
+            summary["outliers"] += outliers
+
+            # Бакеты - секунды unix (UTC), без перевода в строку и обратно
+            timestamps = buckets.astype(np.int64)
+            self.store.append(FUSION_SOURCE, CITY_LOCATION, [
+                {"timestamp": int(ts), "pm25": float(v)} for ts, v in zip(timestamps, city) if not np.isnan(v)
+            ])
+            for j, (source, location) in enumerate(keys):
+                self.store.append(SENSOR_SOURCE, f"{source}/{location}", [
+                    {"timestamp": int(ts), "pm25": float(v)}
+                    for ts, v in zip(timestamps, corrected[:, j]) if not np.isnan(v)
+                ])
+
+            self.state["fused"] = [list(r) for r in merge_ranges(
+                [tuple(r) for r in self.state["fused"]] + [(low, high)], gap=self.step)]
+            last = int(buckets[-1])
+            self.state["watermark"] = last if self.state["watermark"] is None else max(self.state["watermark"], last)
+
+        self.state["revisions"] = revisions
+        self._save_state()
+        return summary
+
+    def biases(self):
+        """
+        Returns:
+            dict: '<source>/<location>' -> среднее смещение, µg/m³
+        """
+        return {key: stats["sum"] / stats["n"] for key, stats in self.state["bias"].items() if stats["n"]}
+
+
+def fused_pm25(timestamps, store=None, resolution="hour"):
+    """PM2.5 ряда по городу в бакетах заданных моментов (NaN где слияния нет)"""
+    store = store if store is not None else TimeSeriesStore()
+    return store.lookup("pm25", timestamps, source=FUSION_SOURCE, location=CITY_LOCATION, resolution=resolution)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Слияние рядов PM2.5 в ряд по городу')
+    parser.add_argument('--store', type=str, default='data/timeseries', help='Хранилище рядов')
+    parser.add_argument('--state', type=str, default=STATE_PATH, help=f'Файл состояния (default: {STATE_PATH})')
+    parser.add_argument('--resolution', choices=list(RESOLUTIONS), default='hour')
+    parser.add_argument('--min-sensors', type=int, default=3)
+    parser.add_argument('--reset', action='store_true', help='Сбросить состояние и смещения (пересчёт всей истории)')
+    args = parser.parse_args()
+
+    if args.reset and os.path.exists(args.state):
+        os.remove(args.state)
+
+    engine = FusionEngine(
+        TimeSeriesStore(args.store),
+        state_path=args.state,
+        resolution=args.resolution,
+        min_sensors=args.min_sensors
+    )
+    summary = engine.run()
+
+    print("=" * 80)
+    print("🔀 СЛИЯНИЕ ИСТОЧНИКОВ PM2.5")
+    print("=" * 80)
+    print(f"  Датчиков: {summary['sensors']}")
+    print(f"  Бакетов пересчитано: {summary['buckets']} (новых: {summary['new_buckets']})")
+    print(f"  Выбросов отброшено: {summary['outliers']}")
+    if engine.state["watermark"] is not None:
+        watermark = datetime.fromtimestamp(engine.state["watermark"], tz=timezone.utc)
+        print(f"  Watermark: {watermark:%Y-%m-%d %H:%M} UTC")
+    for key, bias in sorted(engine.biases().items()):
+        print(f"  Смещение {key}: {bias:+.1f} µg/m³")
+    print("=" * 80)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,155 @@
+"""
+Дисковый кэш HTTP-ответов API с TTL по источникам и условными запросами
+IQAir nearest_city обновляется раз в час, а collect_all скачивал данные при каждом вызове
+
+    - свежий ответ (моложе TTL источника) отдаётся без запроса и без расхода квоты
+    - устаревший ответ перезапрашивается с If-None-Match / If-Modified-Since,
+      304 Not Modified продлевает жизнь кэшированного ответа
+"""
+
+import os
+import json
+import time
+import hashlib
+import threading
+
+
+# TTL кэша по источникам (секунды) - примерно период обновления данных у источника
+SOURCE_TTLS = {
+    "openaq": 15 * 60,
+    "iqair": 60 * 60,
+    "openweathermap": 10 * 60,
+}
+
+# Параметры, содержащие секреты: в ключ кэша идут только в виде хэша
+SECRET_PARAMS = ("key", "appid", "api_key", "token")
+
+
+class CachedResponse:
+    """Минимальный аналог requests.Response для ответа из кэша"""
+
+    def __init__(self, status_code, content, headers, from_cache=True):
+        self.status_code = status_code
+        self.content = content
+        self.headers = headers
+        self.from_cache = from_cache
+
+    @property
+    def text(self):
+        return self.content.decode('utf-8', errors='replace')
+
+    def json(self):
+        return json.loads(self.content)
+
+
+def cache_key(url, params=None):
+    """Ключ кэша: URL + отсортированные параметры (секреты хэшируются)"""
+    items = []
+    for name, value in sorted((params or {}).items()):
+        if name in SECRET_PARAMS:
+            value = hashlib.sha1(str(value).encode('utf-8')).hexdigest()[:8]
+        items.append(f"{name}={value}")
+    return hashlib.sha1(f"{url}?{'&'.join(items)}".encode('utf-8')).hexdigest()
+
+
+class ResponseCache:
+    """Кэш ответов: data/cache/http/<key>.json (метаданные) + <key>.body"""
+
+    def __init__(self, cache_dir="data/cache/http", ttls=None):
+        self.cache_dir = cache_dir
+        self.ttls = dict(SOURCE_TTLS, **(ttls or {}))
+        self._lock = threading.Lock()
+        self.stats = {"hits": 0, "revalidated": 0, "misses": 0}
+
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def _paths(self, key):
+        base = os.path.join(self.cache_dir, key)
+        return base + ".json", base + ".body"
+
+    def _load(self, key):
+        meta_path, body_path = self._paths(key)
+        if not os.path.exists(meta_path) or not os.path.exists(body_path):
+            return None, None
+        with open(meta_path, 'r', encoding='utf-8') as f:
+            meta = json.load(f)
+        with open(body_path, 'rb') as f:
+            body = f.read()
+        return meta, body
+
+    def _store(self, key, meta, body=None):
+        meta_path, body_path = self._paths(key)
+        # Свой временный файл на поток: один ключ могут сохранять параллельные запросы
+        suffix = f".{os.getpid()}.{threading.get_ident()}.tmp"
+        if body is not None:
+            with open(body_path + suffix, 'wb') as f:
+                f.write(body)
+            os.replace(body_path + suffix, body_path)
+        with open(meta_path + suffix, 'w', encoding='utf-8') as f:
+            json.dump(meta, f)
+        os.replace(meta_path + suffix, meta_path)
+
+    def _count(self, name):
+        with self._lock:
+            self.stats[name] += 1
+
+    def get_fresh(self, source, url, params=None):
+        """
+        Свежий ответ из кэша (моложе TTL источника)
+
+        Returns:
+            CachedResponse или None
+        """
+        meta, body = self._load(cache_key(url, params))
+        if meta is None:
+            return None
+
+        if time.time() - meta["stored_at"] < self.ttls.get(source, 0):
+            self._count("hits")
+            return CachedResponse(meta["status_code"], body, meta["headers"])
+        return None
+
+    def fetch(self, session, source, url, params=None, timeout=10):
+        """
+        Запрос с условными заголовками; успешный ответ сохраняется в кэш
+
+        Returns:
+            requests.Response (новые данные) или CachedResponse (304 / из кэша)
+        """
+        key = cache_key(url, params)
+        meta, body = self._load(key)
+
+        headers = {}
+        if meta is not None:
+            if meta["headers"].get("ETag"):
+                headers["If-None-Match"] = meta["headers"]["ETag"]
+            if meta["headers"].get("Last-Modified"):
+                headers["If-Modified-Since"] = meta["headers"]["Last-Modified"]
+
+        response = session.get(url, params=params, headers=headers, timeout=timeout)
+
+        if response.status_code == 304 and meta is not None:
+            # Данные не изменились - продлеваем кэш
+            self._count("revalidated")
+            meta["stored_at"] = time.time()
+            self._store(key, meta)
+            return CachedResponse(meta["status_code"], body, meta["headers"])
+
+        self._count("misses")
+        if response.status_code == 200:
+            kept_headers = {
+                name: response.headers[name]
+                for name in ("ETag", "Last-Modified", "Content-Type")
+                if name in response.headers
+            }
+            self._store(key, {
+                "url": url,
+                # Параметры без секретов: по ним replay_server.py различает страницы и периоды
+                "params": {name: str(value) for name, value in (params or {}).items() if name not in SECRET_PARAMS},
+                "source": source,
+                "status_code": 200,
+                "stored_at": time.time(),
+                "headers": kept_headers
+            }, response.content)
+
+        return response
@@ -0,0 +1,558 @@
+"""
+Шардированный архив кадров вместо миллионов мелких JPEG-файлов
+Кадры пишутся в tar-шарды фиксированного размера + индекс смещений (index.jsonl)
+Отдельный кадр читается по (camera_id, timestamp) без распаковки архива
+
+Структура:
+    data/archive/<camera_id>/shard_000001.tar
+    data/archive/<camera_id>/shard_000002.tar
+    data/archive/<camera_id>/index.jsonl
+    data/archive/<camera_id>/features.jsonl   (признаки кадров, см. retention.py)
+"""
+
+import os
+import io
+import json
+import bisect
+import tarfile
+import threading
+import argparse
+from datetime import datetime
+
+from file_lock import FileLock
+
+
+TIMESTAMP_FORMAT = '%Y%m%d_%H%M%S'
+DEFAULT_SHARD_SIZE_MB = 256
+INDEX_FILENAME = "index.jsonl"
+FEATURES_FILENAME = "features.jsonl"
+
+
+def format_timestamp(timestamp):
+    """Приводит datetime или строку к ключу вида YYYYmmdd_HHMMSS"""
+    if isinstance(timestamp, datetime):
+        return timestamp.strftime(TIMESTAMP_FORMAT)
+    return str(timestamp)
+
+
+def parse_frame_filename(filename):
+    """
+    Разбирает имя файла кадра <camera_id>_<YYYYmmdd>_<HHMMSS>.jpg
+
+    Returns:
+        tuple: (camera_id, timestamp_str) или None если имя не подходит
+    """
+    stem, ext = os.path.splitext(os.path.basename(filename))
+    if ext.lower() not in ('.jpg', '.jpeg', '.png'):
+        return None
+
+    parts = stem.rsplit('_', 2)
+    if len(parts) != 3:
+        return None
+
+    camera_id, date_part, time_part = parts
+    timestamp_str = f"{date_part}_{time_part}"
+    try:
+        datetime.strptime(timestamp_str, TIMESTAMP_FORMAT)
+    except ValueError:
+        return None
+
+    return camera_id, timestamp_str
+
+
+def shard_filename(shard_number):
+    return f"shard_{shard_number:06d}.tar"
+
+
+def _read_jsonl_latest(path):
+    """
+    Читает JSONL-файл с записями по timestamp: последняя запись побеждает
+
+    Недописанные строки (сбой посреди записи) пропускаются
+    """
+    latest = {}
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                entry = json.loads(line)
+            except json.JSONDecodeError:
+                continue
+            latest[entry["timestamp"]] = entry
+    return latest
+
+
+def index_lock(archive_dir, camera_id):
+    """
+    Блокировка индекса камеры: индекс дописывают сборщик (ShardedArchiveWriter)
+    и компакция (retention.py) из разных процессов
+    """
+    return FileLock(os.path.join(archive_dir, camera_id, INDEX_FILENAME + ".lock"))
+
+
+def append_index_entries(archive_dir, camera_id, entries):
+    """
+    Дописывает записи в индекс камеры (например, после компакции шарда)
+
+    Индекс append-only: новая запись для того же timestamp заменяет старую
+    """
+    lines = "".join(
+        json.dumps({k: v for k, v in entry.items() if k != "camera_id"}) + "\n"
+        for entry in entries
+    )
+    index_path = os.path.join(archive_dir, camera_id, INDEX_FILENAME)
+    with index_lock(archive_dir, camera_id):
+        with open(index_path, 'a', encoding='utf-8') as f:
+            f.write(lines)
+
+
+def tar_padded_size(size):
+    """Размер данных члена tar с выравниванием на блоки"""
+    blocks, remainder = divmod(size, tarfile.BLOCKSIZE)
+    if remainder > 0:
+        blocks += 1
+    return blocks * tarfile.BLOCKSIZE
+
+
+def terminate_shard(path):
+    """
+    Проверяет, что tar-шард можно открыть на дозапись, и при необходимости чинит его
+
+    - есть блок конца архива - ничего не делает
+    - файл кончается сразу после члена - дописывает блоки конца архива
+    - последний член записан не полностью - обрезает его и дописывает блоки конца
+
+    Returns:
+        bool: False если заголовок внутри файла повреждён (шард не трогается)
+    """
+    size = os.path.getsize(path)
+    with open(path, 'r+b') as f:
+        offset = 0
+        while offset + tarfile.BLOCKSIZE <= size:
+            f.seek(offset)
+            header = f.read(tarfile.BLOCKSIZE)
+            if header.count(0) == tarfile.BLOCKSIZE:
+                return True
+            try:
+                info = tarfile.TarInfo.frombuf(header, tarfile.ENCODING, "surrogateescape")
+            except tarfile.HeaderError:
+                return False
+            end = offset + tarfile.BLOCKSIZE + tar_padded_size(info.size)
+            if end > size:
+                break
+            offset = end
+
+        # Хвост (неполный заголовок или данные члена) обрезается
+        f.truncate(offset)
+        f.seek(offset)
+        f.write(b"\0" * (2 * tarfile.BLOCKSIZE))
+    return True
+
+
+class ShardedArchiveWriter:
+    """
+    Запись кадров в tar-шарды фиксированного размера
+
+    Потокобезопасен: MultiCameraCapture пишет кадры из нескольких потоков
+    """
+
+    def __init__(self, archive_dir="data/archive", shard_size_mb=DEFAULT_SHARD_SIZE_MB, guard=None):
+        """
+        Args:
+            archive_dir: Базовая директория архива
+            shard_size_mb: Размер шарда, после которого открывается новый (МБ)
+            guard: f(camera_id) -> bool - можно ли сейчас писать камеру (в кластере -
+                   CollectorWorker.holds); проверяется под блокировкой записи, поэтому
+                   кадр, снятый до передачи камеры, не допишется в шард нового владельца
+        """
+        self.archive_dir = archive_dir
+        self.shard_size_bytes = int(shard_size_mb * 1024 * 1024)
+        self.guard = guard
+
+        # camera_id -> {"number", "tar", "index"}
+        self._open_shards = {}
+        self._lock = threading.Lock()
+
+        os.makedirs(archive_dir, exist_ok=True)
+
+    def _camera_dir(self, camera_id):
+        return os.path.join(self.archive_dir, camera_id)
+
+    def _last_shard_number(self, camera_id):
+        camera_dir = self._camera_dir(camera_id)
+        numbers = [
+            int(name[len("shard_"):-len(".tar")])
+            for name in os.listdir(camera_dir)
+            if name.startswith("shard_") and name.endswith(".tar")
+        ]
+        return max(numbers) if numbers else 0
+
+    def _get_shard(self, camera_id):
+        """Открывает текущий шард камеры (или создаёт новый)"""
+        state = self._open_shards.get(camera_id)
+
+        if state is not None and state["tar"].offset >= self.shard_size_bytes:
+            state["tar"].close()
+            state = self._open_new_shard(camera_id, state["number"] + 1, state["index"])
+
+        if state is None:
+            camera_dir = self._camera_dir(camera_id)
+            os.makedirs(camera_dir, exist_ok=True)
+
+            index_file = open(os.path.join(camera_dir, INDEX_FILENAME), 'a', encoding='utf-8')
+            number = max(self._last_shard_number(camera_id), 1)
+
+            shard_path = os.path.join(camera_dir, shard_filename(number))
+            if os.path.exists(shard_path) and os.path.getsize(shard_path) >= self.shard_size_bytes:
+                number += 1
+
+            state = self._open_new_shard(camera_id, number, index_file)
+
+        return state
+
+    def _open_new_shard(self, camera_id, number, index_file):
+        shard_path = os.path.join(self._camera_dir(camera_id), shard_filename(number))
+
+        # Шард мог остаться без блоков конца архива (сбой, kill -9, аренда ушла
+        # другому сборщику): хвост обрезается по последнему целому члену,
+        # повреждённый шард не трогается - пишем в следующий
+        while os.path.exists(shard_path) and not terminate_shard(shard_path):
+            print(f"⚠️  Шард {shard_path} повреждён, открывается следующий")
+            number += 1
+            shard_path = os.path.join(self._camera_dir(camera_id), shard_filename(number))
+
+        tar = tarfile.open(shard_path, 'a', format=tarfile.USTAR_FORMAT)
+        state = {"number": number, "tar": tar, "index": index_file,
+                 "index_lock": index_lock(self.archive_dir, camera_id)}
+        self._open_shards[camera_id] = state
+        return state
+
+    def append(self, camera_id, timestamp, data, ext="jpg"):
+        """
+        Добавляет кадр в архив
+
+        Args:
+            camera_id: ID камеры
+            timestamp: datetime или строка YYYYmmdd_HHMMSS
+            data: bytes закодированного изображения
+            ext: расширение (формат) изображения
+
+        Returns:
+            dict: запись индекса (shard, offset, size)
+        """
+        timestamp_str = format_timestamp(timestamp)
+        member_name = f"{camera_id}_{timestamp_str}.{ext}"
+
+        with self._lock:
+            if self.guard is not None and not self.guard(camera_id):
+                raise RuntimeError(f"Камера {camera_id} передана другому сборщику, кадр не записан")
+            state = self._get_shard(camera_id)
+            tar = state["tar"]
+
+            info = tarfile.TarInfo(name=member_name)
+            info.size = len(data)
+            info.mtime = int(datetime.now().timestamp())
+            tar.addfile(info, io.BytesIO(data))
+            tar.fileobj.flush()
+
+            entry = {
+                "timestamp": timestamp_str,
+                "shard": shard_filename(state["number"]),
+                "offset": tar.offset - tar_padded_size(len(data)),
+                "size": len(data),
+                "ext": ext
+            }
+
+            # Индекс пишется после данных: при сбое теряется только "лишний" член tar
+            with state["index_lock"]:
+                state["index"].write(json.dumps(entry) + "\n")
+                state["index"].flush()
+
+        return dict(entry, camera_id=camera_id)
+
+    def close_camera(self, camera_id, terminate=True):
+        """
+        Закрывает текущий шард камеры; следующий append откроет его заново с диска
+
+        Args:
+            terminate: Дописать блоки конца архива. False - только отпустить файл
+                       (в шард уже пишет другой процесс, старое смещение неактуально)
+        """
+        with self._lock:
+            state = self._open_shards.pop(camera_id, None)
+            if state is None:
+                return
+            if terminate:
+                state["tar"].close()
+            else:
+                state["tar"].fileobj.close()
+                state["tar"].closed = True
+            state["index"].close()
+
+    def cameras(self):
+        """Камеры с открытым шардом"""
+        with self._lock:
+            return list(self._open_shards)
+
+    def close(self):
+        for camera_id in self.cameras():
+            self.close_camera(camera_id)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+class ShardedArchiveReader:
+    """Произвольный доступ к кадрам архива по (camera_id, timestamp)"""
+
+    def __init__(self, archive_dir="data/archive"):
+        self.archive_dir = archive_dir
+
+        # camera_id -> (sorted timestamps, entries, index mtime)
+        self._indexes = {}
+
+    def cameras(self):
+        """Список камер, для которых есть архив"""
+        if not os.path.isdir(self.archive_dir):
+            return []
+        return sorted(
+            name for name in os.listdir(self.archive_dir)
+            if os.path.exists(os.path.join(self.archive_dir, name, INDEX_FILENAME))
+        )
+
+    def _load_index(self, camera_id):
+        """Загружает индекс камеры (перечитывает, если файл изменился)"""
+        index_path = os.path.join(self.archive_dir, camera_id, INDEX_FILENAME)
+        if not os.path.exists(index_path):
+            return [], []
+
+        mtime = os.path.getmtime(index_path)
+        cached = self._indexes.get(camera_id)
+        if cached is not None and cached[2] == mtime:
+            return cached[0], cached[1]
+
+        # Последняя запись для timestamp побеждает (перезапись при компакции)
+        latest = _read_jsonl_latest(index_path)
+
+        timestamps = sorted(latest)
+        entries = [latest[ts] for ts in timestamps]
+        self._indexes[camera_id] = (timestamps, entries, mtime)
+        return timestamps, entries
+
+    def list_frames(self, camera_id, start=None, end=None):
+        """
+        Записи индекса камеры в диапазоне [start, end]
+
+        Args:
+            start, end: datetime или строки YYYYmmdd_HHMMSS (None = без границы)
+        """
+        timestamps, entries = self._load_index(camera_id)
+        lo = bisect.bisect_left(timestamps, format_timestamp(start)) if start else 0
+        hi = bisect.bisect_right(timestamps, format_timestamp(end)) if end else len(timestamps)
+        return [dict(entry, camera_id=camera_id) for entry in entries[lo:hi]]
+
+    def get_entry(self, camera_id, timestamp):
+        timestamps, entries = self._load_index(camera_id)
+        timestamp_str = format_timestamp(timestamp)
+        pos = bisect.bisect_left(timestamps, timestamp_str)
+        if pos < len(timestamps) and timestamps[pos] == timestamp_str:
+            return dict(entries[pos], camera_id=camera_id)
+        return None
+
+    def read_entry(self, entry):
+        """Читает байты кадра по записи индекса (seek + read, без распаковки)"""
+        shard_path = os.path.join(self.archive_dir, entry["camera_id"], entry["shard"])
+        with open(shard_path, 'rb') as f:
+            f.seek(entry["offset"])
+            return f.read(entry["size"])
+
+    def get_frame(self, camera_id, timestamp):
+        """
+        Returns:
+            bytes: закодированное изображение или None если кадра нет
+        """
+        entry = self.get_entry(camera_id, timestamp)
+        if entry is None:
+            return None
+        return self.read_entry(entry)
+
+    def load_image(self, camera_id, timestamp):
+        """Декодирует кадр в numpy array (BGR) через OpenCV"""
+        import cv2
+        import numpy as np
+
+        data = self.get_frame(camera_id, timestamp)
+        if data is None:
+            return None
+        return cv2.imdecode(np.frombuffer(data, dtype=np.uint8), cv2.IMREAD_COLOR)
+
+    def stats(self):
+        """Статистика архива по камерам"""
+        result = {}
+        for camera_id in self.cameras():
+            timestamps, _ = self._load_index(camera_id)
+            camera_dir = os.path.join(self.archive_dir, camera_id)
+            shards = [n for n in os.listdir(camera_dir) if n.endswith(".tar")]
+            result[camera_id] = {
+                "frames": len(timestamps),
+                "shards": len(shards),
+                "bytes": sum(os.path.getsize(os.path.join(camera_dir, n)) for n in shards),
+                "first": timestamps[0] if timestamps else None,
+                "last": timestamps[-1] if timestamps else None
+            }
+        return result
+
+
+class FrameFeatureStore:
+    """
+    Признаки кадров (метрики качества и т.п.), посчитанные по полному разрешению
+
+    Хранятся отдельно от изображений, поэтому остаются валидными после компакции
+    """
+
+    def __init__(self, archive_dir="data/archive"):
+        self.archive_dir = archive_dir
+        self._cache = {}
+        self._lock = threading.Lock()
+
+    def _path(self, camera_id):
+        return os.path.join(self.archive_dir, camera_id, FEATURES_FILENAME)
+
+    def _load(self, camera_id):
+        path = self._path(camera_id)
+        if not os.path.exists(path):
+            return {}
+
+        mtime = os.path.getmtime(path)
+        cached = self._cache.get(camera_id)
+        if cached is not None and cached[1] == mtime:
+            return cached[0]
+
+        latest = _read_jsonl_latest(path)
+        self._cache[camera_id] = (latest, mtime)
+        return latest
+
+    def get(self, camera_id, timestamp):
+        """
+        Returns:
+            dict: признаки кадра или None
+        """
+        entry = self._load(camera_id).get(format_timestamp(timestamp))
+        return entry["features"] if entry else None
+
+    def put(self, camera_id, timestamp, features):
+        """Сохраняет признаки кадра (dict с JSON-совместимыми значениями)"""
+        entry = {"timestamp": format_timestamp(timestamp), "features": features}
+        os.makedirs(os.path.join(self.archive_dir, camera_id), exist_ok=True)
+        with self._lock:
+            with open(self._path(camera_id), 'a', encoding='utf-8') as f:
+                f.write(json.dumps(entry) + "\n")
+
+    def all(self, camera_id):
+        """dict: timestamp -> признаки"""
+        return {ts: entry["features"] for ts, entry in self._load(camera_id).items()}
+
+
+def migrate_directory(images_dir="data/images", archive_dir="data/archive",
+                      shard_size_mb=DEFAULT_SHARD_SIZE_MB, delete_source=False):
+    """
+    Конвертирует плоские директории data/images/<camera_id>/*.jpg в архив
+
+    Повторный запуск безопасен: уже заархивированные кадры пропускаются
+
+    Returns:
+        dict: количество перенесённых кадров по камерам
+    """
+    reader = ShardedArchiveReader(archive_dir)
+    migrated = {}
+
+    with ShardedArchiveWriter(archive_dir, shard_size_mb=shard_size_mb) as writer:
+        for camera_id in sorted(os.listdir(images_dir)):
+            camera_dir = os.path.join(images_dir, camera_id)
+            if not os.path.isdir(camera_dir) or camera_id == "metadata":
+                continue
+
+            count = 0
+            for root, _, files in os.walk(camera_dir):
+                for filename in sorted(files):
+                    parsed = parse_frame_filename(filename)
+                    if parsed is None:
+                        continue
+
+                    _, timestamp_str = parsed
+                    filepath = os.path.join(root, filename)
+
+                    if reader.get_entry(camera_id, timestamp_str) is None:
+                        with open(filepath, 'rb') as f:
+                            data = f.read()
+                        ext = os.path.splitext(filename)[1].lstrip('.').lower()
+                        writer.append(camera_id, timestamp_str, data, ext=ext)
+                        count += 1
+
+                    if delete_source:
+                        os.remove(filepath)
+
+            migrated[camera_id] = count
+            print(f"📦 {camera_id}: перенесено {count} кадров")
+
+    return migrated
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Шардированный архив кадров')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    migrate_parser = subparsers.add_parser('migrate', help='Конвертировать директории с JPEG в архив')
+    migrate_parser.add_argument('--images', type=str, default='data/images',
+                                help='Исходная директория (default: data/images)')
+    migrate_parser.add_argument('--archive', type=str, default='data/archive',
+                                help='Директория архива (default: data/archive)')
+    migrate_parser.add_argument('--shard-size', type=int, default=DEFAULT_SHARD_SIZE_MB,
+                                help=f'Размер шарда в МБ (default: {DEFAULT_SHARD_SIZE_MB})')
+    migrate_parser.add_argument('--delete-source', action='store_true',
+                                help='Удалять исходные файлы после переноса')
+
+    stats_parser = subparsers.add_parser('stats', help='Статистика архива')
+    stats_parser.add_argument('--archive', type=str, default='data/archive')
+
+    get_parser = subparsers.add_parser('get', help='Извлечь один кадр')
+    get_parser.add_argument('camera_id')
+    get_parser.add_argument('timestamp', help='YYYYmmdd_HHMMSS')
+    get_parser.add_argument('--archive', type=str, default='data/archive')
+    get_parser.add_argument('--output', type=str, required=True)
+
+    args = parser.parse_args()
+
+    if args.command == 'migrate':
+        print("=" * 80)
+        print("📦 МИГРАЦИЯ КАДРОВ В ШАРДИРОВАННЫЙ АРХИВ")
+        print("=" * 80)
+        migrated = migrate_directory(args.images, args.archive, args.shard_size, args.delete_source)
+        print("-" * 80)
+        print(f"✅ Всего перенесено: {sum(migrated.values())} кадров")
+
+    elif args.command == 'stats':
+        for camera_id, info in ShardedArchiveReader(args.archive).stats().items():
+            print(f"\n[{camera_id}]")
+            print(f"  Кадров: {info['frames']}")
+            print(f"  Шардов: {info['shards']}")
+            print(f"  Размер: {info['bytes'] / 1024 / 1024:.1f} МБ")
+            print(f"  Период: {info['first']} — {info['last']}")
+
+    elif args.command == 'get':
+        data = ShardedArchiveReader(args.archive).get_frame(args.camera_id, args.timestamp)
+        if data is None:
+            print(f"❌ Кадр не найден: {args.camera_id} @ {args.timestamp}")
+            return
+        with open(args.output, 'wb') as f:
+            f.write(data)
+        print(f"✅ Кадр сохранён: {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,283 @@
+"""
+Пространственная интерполяция PM2.5 вдоль линий зрения камер
+Целевой PM2.5 брался с одного ближайшего датчика (sensor_locations.json), хотя
+видимость интегрирует PM2.5 вдоль всей линии зрения
+
+Для каждой камеры в её секторе обзора (sightline.py) берутся точки вдоль нескольких
+лучей; PM2.5 в точках оценивается по всем датчикам, затем усредняется по камере:
+    - IDW (обратные расстояния в степени power)
+    - простой кригинг (экспоненциальная ковариация + nugget)
+
+Геометрические веса считаются один раз на набор датчиков и камер и кэшируются;
+на каждом шаге меняются только показания: оценка (время × камера) для всего
+периода - несколько матричных умножений. Пропуски показаний датчиков
+обрабатываются перенормировкой весов (IDW) или весами по маске пропусков (кригинг)
+"""
+
+import argparse
+
+import numpy as np
+
+from find_sensors import haversine_matrix
+from sightline import camera_cones, destination_point
+from timeseries_store import RESOLUTIONS, bucket_start, to_epoch_array
+
+
+SENSOR_SOURCE = "openaq"
+METHODS = ("idw", "kriging")
+
+# Значения pm25_source в dataset.py: целевой PM2.5 вдоль линии зрения камеры образца
+LABEL_SOURCES = {"sightline": "idw", "sightline_kriging": "kriging"}
+
+DEFAULT_POWER = 2.0
+DEFAULT_LENGTH_SCALE_KM = 3.0
+DEFAULT_NUGGET = 0.1
+POINTS_PER_RAY = 8
+RAYS_PER_CONE = 3
+MIN_DISTANCE_KM = 0.05  # Точка на датчике: вес IDW не уходит в бесконечность
+
+_INTERPOLATORS = {}
+
+
+def sightline_points(cone, points_per_ray=POINTS_PER_RAY, rays=RAYS_PER_CONE):
+    """
+    Точки вдоль лучей сектора обзора (для вращающейся камеры - лучи по кругу)
+
+    Returns:
+        tuple: (lats, lons) массивы (rays * points_per_ray,)
+    """
+    if cone.is_full_circle:
+        bearings = np.linspace(0, 360, max(rays, 4), endpoint=False)
+    elif rays == 1:
+        bearings = np.array([cone.heading])
+    else:
+        bearings = cone.heading + np.linspace(-cone.fov / 2, cone.fov / 2, rays + 2)[1:-1]
+
+    depths = cone.depth_km * np.arange(1, points_per_ray + 1) / points_per_ray
+    return destination_point(cone.lat, cone.lon, np.repeat(bearings, len(depths)), np.tile(depths, len(bearings)))
+
+
+class SightlineInterpolator:
+    """Оценка PM2.5 вдоль линий зрения: показания датчиков (время × датчик) -> (время × камера)"""
+
+    def __init__(self, sensors, cones, method="idw", power=DEFAULT_POWER,
+                 length_scale_km=DEFAULT_LENGTH_SCALE_KM, nugget=DEFAULT_NUGGET,
+                 points_per_ray=POINTS_PER_RAY, rays=RAYS_PER_CONE):
+        """
+        Args:
+            sensors: Датчики (name, latitude, longitude) - порядок столбцов показаний
+            cones: sightline.ViewingCone камер - порядок столбцов результата
+            method: 'idw' или 'kriging'
+            power: Степень IDW
+            length_scale_km, nugget: Параметры ковариации кригинга (nugget - доля дисперсии)
+        """
+        if method not in METHODS:
+            raise ValueError(f"Неизвестный метод интерполяции: {method}")
+
+        self.sensors = sensors
+        self.cones = cones
+        self.camera_ids = [cone.camera_id for cone in cones]
+        self.method = method
+        self.power = power
+        self.length_scale_km = length_scale_km
+        self.nugget = nugget
+
+        sensor_lat = np.array([s["latitude"] for s in sensors], dtype=np.float64)
+        sensor_lon = np.array([s["longitude"] for s in sensors], dtype=np.float64)
+
+        point_lats, point_lons, owners = [], [], []
+        for column, cone in enumerate(cones):
+            lats, lons = sightline_points(cone, points_per_ray, rays)
+            point_lats.append(lats)
+            point_lons.append(lons)
+            owners.append(np.full(len(lats), column))
+        point_lat = np.concatenate(point_lats)
+        point_lon = np.concatenate(point_lons)
+        owner = np.concatenate(owners)
+
+        # Геометрия (не зависит от показаний)
+        self.point_distances = np.maximum(
+            haversine_matrix(point_lat, point_lon, sensor_lat, sensor_lon), MIN_DISTANCE_KM
+        )
+        self.sensor_distances = haversine_matrix(sensor_lat, sensor_lon, sensor_lat, sensor_lon)
+
+        # Точки -> камеры: (камеры, точки), строки - доли точек камеры
+        self.groups = (owner[None, :] == np.arange(len(cones))[:, None]).astype(np.float64)
+
+        self.idw_weights = self.point_distances ** -power
+        self._kriging_weights = {}
+
+    def _covariance(self, distances):
+        return np.exp(-distances / self.length_scale_km)
+
+    def kriging_weights(self, present):
+        """
+        Веса простого кригинга (точки × датчики) для маски имеющихся показаний
+        Кэшируются по маске: набор работающих датчиков меняется редко
+        """
+        key = present.tobytes()
+        weights = self._kriging_weights.get(key)
+        if weights is None:
+            weights = np.zeros_like(self.point_distances)
+            idx = np.flatnonzero(present)
+            if idx.size:
+                K = self._covariance(self.sensor_distances[np.ix_(idx, idx)]) + self.nugget * np.eye(idx.size)
+                k_star = self._covariance(self.point_distances[:, idx])
+                weights[:, idx] = np.linalg.solve(K, k_star.T).T
+            self._kriging_weights[key] = weights
+        return weights
+
+    def estimate_points(self, readings):
+        """
+        PM2.5 в точках линий зрения
+
+        Args:
+            readings: (время, датчики), NaN - нет показания
+
+        Returns:
+            np.ndarray: (время, точки), NaN если в момент нет ни одного показания
+        """
+        readings = np.atleast_2d(np.asarray(readings, dtype=np.float64))
+        present = ~np.isnan(readings)
+        values = np.where(present, readings, 0.0)
+
+        if self.method == "idw":
+            numerator = values @ self.idw_weights.T
+            denominator = present.astype(np.float64) @ self.idw_weights.T
+            with np.errstate(invalid='ignore', divide='ignore'):
+                return np.where(denominator > 0, numerator / denominator, np.nan)
+
+        # Кригинг: остатки от среднего момента, веса по маске пропусков (моменты с одной маской - одним умножением)
+        counts = present.sum(axis=1)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            means = np.where(counts > 0, values.sum(axis=1) / counts, np.nan)
+        residuals = np.where(present, readings - means[:, None], 0.0)
+
+        estimates = np.full((len(readings), self.point_distances.shape[0]), np.nan)
+        masks, inverse = np.unique(present, axis=0, return_inverse=True)
+        inverse = inverse.reshape(-1)
+        for pattern_index, mask in enumerate(masks):
+            if not mask.any():
+                continue
+            rows = np.flatnonzero(inverse == pattern_index)
+            weights = self.kriging_weights(mask)
+            estimates[rows] = means[rows, None] + residuals[rows] @ weights.T
+        return estimates
+
+    def estimate(self, readings):
+        """
+        PM2.5 вдоль линии зрения каждой камеры (среднее по точкам сектора)
+
+        Returns:
+            np.ndarray: (время, камеры)
+        """
+        points = self.estimate_points(readings)
+        known = ~np.isnan(points)
+        numerator = np.where(known, points, 0.0) @ self.groups.T
+        denominator = known.astype(np.float64) @ self.groups.T
+        with np.errstate(invalid='ignore', divide='ignore'):
+            return np.where(denominator > 0, numerator / denominator, np.nan)
+
+
+def get_interpolator(sensors, cones, method="idw", **kwargs):
+    """Интерполятор из кэша: геометрические веса пересчитываются только при смене датчиков/камер"""
+    key = (
+        tuple((s["name"], s["latitude"], s["longitude"]) for s in sensors),
+        tuple((c.camera_id, c.lat, c.lon, c.heading, c.fov, c.depth_km) for c in cones),
+        method,
+        tuple(sorted(kwargs.items())),
+    )
+    interpolator = _INTERPOLATORS.get(key)
+    if interpolator is None:
+        interpolator = SightlineInterpolator(sensors, cones, method, **kwargs)
+        _INTERPOLATORS[key] = interpolator
+    return interpolator
+
+
+def sensor_readings(store, sensors, timestamps, source=SENSOR_SOURCE, resolution="hour"):
+    """
+    Показания датчиков из хранилища рядов (среднее в бакете каждого момента)
+
+    Ряды живого опроса и backfill одной локации объединяются (sensor_catalog.series_locations)
+
+    Returns:
+        np.ndarray: (время, датчики), NaN где показаний нет
+    """
+    from sensor_catalog import series_locations
+
+    readings = np.full((len(timestamps), len(sensors)), np.nan)
+    for column, sensor in enumerate(sensors):
+        readings[:, column] = store.lookup('pm25', timestamps, source=source, location=series_locations(sensor),
+                                           resolution=resolution)
+    return readings
+
+
+def sightline_matrix(store, timestamps, sensors=None, cones=None, method="idw", resolution="hour", **kwargs):
+    """
+    Матрица PM2.5 (время × камера) вдоль линий зрения
+
+    Returns:
+        tuple: (np.ndarray (время, камеры), список camera_id)
+    """
+    if sensors is None:
+        from sensor_catalog import load_sensors
+        sensors = load_sensors(refresh=False)
+    cones = cones if cones is not None else camera_cones()
+
+    interpolator = get_interpolator(sensors, cones, method, **kwargs)
+    readings = sensor_readings(store, sensors, timestamps, resolution=resolution)
+    return interpolator.estimate(readings), interpolator.camera_ids
+
+
+def sightline_labels(store, timestamps, camera_ids, method="idw", resolution="hour", sensors=None, cones=None):
+    """
+    Целевой PM2.5 для образцов: оценка вдоль линии зрения камеры образца
+
+    Матрица считается по уникальным бакетам времени, затем берётся столбец камеры образца
+
+    Returns:
+        np.ndarray (n,), NaN для камер без сектора обзора и моментов без показаний
+    """
+    step = RESOLUTIONS[resolution]
+    epochs = to_epoch_array(timestamps)
+    if len(epochs) == 0:
+        return np.empty(0)
+
+    buckets, bucket_index = np.unique(bucket_start(epochs, step), return_inverse=True)
+    matrix, columns = sightline_matrix(store, buckets, sensors, cones, method, resolution)
+
+    column_of = {camera_id: column for column, camera_id in enumerate(columns)}
+    camera_column = np.array([column_of.get(camera_id, -1) for camera_id in camera_ids])
+    labels = matrix[bucket_index.reshape(-1), np.maximum(camera_column, 0)]
+    return np.where(camera_column >= 0, labels, np.nan)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='PM2.5 вдоль линий зрения камер (IDW / кригинг)')
+    parser.add_argument('--start', type=str, required=True, help='Начало периода (ISO)')
+    parser.add_argument('--end', type=str, required=True, help='Конец периода (ISO)')
+    parser.add_argument('--method', choices=METHODS, default='idw')
+    parser.add_argument('--resolution', choices=list(RESOLUTIONS), default='hour')
+    args = parser.parse_args()
+
+    from timeseries_store import TimeSeriesStore, to_epoch
+
+    step = RESOLUTIONS[args.resolution]
+    start = to_epoch(args.start)
+    timestamps = np.arange(bucket_start(start, step), to_epoch(args.end) + 1, step)
+
+    matrix, camera_ids = sightline_matrix(TimeSeriesStore(), timestamps, method=args.method,
+                                          resolution=args.resolution)
+
+    print(f"🔭 PM2.5 вдоль линий зрения ({args.method}): {len(timestamps)} моментов × {len(camera_ids)} камер")
+    for camera_id, column in zip(camera_ids, matrix.T):
+        known = column[~np.isnan(column)]
+        if len(known):
+            print(f"  {camera_id}: {len(known)} значений, среднее {known.mean():.1f}, "
+                  f"min {known.min():.1f}, max {known.max():.1f} µg/m³")
+        else:
+            print(f"  {camera_id}: нет показаний")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,289 @@
+"""
+Учёт квот API и token-bucket лимитер с сохранением состояния на диск
+Бесплатные тарифы жёстко ограничены (OpenWeatherMap 1000/день, IQAir 1000/месяц):
+частый опрос или backfill могут исчерпать ключ в начале дня
+
+Для каждой пары (источник, ключ):
+    - жёсткая квота на окно (день / месяц / час), сбрасывается на границе окна
+    - token bucket с темпом quota/окно: вызовы равномерно распределяются по окну
+    - приоритет: real-time опросы могут тратить всё; backfill не трогает резерв
+
+Одно состояние тратят несколько процессов (сборщики, backfill, каталог датчиков):
+каждая попытка перечитывает файл и записывает его под файловой блокировкой
+"""
+
+import os
+import json
+import time
+import hashlib
+import calendar
+import threading
+import argparse
+from contextlib import contextmanager
+from datetime import datetime, timezone
+
+from file_lock import FileLock, file_signature
+
+
+PRIORITY_REALTIME = "realtime"
+PRIORITY_BACKFILL = "backfill"
+
+# Квоты бесплатных тарифов (см. README, раздел API Rate Limits)
+SOURCE_QUOTAS = {
+    "openweathermap": {"quota": 1000, "window": "day", "burst": 20},
+    "iqair": {"quota": 1000, "window": "month", "burst": 5},
+    "openaq": {"quota": 2000, "window": "hour", "burst": 60},
+}
+
+# Доля квоты, зарезервированная под real-time опросы (backfill её не тратит)
+DEFAULT_REALTIME_RESERVE = 0.3
+
+
+def window_bounds(window, now):
+    """
+    Границы текущего окна квоты (UTC)
+
+    Returns:
+        tuple: (start_ts, end_ts) unix-время
+    """
+    dt = datetime.fromtimestamp(now, tz=timezone.utc)
+
+    if window == "hour":
+        start = dt.replace(minute=0, second=0, microsecond=0)
+        return start.timestamp(), start.timestamp() + 3600
+    elif window == "day":
+        start = dt.replace(hour=0, minute=0, second=0, microsecond=0)
+        return start.timestamp(), start.timestamp() + 86400
+    elif window == "month":
+        start = dt.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+        days = calendar.monthrange(dt.year, dt.month)[1]
+        return start.timestamp(), start.timestamp() + days * 86400
+    else:
+        raise ValueError(f"Неизвестное окно квоты: {window}")
+
+
+def bucket_id(source, api_key=None):
+    """ID бакета: источник + короткий хэш ключа (сам ключ на диск не пишется)"""
+    if not api_key:
+        return source
+    return f"{source}:{hashlib.sha1(api_key.encode('utf-8')).hexdigest()[:8]}"
+
+
+class QuotaRateLimiter:
+    """Token-bucket лимитер по источникам/ключам с учётом квот"""
+
+    def __init__(self, state_file="data/api_usage.json", quotas=None,
+                 realtime_reserve=DEFAULT_REALTIME_RESERVE):
+        """
+        Args:
+            state_file: JSON-файл состояния (переживает перезапуски)
+            quotas: dict источник -> {quota, window, burst} (default: SOURCE_QUOTAS)
+            realtime_reserve: Доля квоты окна, недоступная для backfill
+        """
+        self.state_file = state_file
+        self.quotas = dict(SOURCE_QUOTAS, **(quotas or {}))
+        self.realtime_reserve = realtime_reserve
+
+        self._lock = FileLock(state_file + ".lock") if state_file else threading.RLock()
+        # Состояние читается при первом захвате блокировки и перечитывается, если файл изменился
+        self._state = {}
+        self._state_signature = None
+
+    @contextmanager
+    def _locked(self):
+        """Блокировка + актуальное состояние (другой процесс мог потратить квоту)"""
+        with self._lock:
+            if self.state_file:
+                signature = file_signature(self.state_file)
+                if signature != self._state_signature:
+                    self._state = self._load()
+                    self._state_signature = signature
+            yield
+
+    def _load(self):
+        if self.state_file and os.path.exists(self.state_file):
+            with open(self.state_file, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        return {}
+
+    def _save(self):
+        if not self.state_file:
+            return
+        os.makedirs(os.path.dirname(self.state_file) or ".", exist_ok=True)
+        tmp_path = self.state_file + ".tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(self._state, f, indent=2)
+        os.replace(tmp_path, self.state_file)
+        self._state_signature = file_signature(self.state_file)
+
+    def _bucket(self, key, source, now):
+        """Состояние бакета с пополнением токенов и сбросом окна"""
+        config = self.quotas[source]
+        window_start, window_end = window_bounds(config["window"], now)
+        rate = config["quota"] / (window_end - window_start)
+
+        bucket = self._state.get(key)
+        if bucket is None:
+            bucket = {
+                "source": source,
+                "tokens": float(config["burst"]),
+                "last_refill": now,
+                "window_start": window_start,
+                "used": 0,
+                "used_realtime": 0,
+                "used_backfill": 0,
+                "denied": 0
+            }
+            self._state[key] = bucket
+
+        # Новое окно - квота сброшена
+        if bucket["window_start"] != window_start:
+            bucket.update(window_start=window_start, used=0, used_realtime=0, used_backfill=0, denied=0)
+
+        elapsed = max(0.0, now - bucket["last_refill"])
+        bucket["tokens"] = min(float(config["burst"]), bucket["tokens"] + elapsed * rate)
+        bucket["last_refill"] = now
+
+        return bucket, config, rate, window_end
+
+    def _can_consume(self, bucket, config, cost, priority, now, window_end, window_start):
+        if bucket["tokens"] < cost:
+            return False
+        if bucket["used"] + cost > config["quota"]:
+            return False
+
+        if priority == PRIORITY_BACKFILL:
+            # Backfill не трогает резерв под real-time до конца окна
+            remaining_fraction = (window_end - now) / (window_end - window_start)
+            reserved = config["quota"] * self.realtime_reserve * remaining_fraction
+            if config["quota"] - bucket["used"] - cost < reserved:
+                return False
+            # И не забирает последний токен бакета
+            if bucket["tokens"] - cost < 1:
+                return False
+
+        return True
+
+    def try_acquire(self, source, api_key=None, cost=1, priority=PRIORITY_REALTIME):
+        """
+        Неблокирующая попытка потратить cost вызовов
+
+        Returns:
+            bool: True если вызов разрешён (токены списаны)
+        """
+        if source not in self.quotas:
+            return True
+
+        with self._locked():
+            now = time.time()
+            bucket, config, _, window_end = self._bucket(bucket_id(source, api_key), source, now)
+            window_start = bucket["window_start"]
+
+            allowed = self._can_consume(bucket, config, cost, priority, now, window_end, window_start)
+            if allowed:
+                bucket["tokens"] -= cost
+                bucket["used"] += cost
+                bucket[f"used_{priority}"] += cost
+            else:
+                bucket["denied"] += 1
+
+            self._save()
+            return allowed
+
+    def acquire(self, source, api_key=None, cost=1, priority=PRIORITY_REALTIME, timeout=None):
+        """
+        Блокирующее ожидание токенов (не дольше timeout секунд)
+
+        Returns:
+            bool: True если вызов разрешён
+        """
+        if source not in self.quotas:
+            return True
+        if cost > self.quotas[source]["burst"]:
+            return False
+
+        deadline = None if timeout is None else time.time() + timeout
+        while True:
+            if self.try_acquire(source, api_key, cost, priority):
+                return True
+
+            with self._locked():
+                now = time.time()
+                bucket, config, rate, window_end = self._bucket(bucket_id(source, api_key), source, now)
+                if bucket["used"] + cost > config["quota"]:
+                    # Квота окна исчерпана - ждать до сброса бессмысленно
+                    return False
+                wait = max(0.05, (max(cost, 1) - bucket["tokens"]) / rate)
+
+            if deadline is not None:
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    return False
+                wait = min(wait, remaining)
+            time.sleep(wait)
+
+    def usage(self):
+        """
+        Использование квот для мониторинга
+
+        Returns:
+            dict: bucket_id -> {source, used, quota, remaining, tokens, ...}
+        """
+        with self._locked():
+            now = time.time()
+            result = {}
+            for key in list(self._state):
+                source = self._state[key]["source"]
+                if source not in self.quotas:
+                    continue
+                api_key_hash = key.split(":", 1)[1] if ":" in key else None
+                bucket, config, rate, window_end = self._bucket(key, source, now)
+                result[key] = {
+                    "source": source,
+                    "key_hash": api_key_hash,
+                    "window": config["window"],
+                    "quota": config["quota"],
+                    "used": bucket["used"],
+                    "used_realtime": bucket["used_realtime"],
+                    "used_backfill": bucket["used_backfill"],
+                    "denied": bucket["denied"],
+                    "remaining": config["quota"] - bucket["used"],
+                    "tokens": round(bucket["tokens"], 2),
+                    "rate_per_hour": round(rate * 3600, 2),
+                    "resets_at": datetime.fromtimestamp(window_end, tz=timezone.utc).isoformat()
+                }
+            return result
+
+
+def print_usage(limiter):
+    print("=" * 80)
+    print("📈 ИСПОЛЬЗОВАНИЕ КВОТ API")
+    print("=" * 80)
+    usage = limiter.usage()
+    if not usage:
+        print("\nНет данных об использовании")
+    for key, info in usage.items():
+        print(f"\n[{key}]")
+        print(f"  Использовано: {info['used']}/{info['quota']} за {info['window']} (осталось {info['remaining']})")
+        print(f"  Real-time: {info['used_realtime']}, backfill: {info['used_backfill']}, отказов: {info['denied']}")
+        print(f"  Токенов: {info['tokens']} (темп {info['rate_per_hour']}/час)")
+        print(f"  Сброс: {info['resets_at']}")
+    print("=" * 80)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Использование квот API')
+    parser.add_argument('--state', type=str, default='data/api_usage.json',
+                        help='Файл состояния лимитера (default: data/api_usage.json)')
+    parser.add_argument('--json', action='store_true', help='Вывести в JSON (для мониторинга)')
+    args = parser.parse_args()
+
+    limiter = QuotaRateLimiter(args.state)
+    if args.json:
+        print(json.dumps(limiter.usage(), indent=2))
+    else:
+        print_usage(limiter)
+
+
+if __name__ == "__main__":
+    main()
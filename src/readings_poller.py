@@ -0,0 +1,145 @@
+"""
+Опрос PM2.5/метео синхронно с тактами захвата кадров
+fetch_pm25_data.main - разовый скрипт, и показания снимались в моменты,
+не связанные с кадрами; поиск ближайшего показания для кадра - лишний поиск
+
+ReadingsPoller подключается к MultiCameraCapture как слушатель такта:
+    - опрос источников стартует одновременно с захватом кадров
+    - показания пишутся в data/pm25/ticks/<tick_id>.json
+    - кадр такта (результат capture_all_cameras с тем же tick_id) и показания
+      связываются точным совпадением ID, без поиска по времени
+    - после опроса инкрементально обновляется ряд по городу (fusion.py)
+
+Потребитель - dataset.iter_samples: образцу без PM2.5/метео подставляются показания
+такта (tick_id образца или время кадра в формате YYYYmmdd_HHMMSS, см. tick_sample_fields)
+"""
+
+import os
+import json
+import argparse
+import threading
+
+from fetch_pm25_data import PM25DataCollector
+from fusion import FusionEngine
+
+
+TICKS_DIR = "data/pm25/ticks"
+
+# Метео образца (как в baseline_model.prepare_features)
+WEATHER_FIELDS = ("temperature", "humidity", "pressure", "wind_speed", "clouds", "visibility")
+
+
+def tick_path(tick_id, ticks_dir=TICKS_DIR):
+    return os.path.join(ticks_dir, f"{tick_id}.json")
+
+
+def load_tick_readings(tick_id, ticks_dir=TICKS_DIR):
+    """
+    Показания такта
+
+    Returns:
+        dict: {tick_id, timestamp, readings} или None если такт не опрашивался
+    """
+    path = tick_path(tick_id, ticks_dir)
+    if not os.path.exists(path):
+        return None
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def tick_sample_fields(record):
+    """
+    Показания такта в формате образца датасета
+
+    Args:
+        record: Результат load_tick_readings
+
+    Returns:
+        dict: pm25 (среднее по источникам или None), weather (метео первого источника
+              с температурой и время такта или None)
+    """
+    readings = record.get("readings") or []
+    pm25 = [r["pm25"] for r in readings if r.get("pm25") is not None]
+    weather = next((r for r in readings if r.get("temperature") is not None), None)
+    return {
+        "pm25": sum(pm25) / len(pm25) if pm25 else None,
+        "weather": None if weather is None else dict(
+            {name: weather.get(name) for name in WEATHER_FIELDS}, timestamp=record["timestamp"]
+        )
+    }
+
+
+class ReadingsPoller:
+    """Слушатель такта: f(tick_id, timestamp) -> путь к файлу показаний"""
+
+    def __init__(self, collector=None, iqair_key=None, openweather_key=None, ticks_dir=TICKS_DIR,
+                 fusion=None):
+        """
+        Args:
+            collector: PM25DataCollector (None = новый, общий кэш и лимитер квот)
+            iqair_key, openweather_key: API ключи (None = источник пропускается)
+            ticks_dir: Директория файлов показаний по тактам
+            fusion: FusionEngine, обновляемый после каждого такта (None = без слияния)
+        """
+        self.collector = collector or PM25DataCollector()
+        self.fusion = fusion
+        self.iqair_key = iqair_key
+        self.openweather_key = openweather_key
+        self.ticks_dir = ticks_dir
+
+        # Такты не перекрываются: медленный опрос не запускается дважды
+        self._lock = threading.Lock()
+
+        os.makedirs(ticks_dir, exist_ok=True)
+
+    @classmethod
+    def from_env(cls, **kwargs):
+        """Ключи из .env (как в fetch_pm25_data.main)"""
+        iqair_key = os.getenv('IQAIR_API_KEY')
+        openweather_key = os.getenv('OPENWEATHER_API_KEY')
+        if iqair_key == 'your_iqair_api_key_here':
+            iqair_key = None
+        if openweather_key == 'your_openweather_api_key_here':
+            openweather_key = None
+        collector = kwargs.pop("collector", None) or PM25DataCollector()
+        kwargs.setdefault("fusion", FusionEngine(collector.timeseries_store))
+        return cls(collector, iqair_key=iqair_key, openweather_key=openweather_key, **kwargs)
+
+    def __call__(self, tick_id, timestamp):
+        with self._lock:
+            readings = self.collector.collect_all(self.iqair_key, self.openweather_key, save=False)
+            if self.fusion is not None:
+                summary = self.fusion.run()
+                print(f"🔀 Слияние: {summary['new_buckets']} новых бакетов, {summary['outliers']} выбросов")
+
+        record = {
+            "tick_id": tick_id,
+            "timestamp": timestamp.isoformat(),
+            "latencies": self.collector.last_latencies,
+            "readings": readings
+        }
+
+        path = tick_path(tick_id, self.ticks_dir)
+        with open(path + ".tmp", 'w', encoding='utf-8') as f:
+            json.dump(record, f, indent=2, ensure_ascii=False)
+        os.replace(path + ".tmp", path)
+
+        print(f"💾 Показания такта {tick_id}: {len(readings)} записей → {path}")
+        return path
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Показания PM2.5/метео по тактам сбора')
+    parser.add_argument('tick_id', help='ID такта (YYYYmmdd_HHMMSS)')
+    parser.add_argument('--ticks-dir', type=str, default=TICKS_DIR)
+    args = parser.parse_args()
+
+    record = load_tick_readings(args.tick_id, args.ticks_dir)
+    if record is None:
+        print(f"❌ Такт {args.tick_id} не найден")
+        return
+    print(json.dumps(record, indent=2, ensure_ascii=False))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,293 @@
+"""
+Локальный replay-сервер API качества воздуха (OpenAQ, IQAir, OpenWeatherMap)
+Коллекторы fetch_pm25_data.py и find_sensors.py можно было проверить только на живых
+сервисах - с их квотами и непредсказуемой задержкой
+
+Сервер отдаёт записанные ответы по пути URL и параметрам, меняющим содержимое
+ответа (страница, период - REPLAY_PARAMS; ключи и координаты не учитываются):
+    - записи берутся из кэша HTTP-ответов (data/cache/http, см. http_cache.py):
+      один живой запуск коллектора = набор записей для replay
+    - для путей без записи есть встроенные синтетические ответы в формате API;
+      незаписанная страница после первой отдаётся пустой (обход страниц завершается)
+
+Настраиваемые искажения (воспроизводимы при фиксированном seed):
+    latency_ms / jitter_ms  - задержка ответа
+    error_rate              - доля ответов 500
+    rate_limit_rate         - доля ответов 429 с Retry-After
+"""
+
+import os
+import json
+import time
+import random
+import argparse
+import threading
+from urllib.parse import urlparse, parse_qsl
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+# Параметры запроса, от которых зависит содержимое ответа
+REPLAY_PARAMS = ("page", "date_from", "date_to", "datetime_from", "datetime_to", "start", "end")
+
+
+def replay_key(path, params=None):
+    """Ключ записи: путь + значимые параметры (REPLAY_PARAMS)"""
+    return path, tuple(sorted((name, str(value)) for name, value in (params or {}).items() if name in REPLAY_PARAMS))
+
+
+def _synthetic_fixtures():
+    """Минимальные ответы в формате API для каждого пути, используемого коллекторами"""
+    now = int(time.time())
+    iso_now = time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime(now))
+
+    return {
+        "/v2/latest": {
+            "results": [
+                {
+                    "location": f"Bishkek station {i}",
+                    "coordinates": {"latitude": 42.87 + i * 0.005, "longitude": 74.59 + i * 0.005},
+                    "measurements": [{"parameter": "pm25", "value": 40.0 + i, "unit": "µg/m³", "lastUpdated": iso_now}]
+                }
+                for i in range(5)
+            ]
+        },
+        "/v3/locations": {
+            "meta": {"found": 5, "page": 1, "limit": 100},
+            "results": [
+                {
+                    "id": 1000 + i,
+                    "name": f"Bishkek station {i}",
+                    "locality": "Bishkek",
+                    "country": {"name": "Kyrgyzstan"},
+                    "coordinates": {"latitude": 42.87 + i * 0.005, "longitude": 74.59 + i * 0.005},
+                    "sensors": [{"id": 2000 + i, "parameter": {"name": "pm25"}}],
+                    "provider": {"name": "AirGradient"},
+                    "datetimeLast": {"utc": iso_now}
+                }
+                for i in range(5)
+            ]
+        },
+        "/v2/nearest_city": {
+            "status": "success",
+            "data": {
+                "city": "Bishkek",
+                "current": {
+                    "pollution": {"ts": iso_now, "aqius": 110, "p2": {"conc": 39.2}},
+                    "weather": {"tp": -3, "hu": 78, "pr": 1024, "ws": 1.2}
+                }
+            }
+        },
+        "/data/2.5/air_pollution": {
+            "list": [{"dt": now, "components": {"pm2_5": 41.3, "pm10": 60.2}}]
+        },
+        "/data/2.5/weather": {
+            "main": {"temp": 270.15, "humidity": 80, "pressure": 1025},
+            "wind": {"speed": 1.5},
+            "clouds": {"all": 40},
+            "visibility": 6000
+        },
+    }
+
+
+def load_recordings(cache_dir="data/cache/http"):
+    """
+    Записанные ответы из кэша HTTP-ответов
+
+    Returns:
+        dict: replay_key -> (content-type, body bytes); при нескольких записях - самая свежая
+    """
+    recordings = {}
+    if not os.path.isdir(cache_dir):
+        return recordings
+
+    newest = {}
+    for name in os.listdir(cache_dir):
+        if not name.endswith(".json"):
+            continue
+        meta_path = os.path.join(cache_dir, name)
+        body_path = meta_path[:-len(".json")] + ".body"
+        if not os.path.exists(body_path):
+            continue
+
+        with open(meta_path, 'r', encoding='utf-8') as f:
+            meta = json.load(f)
+        key = replay_key(urlparse(meta["url"]).path, meta.get("params"))
+        if meta["stored_at"] < newest.get(key, 0):
+            continue
+
+        with open(body_path, 'rb') as f:
+            body = f.read()
+        newest[key] = meta["stored_at"]
+        recordings[key] = (meta["headers"].get("Content-Type", "application/json"), body)
+
+    return recordings
+
+
+class ReplayServer:
+    """HTTP-сервер в фоновом потоке: with ReplayServer(...) as server: server.url"""
+
+    def __init__(self, host="127.0.0.1", port=0, cache_dir="data/cache/http", latency_ms=0.0,
+                 jitter_ms=0.0, error_rate=0.0, rate_limit_rate=0.0, retry_after=1, seed=42):
+        """
+        Args:
+            host, port: Адрес (port=0 - свободный порт)
+            cache_dir: Записи кэша HTTP-ответов (None = только синтетические ответы)
+            latency_ms, jitter_ms: Задержка ответа: latency ± равномерный jitter
+            error_rate: Доля ответов 500
+            rate_limit_rate: Доля ответов 429
+            retry_after: Значение Retry-After для 429 (секунды)
+            seed: Seed генератора искажений
+        """
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.error_rate = error_rate
+        self.rate_limit_rate = rate_limit_rate
+        self.retry_after = retry_after
+
+        self.responses = {
+            replay_key(path): ("application/json", json.dumps(body).encode('utf-8'))
+            for path, body in _synthetic_fixtures().items()
+        }
+        if cache_dir:
+            self.responses.update(load_recordings(cache_dir))
+
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self.stats = {}
+
+        self._server = ThreadingHTTPServer((host, port), self._make_handler())
+        self._server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def _pick_fault(self):
+        """Решение об искажении и задержка (под локом - детерминированная последовательность)"""
+        with self._lock:
+            roll = self._random.random()
+            delay = self.latency_ms + self._random.uniform(-self.jitter_ms, self.jitter_ms)
+        if roll < self.rate_limit_rate:
+            status = 429
+        elif roll < self.rate_limit_rate + self.error_rate:
+            status = 500
+        else:
+            status = 200
+        return status, max(0.0, delay) / 1000
+
+    def _record(self, path, status):
+        with self._lock:
+            by_status = self.stats.setdefault(path, {})
+            by_status[status] = by_status.get(status, 0) + 1
+
+    def _route(self, path, params=None):
+        """Ответ для пути и параметров; /v3/sensors/<id>/measurements и history - по шаблону"""
+        key = replay_key(path, params)
+        if key in self.responses:
+            return self.responses[key]
+        if int((params or {}).get("page", 1)) > 1:
+            # Страницы дальше записанных нет - пустая страница, а не повтор первой
+            return "application/json", json.dumps({"meta": {"found": 0}, "results": []}).encode('utf-8')
+        if (path, ()) in self.responses:
+            return self.responses[(path, ())]
+        if path.startswith("/v3/sensors/") and path.endswith("/measurements"):
+            return "application/json", json.dumps({"meta": {"found": 0}, "results": []}).encode('utf-8')
+        if path == "/data/2.5/air_pollution/history":
+            return "application/json", json.dumps({"list": []}).encode('utf-8')
+        return None
+
+    def _make_handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def do_GET(self):
+                url = urlparse(self.path)
+                path = url.path
+                route = server._route(path, dict(parse_qsl(url.query)))
+                status, delay = server._pick_fault()
+                if route is None:
+                    status = 404
+                time.sleep(delay)
+
+                if status == 200:
+                    content_type, body = route
+                else:
+                    content_type = "application/json"
+                    body = json.dumps({"error": status}).encode('utf-8')
+
+                self.send_response(status)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(body)))
+                if status == 429:
+                    self.send_header("Retry-After", str(server.retry_after))
+                self.end_headers()
+                self.wfile.write(body)
+                server._record(path, status)
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+    def serve_forever(self):
+        """Обслуживание в текущем потоке (для запуска из командной строки)"""
+        try:
+            self._server.serve_forever()
+        finally:
+            self._server.server_close()
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc, tb):
+        self.stop()
+
+    def total_requests(self):
+        with self._lock:
+            return sum(sum(by_status.values()) for by_status in self.stats.values())
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Локальный replay-сервер API качества воздуха')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--cache-dir', type=str, default='data/cache/http',
+                        help='Записанные ответы (кэш HTTP-ответов)')
+    parser.add_argument('--latency-ms', type=float, default=50.0)
+    parser.add_argument('--jitter-ms', type=float, default=20.0)
+    parser.add_argument('--error-rate', type=float, default=0.0)
+    parser.add_argument('--rate-limit-rate', type=float, default=0.0)
+    args = parser.parse_args()
+
+    server = ReplayServer(
+        port=args.port,
+        cache_dir=args.cache_dir,
+        latency_ms=args.latency_ms,
+        jitter_ms=args.jitter_ms,
+        error_rate=args.error_rate,
+        rate_limit_rate=args.rate_limit_rate
+    )
+    print(f"🎞️  Replay-сервер: {server.url}")
+    print(f"   Ответов: {len(server.responses)}, задержка {args.latency_ms}±{args.jitter_ms} мс, "
+          f"500: {args.error_rate:.0%}, 429: {args.rate_limit_rate:.0%}")
+
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print("\n⏹️  Остановлен")
+
+
+if __name__ == "__main__":
+    main()
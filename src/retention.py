@@ -0,0 +1,342 @@
+"""
+Многоуровневое хранение (retention) и компакция архива кадров
+Без компакции архив растёт бесконечно: каждый кадр хранится в полном разрешении
+
+Уровни (по возрасту кадра):
+    full       - полное разрешение (первые N дней)
+    reduced    - уменьшенное разрешение + пережатие JPEG
+    thumbnail  - только миниатюра + признаки в FrameFeatureStore
+
+Признаки кадра считаются по полному разрешению ДО первой компакции
+и больше не пересчитываются, поэтому остаются валидными
+"""
+
+import os
+import io
+import time
+import tarfile
+import threading
+import argparse
+from datetime import datetime, timedelta
+
+import cv2
+import numpy as np
+
+from image_archive import (
+    ShardedArchiveReader,
+    FrameFeatureStore,
+    TIMESTAMP_FORMAT,
+    append_index_entries,
+    tar_padded_size,
+)
+from frame_quality import get_default_filter
+
+
+TIER_FULL = "full"
+TIER_REDUCED = "reduced"
+TIER_THUMBNAIL = "thumbnail"
+
+# Порядок уровней: компакция только понижает уровень
+TIER_ORDER = {TIER_FULL: 0, TIER_REDUCED: 1, TIER_THUMBNAIL: 2}
+
+
+class RetentionPolicy:
+    """Параметры уровней хранения"""
+
+    def __init__(
+        self,
+        full_days=30,
+        reduced_days=180,
+        reduced_scale=0.5,
+        reduced_quality=70,
+        thumbnail_width=320,
+        thumbnail_quality=60
+    ):
+        """
+        Args:
+            full_days: Сколько дней хранить полное разрешение
+            reduced_days: Сколько дней хранить уменьшенную копию (после - миниатюра)
+            reduced_scale: Масштаб уменьшенной копии (0-1)
+            reduced_quality: Качество JPEG уменьшенной копии (0-100)
+            thumbnail_width: Ширина миниатюры в пикселях
+            thumbnail_quality: Качество JPEG миниатюры (0-100)
+        """
+        if reduced_days < full_days:
+            raise ValueError("reduced_days должен быть >= full_days")
+
+        self.full_days = full_days
+        self.reduced_days = reduced_days
+        self.reduced_scale = reduced_scale
+        self.reduced_quality = reduced_quality
+        self.thumbnail_width = thumbnail_width
+        self.thumbnail_quality = thumbnail_quality
+
+    def target_tier(self, timestamp_str, now=None):
+        """Уровень хранения для кадра с данным timestamp"""
+        now = now or datetime.now()
+        age = now - datetime.strptime(timestamp_str, TIMESTAMP_FORMAT)
+
+        if age < timedelta(days=self.full_days):
+            return TIER_FULL
+        elif age < timedelta(days=self.reduced_days):
+            return TIER_REDUCED
+        else:
+            return TIER_THUMBNAIL
+
+    def transform(self, frame, tier):
+        """
+        Перекодирует кадр для заданного уровня
+
+        Returns:
+            bytes: JPEG
+        """
+        height, width = frame.shape[:2]
+
+        if tier == TIER_REDUCED:
+            scale = self.reduced_scale
+            quality = self.reduced_quality
+        else:
+            scale = min(1.0, self.thumbnail_width / width)
+            quality = self.thumbnail_quality
+
+        if scale < 1.0:
+            size = (max(1, int(width * scale)), max(1, int(height * scale)))
+            frame = cv2.resize(frame, size, interpolation=cv2.INTER_AREA)
+
+        ok, encoded = cv2.imencode('.jpg', frame, [cv2.IMWRITE_JPEG_QUALITY, quality])
+        if not ok:
+            raise ValueError("Не удалось закодировать кадр")
+        return encoded.tobytes()
+
+
+def extract_frame_features(frame, quality_filter=None):
+    """
+    Признаки кадра, которые должны пережить компакцию
+
+    Returns:
+        dict: метрики качества + исходное разрешение
+    """
+    quality_filter = quality_filter or get_default_filter()
+    metrics = quality_filter.analyze_frame(frame)
+    return {
+        "brightness": metrics["brightness"],
+        "contrast": metrics["contrast"],
+        "sharpness": metrics["sharpness"],
+        "sky_ratio": metrics["sky_ratio"],
+        "is_useful": bool(metrics["is_useful"]),
+        "resolution": [int(frame.shape[1]), int(frame.shape[0])]
+    }
+
+
+class RetentionEngine:
+    """
+    Фоновая компакция архива пачками шардов
+
+    Активный (последний) шард камеры не трогается - в него пишет коллектор.
+    Компактированный шард пишется в новый файл, записи индекса дописываются,
+    и только после этого старый шард удаляется
+    """
+
+    def __init__(self, archive_dir="data/archive", policy=None):
+        self.archive_dir = archive_dir
+        self.policy = policy or RetentionPolicy()
+        self.reader = ShardedArchiveReader(archive_dir)
+        self.features = FrameFeatureStore(archive_dir)
+        self.quality_filter = get_default_filter()
+
+        self._stop_event = threading.Event()
+        self._thread = None
+
+    def _pending_shards(self, now=None):
+        """
+        Шарды, в которых есть кадры для понижения уровня
+
+        Returns:
+            list: [(camera_id, shard_name, [entries])]
+        """
+        pending = []
+
+        for camera_id in self.reader.cameras():
+            by_shard = {}
+            for entry in self.reader.list_frames(camera_id):
+                by_shard.setdefault(entry["shard"], []).append(entry)
+
+            # Последний шард коллектора - активный, его не трогаем
+            active = max((s for s in by_shard if s.startswith("shard_")), default=None)
+
+            for shard_name in sorted(by_shard):
+                if shard_name == active:
+                    continue
+
+                entries = by_shard[shard_name]
+                needs_compaction = any(
+                    TIER_ORDER[self.policy.target_tier(e["timestamp"], now)] >
+                    TIER_ORDER[e.get("tier", TIER_FULL)]
+                    for e in entries
+                )
+                if needs_compaction:
+                    pending.append((camera_id, shard_name, entries))
+
+        return pending
+
+    def _compacted_shard_name(self, camera_id, shard_name):
+        base = shard_name[:-len(".tar")].split(".")[0].replace("compacted_", "").replace("shard_", "")
+        generation = 1
+        camera_dir = os.path.join(self.archive_dir, camera_id)
+        while os.path.exists(os.path.join(camera_dir, f"compacted_{base}.{generation}.tar")):
+            generation += 1
+        return f"compacted_{base}.{generation}.tar"
+
+    def compact_shard(self, camera_id, shard_name, entries, now=None):
+        """
+        Переписывает один шард с понижением уровня устаревших кадров
+
+        Returns:
+            int: освобождено байт
+        """
+        camera_dir = os.path.join(self.archive_dir, camera_id)
+        old_path = os.path.join(camera_dir, shard_name)
+        new_name = self._compacted_shard_name(camera_id, shard_name)
+        new_path = os.path.join(camera_dir, new_name)
+        tmp_path = new_path + ".tmp"
+
+        new_entries = []
+
+        with tarfile.open(tmp_path, 'w', format=tarfile.USTAR_FORMAT) as tar:
+            for entry in entries:
+                data = self.reader.read_entry(entry)
+                current_tier = entry.get("tier", TIER_FULL)
+                target_tier = self.policy.target_tier(entry["timestamp"], now)
+
+                if TIER_ORDER[target_tier] > TIER_ORDER[current_tier]:
+                    frame = cv2.imdecode(np.frombuffer(data, dtype=np.uint8), cv2.IMREAD_COLOR)
+
+                    if frame is not None:
+                        # Признаки считаются только по полному разрешению
+                        if current_tier == TIER_FULL and self.features.get(camera_id, entry["timestamp"]) is None:
+                            self.features.put(
+                                camera_id, entry["timestamp"],
+                                extract_frame_features(frame, self.quality_filter)
+                            )
+                        data = self.policy.transform(frame, target_tier)
+
+                    # Битый кадр оставляем как есть, но помечаем уровень,
+                    # чтобы шард не попадал в компакцию повторно
+                    current_tier = target_tier
+
+                info = tarfile.TarInfo(name=f"{camera_id}_{entry['timestamp']}.jpg")
+                info.size = len(data)
+                info.mtime = int(time.time())
+                tar.addfile(info, io.BytesIO(data))
+
+                new_entries.append({
+                    "timestamp": entry["timestamp"],
+                    "shard": new_name,
+                    "offset": tar.offset - tar_padded_size(len(data)),
+                    "size": len(data),
+                    "ext": "jpg",
+                    "tier": current_tier
+                })
+
+        os.replace(tmp_path, new_path)
+
+        # Сначала индекс указывает на новый шард, потом удаляется старый
+        append_index_entries(self.archive_dir, camera_id, new_entries)
+        reclaimed = os.path.getsize(old_path) - os.path.getsize(new_path)
+        os.remove(old_path)
+
+        return reclaimed
+
+    def run_once(self, batch_size=10, now=None):
+        """
+        Одна пачка компакции
+
+        Args:
+            batch_size: Максимум шардов за пачку
+
+        Returns:
+            int: освобождено байт
+        """
+        pending = self._pending_shards(now)[:batch_size]
+        if not pending:
+            return 0
+
+        total_reclaimed = 0
+        for camera_id, shard_name, entries in pending:
+            if self._stop_event.is_set():
+                break
+            reclaimed = self.compact_shard(camera_id, shard_name, entries, now)
+            total_reclaimed += reclaimed
+            print(f"♻️  {camera_id}/{shard_name}: {len(entries)} кадров, освобождено {reclaimed / 1024 / 1024:.1f} МБ")
+
+        print(f"♻️  Пачка завершена: освобождено {total_reclaimed / 1024 / 1024:.1f} МБ")
+        return total_reclaimed
+
+    def start_background(self, interval_minutes=60, batch_size=10):
+        """Запускает компакцию в фоновом потоке (пачка раз в interval_minutes)"""
+        if self._thread is not None and self._thread.is_alive():
+            return
+
+        def loop():
+            while not self._stop_event.is_set():
+                try:
+                    self.run_once(batch_size=batch_size)
+                except Exception as e:
+                    print(f"❌ Ошибка компакции: {e}")
+                self._stop_event.wait(interval_minutes * 60)
+
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=loop, name="retention", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop_event.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Компакция архива кадров по уровням хранения')
+    parser.add_argument('--archive', type=str, default='data/archive',
+                        help='Директория архива (default: data/archive)')
+    parser.add_argument('--full-days', type=int, default=30,
+                        help='Дней в полном разрешении (default: 30)')
+    parser.add_argument('--reduced-days', type=int, default=180,
+                        help='Дней в уменьшенном разрешении (default: 180)')
+    parser.add_argument('--batch-size', type=int, default=10,
+                        help='Шардов за одну пачку (default: 10)')
+    parser.add_argument('--interval', type=int, default=None,
+                        help='Работать в фоне, пачка раз в N минут (default: один проход)')
+
+    args = parser.parse_args()
+
+    engine = RetentionEngine(
+        args.archive,
+        RetentionPolicy(full_days=args.full_days, reduced_days=args.reduced_days)
+    )
+
+    print("=" * 80)
+    print("♻️  КОМПАКЦИЯ АРХИВА КАДРОВ")
+    print("=" * 80)
+    print(f"  Полное разрешение: {args.full_days} дней")
+    print(f"  Уменьшенное: до {args.reduced_days} дней, далее миниатюра + признаки")
+    print("=" * 80)
+
+    if args.interval is None:
+        total = 0
+        while engine._pending_shards():
+            total += engine.run_once(batch_size=args.batch_size)
+        print(f"\n✅ Всего освобождено: {total / 1024 / 1024:.1f} МБ")
+    else:
+        engine.start_background(interval_minutes=args.interval, batch_size=args.batch_size)
+        try:
+            while True:
+                time.sleep(1)
+        except KeyboardInterrupt:
+            print("\n⚠️  Компакция остановлена пользователем")
+            engine.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,316 @@
+"""
+Каталог датчиков PM2.5 с кэшем на диске и инкрементальным обновлением из OpenAQ v3
+find_sensors_openaq_v3 брал только первую страницу (limit=100) и при каждом запуске
+ходил в сеть; при сбое подставлялся жёстко заданный список
+
+Каталог (data/sensor_catalog.json):
+    - обход всех страниц /v3/locations (страницы после первой - параллельно, если известен meta.found)
+    - для каждой локации: first_seen, last_seen, отпечаток (координаты, датчики; не время последнего показания)
+    - повторное обновление перезаписывает только изменившиеся локации; пропавшие
+      помечаются active=False, но не удаляются
+    - пока каталог моложе max_age_hours и собран тем же запросом (центр, радиус),
+      потребители читают его без сети
+"""
+
+import os
+import json
+import math
+import hashlib
+import argparse
+from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from requests.adapters import HTTPAdapter
+from dotenv import load_dotenv
+
+from find_sensors import OPENAQ_BASE_URL, parse_openaq_location, get_known_sensors_manual
+from http_cache import ResponseCache
+from rate_limiter import QuotaRateLimiter
+
+
+load_dotenv()
+
+CATALOG_PATH = "data/sensor_catalog.json"
+OPENAQ_LOCATIONS_LIMIT = 1000
+DEFAULT_MAX_AGE_HOURS = 24
+
+# Центр Бишкека и радиус поиска по умолчанию
+DEFAULT_LAT = 42.8746
+DEFAULT_LON = 74.5698
+DEFAULT_RADIUS_KM = 20
+
+
+def _openaq_session(api_key=None, max_connections=4):
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=2, pool_maxsize=max_connections, pool_block=True)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    if api_key:
+        session.headers["X-API-Key"] = api_key
+    return session
+
+
+def fetch_openaq_locations(lat, lon, radius_km, base_url=OPENAQ_BASE_URL, session=None, api_key=None,
+                           limit=OPENAQ_LOCATIONS_LIMIT, response_cache=None, rate_limiter=None, max_workers=4):
+    """
+    Все локации OpenAQ v3 с PM2.5 в радиусе (все страницы)
+
+    Args:
+        response_cache: ResponseCache - условные запросы (304 не передаёт тело заново)
+        rate_limiter: QuotaRateLimiter - учёт квоты OpenAQ (None = без учёта)
+
+    Returns:
+        list: локации в формате API (dict)
+    """
+    session = session or _openaq_session(api_key, max_workers)
+    url = f"{base_url.rstrip('/')}/v3/locations"
+    base_params = {
+        "coordinates": f"{lat},{lon}",
+        "radius": int(radius_km * 1000),  # Конвертируем в метры
+        "limit": limit,
+        "parameter": "pm25"  # Только PM2.5 датчики
+    }
+
+    def get_page(page):
+        params = dict(base_params, page=page)
+        if rate_limiter is not None and not rate_limiter.acquire("openaq", api_key, timeout=60):
+            raise RuntimeError("openaq: квота API исчерпана")
+        if response_cache is not None:
+            response = response_cache.fetch(session, "openaq", url, params, timeout=30)
+        else:
+            response = session.get(url, params=params, timeout=30)
+        if response.status_code != 200:
+            raise RuntimeError(f"OpenAQ API: {response.status_code}")
+        return response.json()
+
+    first = get_page(1)
+    pages = [first]
+
+    found = first.get("meta", {}).get("found")
+    if isinstance(found, int):
+        n_pages = math.ceil(found / limit)
+        if n_pages > 1:
+            with ThreadPoolExecutor(max_workers=min(max_workers, n_pages - 1)) as executor:
+                pages.extend(executor.map(get_page, range(2, n_pages + 1)))
+    else:
+        # found неизвестен (">1000") - по страницам до неполной
+        page = 1
+        while len(pages[-1].get("results", [])) == limit:
+            page += 1
+            pages.append(get_page(page))
+
+    return [location for data in pages for location in data.get("results", [])]
+
+
+def location_fingerprint(info):
+    """
+    Отпечаток локации: меняется только при изменении описания станции
+    (datetime_last сдвигается с каждым показанием и в отпечаток не входит)
+    """
+    sensor_ids = sorted(str(s.get("id")) for s in info.get("sensors", []))
+    key = json.dumps([
+        info.get("name"), info.get("latitude"), info.get("longitude"),
+        info.get("provider"), sensor_ids
+    ], ensure_ascii=False)
+    return hashlib.sha1(key.encode('utf-8')).hexdigest()[:16]
+
+
+def series_locations(sensor):
+    """
+    Локации рядов хранилища (timeseries_store), относящиеся к датчику каталога
+
+    Живой опрос OpenAQ пишет ряд под именем локации, backfill - под sensor_<id>
+    каждого датчика локации (id датчика OpenAQ v3, а не локации)
+
+    Returns:
+        list: ключи location
+    """
+    locations = [str(sensor["name"])] if sensor.get("name") else []
+    locations += [f"sensor_{s['id']}" for s in sensor.get("sensors", []) if s.get("id") is not None]
+    return locations
+
+
+def series_owners(sensors):
+    """
+    Returns:
+        dict: location ряда хранилища -> индекс датчика в sensors (при совпадении имён - первый)
+    """
+    owners = {}
+    for index, sensor in enumerate(sensors):
+        for location in series_locations(sensor):
+            owners.setdefault(location, index)
+    return owners
+
+
+def catalog_query(lat=DEFAULT_LAT, lon=DEFAULT_LON, radius_km=DEFAULT_RADIUS_KM):
+    """Запрос обхода OpenAQ, сохраняемый в каталоге (сравнивается в SensorCatalog.is_stale)"""
+    return {"lat": lat, "lon": lon, "radius_km": radius_km}
+
+
+class SensorCatalog:
+    """Каталог датчиков на диске (id локации OpenAQ -> запись)"""
+
+    def __init__(self, path=CATALOG_PATH):
+        self.path = path
+        self.data = self._load()
+
+    def _load(self):
+        if self.path and os.path.exists(self.path):
+            with open(self.path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        return {"refreshed_at": None, "query": None, "locations": {}}
+
+    def save(self):
+        if not self.path:
+            return
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        with open(self.path + ".tmp", 'w', encoding='utf-8') as f:
+            json.dump(self.data, f, indent=2, ensure_ascii=False)
+        os.replace(self.path + ".tmp", self.path)
+
+    def age_hours(self):
+        if not self.data["refreshed_at"]:
+            return None
+        refreshed = datetime.fromisoformat(self.data["refreshed_at"])
+        return (datetime.now() - refreshed).total_seconds() / 3600
+
+    def is_stale(self, max_age_hours=DEFAULT_MAX_AGE_HOURS, query=None):
+        """
+        Args:
+            query: Запрос, которым должен быть собран каталог (см. catalog_query);
+                   каталог другого центра или радиуса устарел независимо от возраста
+        """
+        if query is not None and self.data.get("query") != query:
+            return True
+        age = self.age_hours()
+        return age is None or age > max_age_hours
+
+    def update(self, locations, query=None):
+        """
+        Сливает результат полного обхода с каталогом
+
+        Returns:
+            dict: new, changed, unchanged, gone (число локаций)
+        """
+        now = datetime.now().isoformat()
+        entries = self.data["locations"]
+        summary = {"new": 0, "changed": 0, "unchanged": 0, "gone": 0}
+
+        seen = set()
+        for location in locations:
+            info = parse_openaq_location(location)
+            if info is None:
+                continue
+            key = str(info["id"])
+            seen.add(key)
+            fingerprint = location_fingerprint(info)
+
+            entry = entries.get(key)
+            if entry is None:
+                entries[key] = dict(info, fingerprint=fingerprint, first_seen=now, last_seen=now, active=True)
+                summary["new"] += 1
+            elif entry["fingerprint"] != fingerprint or not entry.get("active", True):
+                entry.update(info, fingerprint=fingerprint, last_seen=now, active=True)
+                summary["changed"] += 1
+            else:
+                entry.update(last_seen=now, datetime_last=info.get("datetime_last"))
+                summary["unchanged"] += 1
+
+        for key, entry in entries.items():
+            if key not in seen and entry.get("active", True):
+                entry["active"] = False
+                summary["gone"] += 1
+
+        self.data["refreshed_at"] = now
+        self.data["query"] = query
+        return summary
+
+    def refresh(self, lat=DEFAULT_LAT, lon=DEFAULT_LON, radius_km=DEFAULT_RADIUS_KM, base_url=OPENAQ_BASE_URL,
+                api_key=None, session=None, response_cache=None, rate_limiter=None):
+        """
+        Полный обход OpenAQ v3 и инкрементальное слияние с каталогом
+
+        Returns:
+            dict: new, changed, unchanged, gone
+        """
+        query = catalog_query(lat, lon, radius_km)
+        locations = fetch_openaq_locations(
+            lat, lon, radius_km,
+            base_url=base_url,
+            session=session,
+            api_key=api_key,
+            response_cache=response_cache if response_cache is not None else ResponseCache(),
+            rate_limiter=rate_limiter if rate_limiter is not None else QuotaRateLimiter()
+        )
+        summary = self.update(locations, query)
+        self.save()
+        return summary
+
+    def sensors(self, include_inactive=False):
+        """
+        Датчики в формате find_sensors (name, latitude, longitude, ...)
+
+        Returns:
+            list: записи каталога, отсортированные по id
+        """
+        return [
+            entry for _, entry in sorted(self.data["locations"].items(), key=lambda item: str(item[0]))
+            if include_inactive or entry.get("active", True)
+        ]
+
+
+def load_sensors(catalog_path=CATALOG_PATH, max_age_hours=DEFAULT_MAX_AGE_HOURS, refresh=True, **refresh_kwargs):
+    """
+    Датчики для потребителей (calculate_distances_to_cameras и др.)
+
+    Свежий каталог читается с диска без сети; устаревший обновляется (если refresh=True);
+    если в каталоге нет датчиков - известные датчики из find_sensors.get_known_sensors_manual
+
+    Returns:
+        list: датчики с координатами
+    """
+    catalog = SensorCatalog(catalog_path)
+
+    query = catalog_query(**{name: refresh_kwargs[name] for name in ("lat", "lon", "radius_km") if name in refresh_kwargs})
+    if refresh and catalog.is_stale(max_age_hours, query):
+        refresh_kwargs.setdefault("api_key", os.getenv('OPENAQ_API_KEY'))
+        try:
+            summary = catalog.refresh(**refresh_kwargs)
+            print(f"🔄 Каталог датчиков обновлён: +{summary['new']} новых, {summary['changed']} изменено, "
+                  f"{summary['unchanged']} без изменений, {summary['gone']} пропало")
+        except Exception as e:
+            print(f"⚠️  Не удалось обновить каталог датчиков: {e}")
+
+    sensors = catalog.sensors()
+    if not sensors:
+        return get_known_sensors_manual()
+    return sensors
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Каталог датчиков PM2.5 (OpenAQ v3)')
+    parser.add_argument('--catalog', type=str, default=CATALOG_PATH)
+    parser.add_argument('--refresh', action='store_true', help='Обновить независимо от возраста каталога')
+    parser.add_argument('--radius-km', type=float, default=DEFAULT_RADIUS_KM)
+    parser.add_argument('--base-url', type=str, default=OPENAQ_BASE_URL, help='Базовый URL OpenAQ')
+    parser.add_argument('--all', action='store_true', help='Показать и неактивные локации')
+    args = parser.parse_args()
+
+    catalog = SensorCatalog(args.catalog)
+    if args.refresh or catalog.is_stale(query=catalog_query(radius_km=args.radius_km)):
+        summary = catalog.refresh(radius_km=args.radius_km, base_url=args.base_url,
+                                  api_key=os.getenv('OPENAQ_API_KEY'))
+        print(f"🔄 Обновлено: +{summary['new']} новых, {summary['changed']} изменено, "
+              f"{summary['unchanged']} без изменений, {summary['gone']} пропало")
+
+    sensors = catalog.sensors(include_inactive=args.all)
+    print(f"📍 Датчиков в каталоге: {len(sensors)} (обновлён {catalog.data['refreshed_at']})")
+    for sensor in sensors:
+        status = "" if sensor.get("active", True) else "  [неактивен]"
+        print(f"  {sensor['id']:>8}  {sensor['name']}  ({sensor['latitude']:.4f}, {sensor['longitude']:.4f})  "
+              f"last_seen {sensor['last_seen'][:16]}{status}")
+
+
+if __name__ == "__main__":
+    main()
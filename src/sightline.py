@@ -0,0 +1,290 @@
+"""
+Сектор обзора камеры и выбор датчиков вдоль линии зрения
+Расстояния камера → датчик считались до точки установки камеры, направление и глубина
+обзора (viewing_direction, viewing_angle, "depth 10+ км" в описании) не учитывались,
+хотя видимость интегрирует PM2.5 вдоль всей линии зрения
+
+Для каждой камеры:
+    - курс из viewing_direction ("~330° NW" → 330, "10-12° N" → 11, вращающаяся → нет курса)
+    - угол обзора по viewing_angle (FOV_BY_ANGLE), глубина из описания или по умолчанию
+    - сектор (полигон) от камеры до заданной глубины
+    - датчики внутри сектора одним матричным запросом (расстояние и азимут всех пар),
+      вес датчика убывает от оси обзора к краю сектора
+"""
+
+import re
+import json
+import math
+import argparse
+
+import numpy as np
+
+from camera_config import get_recommended_cameras
+from find_sensors import EARTH_RADIUS_KM, haversine_matrix
+
+
+# Угол обзора (градусы) по типу камеры; вращающаяся камера - круг вокруг точки установки
+FOV_BY_ANGLE = {
+    "panoramic-wide": 90.0,
+    "elevated-wide": 70.0,
+    "horizontal-wide": 60.0,
+    "downward": 40.0,
+    "rotating": 360.0,
+}
+DEFAULT_FOV = 60.0
+
+# Глубина (км), если в описании камеры её нет; камера "вниз" видит только ближний план
+DEPTH_BY_ANGLE = {"downward": 0.5, "rotating": 1.0}
+DEFAULT_DEPTH_KM = 3.0
+
+POLYGON_ARC_POINTS = 24
+
+
+def parse_heading(viewing_direction):
+    """
+    Курс камеры в градусах (0 = север, по часовой)
+
+    Returns:
+        float: курс, для диапазона "10-12°" - середина; None если курса нет (вращающаяся)
+    """
+    if not viewing_direction:
+        return None
+    match = re.search(r'(\d+(?:\.\d+)?)(?:\s*-\s*(\d+(?:\.\d+)?))?\s*°', viewing_direction)
+    if match is None:
+        return None
+    low = float(match.group(1))
+    high = float(match.group(2)) if match.group(2) else low
+    return ((low + high) / 2) % 360
+
+
+def parse_depth_km(description):
+    """Глубина обзора из описания камеры ("depth 10+ км" → 10.0), None если не указана"""
+    match = re.search(r'depth\s*(\d+(?:\.\d+)?)\+?\s*(?:км|km)', description or "", re.IGNORECASE)
+    return float(match.group(1)) if match else None
+
+
+def bearing_matrix(lat1, lon1, lat2, lon2):
+    """
+    Начальный азимут от каждой точки (lat1, lon1) на каждую (lat2, lon2)
+
+    Returns:
+        np.ndarray: (n, m), градусы [0, 360)
+    """
+    phi1 = np.radians(np.asarray(lat1, dtype=np.float64))[:, None]
+    phi2 = np.radians(np.asarray(lat2, dtype=np.float64))[None, :]
+    dlon = np.radians(np.asarray(lon2, dtype=np.float64)[None, :] - np.asarray(lon1, dtype=np.float64)[:, None])
+
+    y = np.sin(dlon) * np.cos(phi2)
+    x = np.cos(phi1) * np.sin(phi2) - np.sin(phi1) * np.cos(phi2) * np.cos(dlon)
+    return np.degrees(np.arctan2(y, x)) % 360
+
+
+def destination_point(lat, lon, bearing_deg, distance_km):
+    """Точка на расстоянии distance_km по азимуту bearing_deg (векторизовано по азимуту и расстоянию)"""
+    phi1 = math.radians(lat)
+    lam1 = math.radians(lon)
+    theta = np.radians(np.asarray(bearing_deg, dtype=np.float64))
+    delta = np.asarray(distance_km, dtype=np.float64) / EARTH_RADIUS_KM
+
+    phi2 = np.arcsin(math.sin(phi1) * np.cos(delta) + math.cos(phi1) * np.sin(delta) * np.cos(theta))
+    lam2 = lam1 + np.arctan2(np.sin(theta) * np.sin(delta) * math.cos(phi1),
+                             np.cos(delta) - math.sin(phi1) * np.sin(phi2))
+    return np.degrees(phi2), np.degrees(lam2)
+
+
+class ViewingCone:
+    """Сектор обзора камеры: вершина в точке установки, курс, угол обзора, глубина"""
+
+    def __init__(self, camera_id, lat, lon, heading, fov, depth_km):
+        self.camera_id = camera_id
+        self.lat = lat
+        self.lon = lon
+        self.heading = heading
+        self.fov = fov
+        self.depth_km = depth_km
+
+    @classmethod
+    def from_camera(cls, camera_id, camera_info, depth_km=None):
+        """
+        Args:
+            camera_info: запись CAMERAS
+            depth_km: Глубина сектора (None = из описания камеры или по типу)
+
+        Returns:
+            ViewingCone или None, если координаты камеры неизвестны
+        """
+        if not camera_info.get("coordinates"):
+            return None
+        lat, lon = camera_info["coordinates"]
+        angle = camera_info.get("viewing_angle")
+        heading = parse_heading(camera_info.get("viewing_direction"))
+        fov = FOV_BY_ANGLE.get(angle, DEFAULT_FOV) if heading is not None else 360.0
+
+        if depth_km is None:
+            depth_km = parse_depth_km(camera_info.get("description"))
+        if depth_km is None:
+            depth_km = DEPTH_BY_ANGLE.get(angle, DEFAULT_DEPTH_KM)
+        return cls(camera_id, lat, lon, heading, fov, depth_km)
+
+    @property
+    def is_full_circle(self):
+        return self.heading is None or self.fov >= 360
+
+    def polygon(self, arc_points=POLYGON_ARC_POINTS):
+        """
+        Полигон сектора [(lat, lon), ...], замкнутый; для круга - без вершины в камере
+        """
+        if self.is_full_circle:
+            bearings = np.linspace(0, 360, arc_points * 4, endpoint=False)
+            lats, lons = destination_point(self.lat, self.lon, bearings, self.depth_km)
+            points = list(zip(lats.tolist(), lons.tolist()))
+        else:
+            bearings = self.heading + np.linspace(-self.fov / 2, self.fov / 2, arc_points)
+            lats, lons = destination_point(self.lat, self.lon, bearings, self.depth_km)
+            points = [(self.lat, self.lon)] + list(zip(lats.tolist(), lons.tolist()))
+        return points + [points[0]]
+
+
+def camera_cones(cameras=None, depth_km=None):
+    """Секторы обзора камер с известными координатами (по умолчанию - рекомендуемые камеры)"""
+    cameras = cameras if cameras is not None else get_recommended_cameras()
+    cones = [ViewingCone.from_camera(camera_id, info, depth_km) for camera_id, info in cameras.items()]
+    return [cone for cone in cones if cone is not None]
+
+
+def sector_weights(cones, sensors):
+    """
+    Датчики внутри секторов обзора и их веса (все камеры × все датчики одним запросом)
+
+    Вес = cos(π/2 · отклонение от оси / половина угла обзора): 1 на оси, 0 на краю;
+    для круга (вращающаяся камера) все датчики внутри радиуса равны. Веса нормированы
+    по камере. Если в секторе нет датчиков - ближайший датчик с весом 1 (in_sector=False)
+
+    Returns:
+        dict: camera_id -> [{sensor_name, sensor_coords, distance_km, offset_deg, weight, in_sector}]
+    """
+    if not cones or not sensors:
+        return {cone.camera_id: [] for cone in cones}
+
+    cam_lat = np.array([cone.lat for cone in cones])
+    cam_lon = np.array([cone.lon for cone in cones])
+    sensor_lat = np.array([s["latitude"] for s in sensors], dtype=np.float64)
+    sensor_lon = np.array([s["longitude"] for s in sensors], dtype=np.float64)
+
+    distances = haversine_matrix(cam_lat, cam_lon, sensor_lat, sensor_lon)
+    bearings = bearing_matrix(cam_lat, cam_lon, sensor_lat, sensor_lon)
+
+    headings = np.array([cone.heading if not cone.is_full_circle else 0.0 for cone in cones])[:, None]
+    half_fov = np.array([cone.fov / 2 if not cone.is_full_circle else 180.0 for cone in cones])[:, None]
+    depth = np.array([cone.depth_km for cone in cones])[:, None]
+    full_circle = np.array([cone.is_full_circle for cone in cones])[:, None]
+
+    offsets = np.abs((bearings - headings + 180) % 360 - 180)
+    inside = (distances <= depth) & (full_circle | (offsets <= half_fov))
+    weights = np.where(full_circle, 1.0, np.cos(np.pi / 2 * np.minimum(offsets / half_fov, 1.0)))
+    weights = np.where(inside, weights, 0.0)
+
+    result = {}
+    for row, cone in enumerate(cones):
+        selected = np.flatnonzero(inside[row] & (weights[row] > 0))
+        in_sector = selected.size > 0
+        if not in_sector:
+            selected = np.array([np.argmin(distances[row])])
+            row_weights = np.ones(1)
+        else:
+            row_weights = weights[row, selected] / weights[row, selected].sum()
+
+        order = np.argsort(distances[row, selected], kind='stable')
+        result[cone.camera_id] = [
+            {
+                "sensor_name": sensors[index]["name"],
+                "sensor_coords": (sensors[index]["latitude"], sensors[index]["longitude"]),
+                "distance_km": float(distances[row, index]),
+                "offset_deg": float(offsets[row, index]) if not cone.is_full_circle else 0.0,
+                "weight": float(weight),
+                "in_sector": bool(in_sector),
+            }
+            for index, weight in zip(selected[order].tolist(), row_weights[order].tolist())
+        ]
+    return result
+
+
+def weighted_pm25(camera_weights, readings):
+    """
+    PM2.5 вдоль линии зрения для одного момента: взвешенное среднее показаний датчиков сектора
+
+    Args:
+        camera_weights: список sector_weights(...)[camera_id]
+        readings: dict имя датчика -> PM2.5 (отсутствующие датчики пропускаются, веса перенормируются)
+
+    Returns:
+        float или None, если ни у одного датчика сектора нет показания
+    """
+    total = 0.0
+    weight_sum = 0.0
+    for entry in camera_weights:
+        value = readings.get(entry["sensor_name"])
+        if value is None or value != value:
+            continue
+        total += entry["weight"] * value
+        weight_sum += entry["weight"]
+    return total / weight_sum if weight_sum > 0 else None
+
+
+def cones_geojson(cones):
+    """Секторы обзора в GeoJSON (координаты lon, lat) для просмотра на карте"""
+    return {
+        "type": "FeatureCollection",
+        "features": [
+            {
+                "type": "Feature",
+                "properties": {
+                    "camera_id": cone.camera_id,
+                    "heading": cone.heading,
+                    "fov": cone.fov,
+                    "depth_km": cone.depth_km,
+                },
+                "geometry": {
+                    "type": "Polygon",
+                    "coordinates": [[[lon, lat] for lat, lon in cone.polygon()]],
+                },
+            }
+            for cone in cones
+        ],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Секторы обзора камер и датчики вдоль линии зрения')
+    parser.add_argument('--depth-km', type=float, default=None,
+                        help='Глубина сектора для всех камер (по умолчанию из описания камеры)')
+    parser.add_argument('--geojson', type=str, default=None, help='Сохранить полигоны секторов в GeoJSON')
+    args = parser.parse_args()
+
+    from sensor_catalog import load_sensors
+
+    sensors = load_sensors(refresh=False)
+    cones = camera_cones(depth_km=args.depth_km)
+    weights = sector_weights(cones, sensors)
+
+    print("=" * 80)
+    print("🔭 ДАТЧИКИ В СЕКТОРАХ ОБЗОРА")
+    print("=" * 80)
+    for cone in cones:
+        heading = f"{cone.heading:.0f}°" if cone.heading is not None else "вращается"
+        print(f"\n📹 {cone.camera_id}: курс {heading}, угол {cone.fov:.0f}°, глубина {cone.depth_km:g} км")
+        entries = weights[cone.camera_id]
+        if entries and not entries[0]["in_sector"]:
+            print("   ⚠️  В секторе нет датчиков - ближайший датчик:")
+        for entry in entries:
+            print(f"   {entry['sensor_name']}: {entry['distance_km']:.2f} км, "
+                  f"отклонение {entry['offset_deg']:.0f}°, вес {entry['weight']:.2f}")
+
+    if args.geojson:
+        with open(args.geojson, 'w', encoding='utf-8') as f:
+            json.dump(cones_geojson(cones), f, indent=2, ensure_ascii=False)
+        print(f"\n💾 Секторы сохранены: {args.geojson}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,265 @@
+"""
+Пространственный индекс датчиков: k ближайших и поиск в радиусе для произвольных точек
+(камеры, точки вдоль линии зрения)
+
+Сетка ячеек ~cell_km × cell_km (широта/долгота, ширина по долготе пересчитана
+на опорной широте) → множество датчиков в ячейке. Запрос проверяет только ячейки
+вокруг точки, точные расстояния - haversine_matrix по кандидатам.
+Индекс обновляется инкрементально: upsert/remove одного датчика или sync со списком
+из каталога (только новые, сдвинувшиеся и пропавшие датчики)
+"""
+
+import math
+import time
+import argparse
+
+import numpy as np
+
+from find_sensors import haversine_matrix
+
+
+KM_PER_DEG_LAT = 111.195
+DEFAULT_CELL_KM = 1.0
+DEFAULT_REF_LAT = 42.8746  # Бишкек
+
+
+def sensor_key(sensor):
+    """Ключ датчика: id из каталога OpenAQ, для ручного списка - имя"""
+    return sensor.get("id") if sensor.get("id") is not None else sensor["name"]
+
+
+class SensorIndex:
+    """Сеточный индекс датчиков (ключ -> координаты)"""
+
+    def __init__(self, cell_km=DEFAULT_CELL_KM, ref_lat=DEFAULT_REF_LAT):
+        """
+        Args:
+            cell_km: Размер ячейки сетки, км
+            ref_lat: Опорная широта для ширины ячейки по долготе
+        """
+        self.cell_km = cell_km
+        self.ref_lat = ref_lat
+        self.cell_lat = cell_km / KM_PER_DEG_LAT
+        self.cell_lon = cell_km / (KM_PER_DEG_LAT * math.cos(math.radians(ref_lat)))
+
+        self._cells = {}
+        self._points = {}
+        self._cell_bounds = None
+        self.payloads = {}
+
+    @classmethod
+    def from_sensors(cls, sensors, **kwargs):
+        index = cls(**kwargs)
+        index.sync(sensors)
+        return index
+
+    def __len__(self):
+        return len(self._points)
+
+    def __contains__(self, key):
+        return key in self._points
+
+    def _cell(self, lat, lon):
+        return (math.floor(lat / self.cell_lat), math.floor(lon / self.cell_lon))
+
+    # ------------------------------------------------------------------
+    # Обновление
+    # ------------------------------------------------------------------
+
+    def upsert(self, key, lat, lon, payload=None):
+        """Добавляет датчик или переносит его в новую ячейку"""
+        if key in self._points:
+            old_lat, old_lon = self._points[key]
+            if (old_lat, old_lon) != (lat, lon):
+                self._discard_from_cell(key, old_lat, old_lon)
+            else:
+                if payload is not None:
+                    self.payloads[key] = payload
+                return
+        self._points[key] = (lat, lon)
+        self._cells.setdefault(self._cell(lat, lon), set()).add(key)
+        self._cell_bounds = None
+        if payload is not None:
+            self.payloads[key] = payload
+
+    def remove(self, key):
+        if key not in self._points:
+            return False
+        lat, lon = self._points.pop(key)
+        self._discard_from_cell(key, lat, lon)
+        self.payloads.pop(key, None)
+        return True
+
+    def _discard_from_cell(self, key, lat, lon):
+        cell = self._cell(lat, lon)
+        members = self._cells.get(cell)
+        if members is not None:
+            members.discard(key)
+            if not members:
+                del self._cells[cell]
+                self._cell_bounds = None
+
+    def sync(self, sensors):
+        """
+        Приводит индекс к списку датчиков (например SensorCatalog.sensors())
+        Записи каталога с тем же отпечатком (fingerprint) пропускаются без пересчёта ячеек
+
+        Returns:
+            dict: added, moved, removed
+        """
+        summary = {"added": 0, "moved": 0, "removed": 0}
+        seen = set()
+        for sensor in sensors:
+            key = sensor_key(sensor)
+            seen.add(key)
+            fingerprint = sensor.get("fingerprint")
+            if fingerprint is not None and self.payloads.get(key, {}).get("fingerprint") == fingerprint:
+                continue
+            coords = (sensor["latitude"], sensor["longitude"])
+            if key not in self._points:
+                summary["added"] += 1
+            elif self._points[key] != coords:
+                summary["moved"] += 1
+            self.upsert(key, coords[0], coords[1], payload=sensor)
+
+        for key in [key for key in self._points if key not in seen]:
+            self.remove(key)
+            summary["removed"] += 1
+        return summary
+
+    # ------------------------------------------------------------------
+    # Запросы
+    # ------------------------------------------------------------------
+
+    def _ring_keys(self, center, ring):
+        """Ключи датчиков в ячейках на расстоянии ring (по Чебышёву) от центральной"""
+        ci, cj = center
+        keys = []
+        if ring == 0:
+            keys.extend(self._cells.get(center, ()))
+            return keys
+        for di in range(-ring, ring + 1):
+            step = 1 if abs(di) == ring else 2 * ring
+            for dj in range(-ring, ring + 1, step):
+                keys.extend(self._cells.get((ci + di, cj + dj), ()))
+        return keys
+
+    def _distances(self, lat, lon, keys):
+        coords = np.array([self._points[key] for key in keys], dtype=np.float64)
+        return haversine_matrix([lat], [lon], coords[:, 0], coords[:, 1])[0]
+
+    def _covered_km(self, lat, ring):
+        """Радиус, гарантированно покрытый кольцами 0..ring (ширина ячейки зависит от широты)"""
+        width_factor = math.cos(math.radians(lat)) / math.cos(math.radians(self.ref_lat))
+        return ring * self.cell_km * min(1.0, width_factor)
+
+    def _bounds(self):
+        """Границы занятых ячеек (кэш сбрасывается при изменении индекса)"""
+        if self._cell_bounds is None:
+            rows = [i for i, _ in self._cells]
+            cols = [j for _, j in self._cells]
+            self._cell_bounds = (min(rows), max(rows), min(cols), max(cols))
+        return self._cell_bounds
+
+    def nearest(self, lat, lon, k=1):
+        """
+        k ближайших датчиков
+
+        Кольца ячеек вокруг точки просматриваются, пока k-е расстояние не окажется
+        внутри гарантированно покрытого радиуса
+
+        Returns:
+            list: [(ключ, расстояние км)] по возрастанию расстояния
+        """
+        if not self._points:
+            return []
+        k = min(k, len(self._points))
+
+        center = self._cell(lat, lon)
+        i_min, i_max, j_min, j_max = self._bounds()
+        max_ring = max(center[0] - i_min, i_max - center[0], center[1] - j_min, j_max - center[1])
+
+        if max(i_min - center[0], center[0] - i_max, j_min - center[1], center[1] - j_max) > 0:
+            # Точка вне занятой области: кольца почти все пустые - все датчики разом
+            keys = list(self._points)
+            dists = self._distances(lat, lon, keys)
+        else:
+            keys = []
+            dists = np.empty(0)
+            ring = 0
+            while True:
+                ring_keys = self._ring_keys(center, ring)
+                if ring_keys:
+                    keys.extend(ring_keys)
+                    dists = np.concatenate([dists, self._distances(lat, lon, ring_keys)])
+                if ring >= max_ring:
+                    break
+                if len(keys) >= k and np.partition(dists, k - 1)[k - 1] <= self._covered_km(lat, ring):
+                    break
+                ring += 1
+
+        order = np.argsort(dists, kind='stable')[:k]
+        return [(keys[i], float(dists[i])) for i in order]
+
+    def within(self, lat, lon, radius_km):
+        """
+        Датчики не дальше radius_km
+
+        Returns:
+            list: [(ключ, расстояние км)] по возрастанию расстояния
+        """
+        dlat = radius_km / KM_PER_DEG_LAT
+        dlon = radius_km / (KM_PER_DEG_LAT * max(math.cos(math.radians(abs(lat) + dlat)), 1e-6))
+        i0, j0 = self._cell(lat - dlat, lon - dlon)
+        i1, j1 = self._cell(lat + dlat, lon + dlon)
+
+        keys = []
+        if (i1 - i0 + 1) * (j1 - j0 + 1) > len(self._cells):
+            # Радиус больше занятой области - дешевле пройти по занятым ячейкам
+            for (i, j), members in self._cells.items():
+                if i0 <= i <= i1 and j0 <= j <= j1:
+                    keys.extend(members)
+        else:
+            for i in range(i0, i1 + 1):
+                for j in range(j0, j1 + 1):
+                    keys.extend(self._cells.get((i, j), ()))
+        if not keys:
+            return []
+
+        dists = self._distances(lat, lon, keys)
+        order = np.argsort(dists, kind='stable')
+        return [(keys[i], float(dists[i])) for i in order if dists[i] <= radius_km]
+
+    def within_many(self, lats, lons, radius_km):
+        """Поиск в радиусе для набора точек (например точки линии зрения камеры)"""
+        return [self.within(lat, lon, radius_km) for lat, lon in zip(lats, lons)]
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Пространственный индекс датчиков PM2.5')
+    parser.add_argument('--lat', type=float, required=True)
+    parser.add_argument('--lon', type=float, required=True)
+    parser.add_argument('--k', type=int, default=3, help='Сколько ближайших датчиков')
+    parser.add_argument('--radius-km', type=float, default=None, help='Поиск в радиусе вместо k ближайших')
+    parser.add_argument('--cell-km', type=float, default=DEFAULT_CELL_KM)
+    args = parser.parse_args()
+
+    from sensor_catalog import load_sensors
+
+    sensors = load_sensors(refresh=False)
+    index = SensorIndex.from_sensors(sensors, cell_km=args.cell_km)
+
+    start = time.perf_counter()
+    if args.radius_km is not None:
+        result = index.within(args.lat, args.lon, args.radius_km)
+    else:
+        result = index.nearest(args.lat, args.lon, args.k)
+    elapsed_ms = (time.perf_counter() - start) * 1000
+
+    print(f"📍 Датчиков в индексе: {len(index)} (запрос {elapsed_ms:.3f} мс)")
+    for key, dist_km in result:
+        print(f"  {index.payloads[key]['name']}: {dist_km:.2f} км")
+
+
+if __name__ == "__main__":
+    main()
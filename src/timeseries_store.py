@@ -0,0 +1,739 @@
+"""
+Встроенное хранилище временных рядов показаний (PM2.5 и метео)
+save_data пишет один маленький JSON на каждый запрос - для анализа
+приходилось открывать тысячи файлов
+
+Структура (data/timeseries/):
+    manifest.json                     - ряды (источник, локация) и их чанки с t_min/t_max
+    chunks/<series_id>/<seq>.npz      - колоночные чанки: timestamp (int64, сек) + метрики (float64, NaN = нет)
+    rollups/<series_id>_<res>.npz     - агрегаты по часам/дням (сутки по местному времени): count, sum, min, max
+
+Чанки только дописываются; мелкие хвостовые чанки (по записи на такт) сливаются в один.
+Повтор записи с тем же timestamp объединяется по колонкам (последнее значение побеждает),
+неизменённые записи не дописываются. Агрегаты пересчитываются только для затронутых бакетов;
+rollup помечен ревизией ряда и пересобирается из чанков, если она не совпала с манифестом
+
+Каждая запись ряда увеличивает его ревизию и попадает в журнал изменений (диапазон времени
+записанных строк): корреляции и слияние по changes() пересчитывают только эти часы,
+в том числе запоздавшие и загруженные backfill'ом в прошлое
+"""
+
+import os
+import re
+import json
+import time
+import hashlib
+import argparse
+from collections import OrderedDict
+from contextlib import contextmanager
+from datetime import datetime, timedelta, timezone
+
+import numpy as np
+
+from file_lock import FileLock, file_signature
+
+
+STORE_DIR = "data/timeseries"
+MANIFEST_FILENAME = "manifest.json"
+
+METRICS = ("pm25", "pm10", "temperature", "humidity", "pressure", "wind_speed", "visibility")
+
+RESOLUTIONS = {
+    "hour": 3600,
+    "day": 86400,
+}
+
+# Часовой пояс наивных меток времени: Бишкек, UTC+6 (без перехода на летнее время)
+LOCAL_TZ = timezone(timedelta(hours=6), "Asia/Bishkek")
+UTC_OFFSET = int(LOCAL_TZ.utcoffset(None).total_seconds())
+
+# Формат rollup'ов: при смене границ бакетов старые файлы пересобираются
+ROLLUP_VERSION = 2
+
+# Чанк меньше CHUNK_ROWS считается мелким; при COMPACT_AFTER мелких хвостовых чанков они сливаются
+CHUNK_ROWS = 4096
+COMPACT_AFTER = 16
+
+# Предел памяти под прочитанные чанки (LRU), байт
+CHUNK_CACHE_BYTES = 64 * 1024 * 1024
+
+# Сколько последних записей ряда помнит журнал изменений (для инкрементальных потребителей)
+CHANGE_LOG_SIZE = 4096
+
+
+def to_epoch(value):
+    """
+    Время в секунды unix
+
+    Наивные ISO-строки и datetime - местное время Бишкека (так пишут collect_data и
+    метки OWM), aware переводятся в UTC; np.datetime64 и числа - уже UTC
+    (в таком виде хранилище отдаёт timestamp и bucket)
+
+    Args:
+        value: ISO-строка, datetime, np.datetime64 или число секунд
+    """
+    if isinstance(value, (int, np.integer)):
+        return int(value)
+    if isinstance(value, np.datetime64):
+        return int(value.astype('datetime64[s]').astype(np.int64))
+    if not isinstance(value, datetime):
+        value = datetime.fromisoformat(str(value).replace('Z', '+00:00'))
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=LOCAL_TZ)
+    return int(value.timestamp())
+
+
+def to_epoch_array(values):
+    """Векторный вариант to_epoch (datetime64-массивы переводятся без цикла)"""
+    values = np.asarray(values)
+    if np.issubdtype(values.dtype, np.datetime64):
+        return values.astype('datetime64[s]').astype(np.int64)
+    if np.issubdtype(values.dtype, np.integer):
+        return values.astype(np.int64)
+    return np.array([to_epoch(v) for v in values], dtype=np.int64)
+
+
+def bucket_start(epochs, step):
+    """Начало бакета шириной step секунд: сутки - от местной полуночи, а не от 00:00 UTC"""
+    return epochs - (epochs + UTC_OFFSET) % step
+
+
+def series_id(source, location):
+    """ID ряда для имён файлов: читаемый slug + короткий хэш (без коллизий после slug)"""
+    slug = re.sub(r'[^a-z0-9]+', '_', f"{source}_{location}".lower()).strip('_')
+    digest = hashlib.sha1(f"{source}\n{location}".encode('utf-8')).hexdigest()[:6]
+    return f"{slug[:48]}_{digest}"
+
+
+def merge_ranges(ranges, gap=0):
+    """
+    Объединяет пересекающиеся диапазоны [lo, hi] (и отстоящие не больше чем на gap)
+
+    Returns:
+        list: [(lo, hi)] по возрастанию
+    """
+    merged = []
+    for lo, hi in sorted(ranges):
+        if merged and lo <= merged[-1][1] + gap:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], hi))
+        else:
+            merged.append((lo, hi))
+    return merged
+
+
+def _merge_rows(ts, columns):
+    """
+    Сортирует строки по времени и схлопывает дубликаты timestamp
+
+    Для каждой колонки берётся последнее не-NaN значение (порядок записи сохраняется)
+
+    Returns:
+        tuple: (ts уникальные, dict метрика -> массив)
+    """
+    order = np.argsort(ts, kind='stable')
+    ts = ts[order]
+    unique_ts, inverse = np.unique(ts, return_inverse=True)
+
+    merged = {}
+    for name, values in columns.items():
+        values = values[order]
+        out = np.full(len(unique_ts), np.nan)
+        valid = ~np.isnan(values)
+        groups = inverse[valid]
+        if len(groups):
+            # Последнее вхождение группы = первое в развёрнутом массиве
+            _, last = np.unique(groups[::-1], return_index=True)
+            picked = np.flatnonzero(valid)[::-1][last]
+            out[inverse[picked]] = values[picked]
+        merged[name] = out
+    return unique_ts, merged
+
+
+def _chunk_nbytes(chunk):
+    ts, columns = chunk
+    return ts.nbytes + sum(values.nbytes for values in columns.values())
+
+
+def _empty_rollup():
+    return {
+        "bucket": np.empty(0, dtype=np.int64),
+        "count": np.empty((0, len(METRICS)), dtype=np.int64),
+        "sum": np.empty((0, len(METRICS))),
+        "min": np.empty((0, len(METRICS))),
+        "max": np.empty((0, len(METRICS))),
+    }
+
+
+def _bucket_aggregates(ts, columns, step):
+    """
+    count/sum/min/max по бакетам шириной step секунд (ts отсортированы)
+
+    Returns:
+        dict: bucket (n,), count/sum/min/max (n, n_metrics)
+    """
+    buckets = bucket_start(ts, step)
+    starts = np.flatnonzero(np.r_[True, buckets[1:] != buckets[:-1]])
+    values = np.column_stack([columns[name] for name in METRICS])
+    valid = ~np.isnan(values)
+
+    return {
+        "bucket": buckets[starts],
+        "count": np.add.reduceat(valid.astype(np.int64), starts, axis=0),
+        "sum": np.add.reduceat(np.where(valid, values, 0.0), starts, axis=0),
+        "min": np.fmin.reduceat(values, starts, axis=0),
+        "max": np.fmax.reduceat(values, starts, axis=0),
+    }
+
+
+class TimeSeriesStore:
+    """Хранилище рядов (источник, локация) с колоночными чанками и агрегатами"""
+
+    def __init__(self, root=STORE_DIR, chunk_rows=CHUNK_ROWS, compact_after=COMPACT_AFTER,
+                 chunk_cache_bytes=CHUNK_CACHE_BYTES):
+        """
+        Args:
+            root: Директория хранилища
+            chunk_rows: Чанк меньше этого размера считается мелким
+            compact_after: Сколько мелких хвостовых чанков копится до слияния
+            chunk_cache_bytes: Предел памяти под кэш прочитанных чанков
+        """
+        self.root = root
+        self.chunk_rows = chunk_rows
+        self.compact_after = compact_after
+        self.chunk_cache_bytes = chunk_cache_bytes
+
+        # Хранилище пишут несколько процессов (сборщики, backfill, fusion): манифест
+        # перечитывается и меняется только под файловой блокировкой
+        self._lock = FileLock(os.path.join(root, MANIFEST_FILENAME + ".lock"))
+        self._chunk_cache = OrderedDict()
+        self._chunk_cache_size = 0
+        self._rollup_cache = {}
+
+        os.makedirs(os.path.join(root, "chunks"), exist_ok=True)
+        os.makedirs(os.path.join(root, "rollups"), exist_ok=True)
+        # Манифест читается при первом захвате блокировки и перечитывается, если файл изменился
+        self._manifest = {}
+        self._manifest_signature = None
+
+        with self._locked():
+            self._sweep_orphans()
+
+    # ------------------------------------------------------------------
+    # Файлы
+    # ------------------------------------------------------------------
+
+    @contextmanager
+    def _locked(self):
+        """Файловая блокировка + актуальный манифест (другой процесс мог его изменить)"""
+        with self._lock:
+            path = os.path.join(self.root, MANIFEST_FILENAME)
+            signature = file_signature(path)
+            if signature != self._manifest_signature:
+                if signature is None:
+                    self._manifest = {}
+                else:
+                    with open(path, 'r', encoding='utf-8') as f:
+                        self._manifest = json.load(f)
+                self._manifest_signature = signature
+            yield
+
+    def _save_manifest(self):
+        path = os.path.join(self.root, MANIFEST_FILENAME)
+        with open(path + ".tmp", 'w', encoding='utf-8') as f:
+            json.dump(self._manifest, f, indent=1, ensure_ascii=False)
+        os.replace(path + ".tmp", path)
+        self._manifest_signature = file_signature(path)
+
+    def _sweep_orphans(self):
+        """
+        Удаляет чанки, на которые не ссылается манифест: слитые чанки, не удалённые
+        из-за сбоя после сохранения манифеста, и чанки записи, упавшей до его сохранения
+        (под блокировкой: все чанки работающих писателей уже в манифесте)
+        """
+        chunks_dir = os.path.join(self.root, "chunks")
+        for sid in os.listdir(chunks_dir):
+            series = self._manifest.get(sid)
+            known = {chunk["file"] for chunk in series["chunks"]} if series is not None else set()
+            series_dir = os.path.join(chunks_dir, sid)
+            for filename in os.listdir(series_dir):
+                if filename not in known:
+                    os.remove(os.path.join(series_dir, filename))
+
+    def _chunk_path(self, sid, filename):
+        return os.path.join(self.root, "chunks", sid, filename)
+
+    def _rollup_path(self, sid, resolution):
+        return os.path.join(self.root, "rollups", f"{sid}_{resolution}.npz")
+
+    def _write_chunk(self, sid, ts, columns):
+        series = self._manifest[sid]
+        filename = f"{series['next_seq']:06d}.npz"
+        series["next_seq"] += 1
+
+        path = self._chunk_path(sid, filename)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path + ".tmp", 'wb') as f:
+            np.savez(f, timestamp=ts, **columns)
+        os.replace(path + ".tmp", path)
+
+        return {"file": filename, "t_min": int(ts[0]), "t_max": int(ts[-1]), "rows": int(len(ts))}
+
+    def _read_chunk(self, sid, filename):
+        # Чанк неизменяем, а номера чанков ряда не переиспользуются - кэш не устаревает
+        key = (sid, filename)
+        cached = self._chunk_cache.get(key)
+        if cached is not None:
+            self._chunk_cache.move_to_end(key)
+            return cached
+
+        with np.load(self._chunk_path(sid, filename)) as data:
+            cached = (data["timestamp"], {name: data[name] for name in METRICS})
+
+        self._chunk_cache[key] = cached
+        self._chunk_cache_size += _chunk_nbytes(cached)
+        while self._chunk_cache_size > self.chunk_cache_bytes and len(self._chunk_cache) > 1:
+            _, evicted = self._chunk_cache.popitem(last=False)
+            self._chunk_cache_size -= _chunk_nbytes(evicted)
+        return cached
+
+    def _drop_chunk(self, sid, filename):
+        cached = self._chunk_cache.pop((sid, filename), None)
+        if cached is not None:
+            self._chunk_cache_size -= _chunk_nbytes(cached)
+
+    def _load_rollup(self, sid, resolution):
+        """
+        Returns:
+            tuple: (ревизия ряда, по которой построен rollup, или None; rollup)
+        """
+        path = self._rollup_path(sid, resolution)
+        signature = file_signature(path)
+        cached = self._rollup_cache.get((sid, resolution))
+        if cached is not None and cached[0] == signature:
+            return cached[1], cached[2]
+
+        revision, rollup = None, _empty_rollup()
+        if signature is not None:
+            with np.load(path) as data:
+                rollup = {name: data[name] for name in ("bucket", "count", "sum", "min", "max")}
+                if "revision" in data and int(data.get("version", 1)) == ROLLUP_VERSION:
+                    revision = int(data["revision"])
+
+        self._rollup_cache[(sid, resolution)] = (signature, revision, rollup)
+        return revision, rollup
+
+    def _read_rollup(self, sid, resolution):
+        """Rollup ряда; построенный не по текущей ревизии манифеста пересобирается из чанков"""
+        revision, rollup = self._load_rollup(sid, resolution)
+        current = self._manifest[sid].get("revision", 0)
+        if revision != current:
+            rollup = self._build_rollup(sid, RESOLUTIONS[resolution])
+            self._write_rollup(sid, resolution, rollup, current)
+        return rollup
+
+    def _build_rollup(self, sid, step):
+        ts, columns = self._query_raw(sid, *self._bounds(None, None))
+        return _bucket_aggregates(ts, columns, step) if len(ts) else _empty_rollup()
+
+    def _write_rollup(self, sid, resolution, rollup, revision):
+        path = self._rollup_path(sid, resolution)
+        with open(path + ".tmp", 'wb') as f:
+            np.savez(f, version=np.int64(ROLLUP_VERSION), revision=np.int64(revision), **rollup)
+        os.replace(path + ".tmp", path)
+        self._rollup_cache[(sid, resolution)] = (file_signature(path), revision, rollup)
+
+    # ------------------------------------------------------------------
+    # Запись
+    # ------------------------------------------------------------------
+
+    def append(self, source, location, records):
+        """
+        Дописывает записи одного ряда
+
+        Args:
+            source, location: Ряд (например 'openaq', 'sensor_123')
+            records: dict'ы с 'timestamp' и любыми из METRICS
+
+        Returns:
+            int: сколько строк (новых или изменённых) записано
+        """
+        rows = [r for r in records if r.get("timestamp")]
+        if not rows:
+            return 0
+
+        ts = np.array([to_epoch(r["timestamp"]) for r in rows], dtype=np.int64)
+        columns = {
+            name: np.array([np.nan if r.get(name) is None else float(r[name]) for r in rows])
+            for name in METRICS
+        }
+        ts, columns = _merge_rows(ts, columns)
+
+        with self._locked():
+            sid = series_id(source, location)
+            if sid not in self._manifest:
+                self._manifest[sid] = {"source": source, "location": location, "chunks": [], "next_seq": 0}
+
+            # Объединяем с уже сохранёнными значениями и отбрасываем неизменённые строки
+            existing_ts, existing = self._query_raw(sid, int(ts[0]), int(ts[-1]))
+            if len(existing_ts):
+                pos = np.searchsorted(existing_ts, ts)
+                pos_clipped = np.minimum(pos, len(existing_ts) - 1)
+                known = existing_ts[pos_clipped] == ts
+                changed = ~known
+                for name in METRICS:
+                    old = np.where(known, existing[name][pos_clipped], np.nan)
+                    new = columns[name]
+                    differs = ~np.isnan(new) & ~(new == old)
+                    changed |= known & differs
+                if not changed.any():
+                    return 0
+                ts = ts[changed]
+                columns = {name: values[changed] for name, values in columns.items()}
+
+            series = self._manifest[sid]
+            series["chunks"].append(self._write_chunk(sid, ts, columns))
+            obsolete = self._compact_tail(sid)
+
+            series["revision"] = series.get("revision", 0) + 1
+            log = series.setdefault("changes", [])
+            log.append([series["revision"], int(ts[0]), int(ts[-1])])
+            del log[:-CHANGE_LOG_SIZE]
+
+            # Rollup'ы пишутся до манифеста и помечены его ревизией: после сбоя между
+            # шагами ревизии не совпадут и rollup пересоберётся (повтор записи отбросится)
+            self._update_rollups(sid, ts)
+            self._save_manifest()
+
+            # Слитые чанки удаляются только после сохранения манифеста, который на них
+            # больше не ссылается (сбой между шагами оставит сироту - см. _sweep_orphans)
+            for filename in obsolete:
+                os.remove(self._chunk_path(sid, filename))
+            return int(len(ts))
+
+    def append_records(self, records):
+        """
+        Дописывает записи в формате fetch_pm25_data/backfill
+
+        Ряд определяется по 'source' (в нижнем регистре) и 'location' (или 'city')
+
+        Returns:
+            int: сколько строк записано
+        """
+        groups = {}
+        for record in records or []:
+            source = str(record.get("source", "unknown")).lower()
+            location = str(record.get("location") or record.get("city") or "unknown")
+            groups.setdefault((source, location), []).append(record)
+
+        return sum(self.append(source, location, rows) for (source, location), rows in groups.items())
+
+    def write(self, job_key, records):
+        """Интерфейс sink для backfill.HistoricalBackfill"""
+        self.append_records(records)
+
+    def _compact_tail(self, sid):
+        """
+        Сливает хвост мелких чанков в один (порядок записи сохраняется)
+
+        Returns:
+            list: файлы слитых чанков - удалить после сохранения манифеста
+        """
+        chunks = self._manifest[sid]["chunks"]
+        tail = 0
+        while tail < len(chunks) and chunks[-1 - tail]["rows"] < self.chunk_rows:
+            tail += 1
+        if tail < self.compact_after:
+            return []
+
+        small = chunks[-tail:]
+        parts = [self._read_chunk(sid, chunk["file"]) for chunk in small]
+        ts = np.concatenate([p[0] for p in parts])
+        columns = {name: np.concatenate([p[1][name] for p in parts]) for name in METRICS}
+        ts, columns = _merge_rows(ts, columns)
+
+        merged = self._write_chunk(sid, ts, columns)
+        self._manifest[sid]["chunks"] = chunks[:-tail] + [merged]
+
+        for chunk in small:
+            self._drop_chunk(sid, chunk["file"])
+        return [chunk["file"] for chunk in small]
+
+    def _update_rollups(self, sid, new_ts):
+        """Пересчёт агрегатов только для бакетов, в которые попали новые строки"""
+        revision = self._manifest[sid]["revision"]
+        for resolution, step in RESOLUTIONS.items():
+            previous, rollup = self._load_rollup(sid, resolution)
+            if previous != revision - 1:
+                # Rollup отстал или забежал вперёд (сбой прошлой записи) - пересборка целиком
+                self._write_rollup(sid, resolution, self._build_rollup(sid, step), revision)
+                continue
+
+            touched = np.unique(bucket_start(new_ts, step))
+            low, high = int(touched[0]), int(touched[-1]) + step - 1
+
+            ts, columns = self._query_raw(sid, low, high)
+            fresh = _bucket_aggregates(ts, columns, step)
+
+            # Бакеты внутри [low, high] пересчитаны по сырым строкам целиком
+            keep = (rollup["bucket"] < low) | (rollup["bucket"] > high)
+            combined = {name: np.concatenate([rollup[name][keep], fresh[name]]) for name in rollup}
+            order = np.argsort(combined["bucket"], kind='stable')
+            combined = {name: values[order] for name, values in combined.items()}
+
+            self._write_rollup(sid, resolution, combined, revision)
+
+    # ------------------------------------------------------------------
+    # Чтение
+    # ------------------------------------------------------------------
+
+    def _query_raw(self, sid, start, end):
+        """Строки ряда в [start, end] (секунды), дубликаты схлопнуты"""
+        series = self._manifest.get(sid)
+        parts = []
+        if series is not None:
+            for chunk in series["chunks"]:
+                if chunk["t_max"] < start or chunk["t_min"] > end:
+                    continue
+                ts, columns = self._read_chunk(sid, chunk["file"])
+                mask = (ts >= start) & (ts <= end)
+                if mask.any():
+                    parts.append((ts[mask], {name: values[mask] for name, values in columns.items()}))
+
+        if not parts:
+            return np.empty(0, dtype=np.int64), {name: np.empty(0) for name in METRICS}
+
+        ts = np.concatenate([p[0] for p in parts])
+        columns = {name: np.concatenate([p[1][name] for p in parts]) for name in METRICS}
+        return _merge_rows(ts, columns)
+
+    def _match_series(self, source=None, location=None):
+        """source / location: значение, набор значений или None (любые)"""
+        sources = {source} if isinstance(source, str) else source
+        locations = {location} if isinstance(location, str) else location
+        return [
+            sid for sid, series in sorted(self._manifest.items())
+            if (sources is None or series["source"] in sources)
+            and (locations is None or series["location"] in locations)
+        ]
+
+    @staticmethod
+    def _bounds(start, end):
+        low = to_epoch(start) if start is not None else np.iinfo(np.int64).min
+        high = to_epoch(end) if end is not None else np.iinfo(np.int64).max
+        return low, high
+
+    def series(self):
+        """
+        Returns:
+            list: [{source, location, rows, t_min, t_max}]
+        """
+        with self._locked():
+            result = []
+            for sid in self._match_series():
+                series = self._manifest[sid]
+                chunks = series["chunks"]
+                result.append({
+                    "source": series["source"],
+                    "location": series["location"],
+                    "rows": sum(c["rows"] for c in chunks),
+                    "t_min": min((c["t_min"] for c in chunks), default=None),
+                    "t_max": max((c["t_max"] for c in chunks), default=None)
+                })
+            return result
+
+    def changes(self, since=None, source=None):
+        """
+        Диапазоны времени, записанные в ряды после ревизий since
+
+        Args:
+            since: {series_id: ревизия} из прошлого вызова (None = всё содержимое рядов)
+            source: Фильтр рядов (значение или набор)
+
+        Returns:
+            tuple: (ревизии {series_id: ревизия} на сейчас,
+                    [(t_min, t_max)] изменённых строк, секунды, объединённые merge_ranges)
+        """
+        since = since or {}
+        revisions, ranges = {}, []
+        with self._locked():
+            for sid in self._match_series(source):
+                series = self._manifest[sid]
+                revision = series.get("revision", 0)
+                revisions[sid] = revision
+                if sid in since and revision <= since[sid]:
+                    continue
+
+                log = series.get("changes", [])
+                seen = since.get(sid)
+                if seen is not None and log and log[0][0] <= seen + 1:
+                    ranges.extend((lo, hi) for rev, lo, hi in log if rev > seen)
+                elif series["chunks"]:
+                    # Ряд новый для потребителя или журнал уже не покрывает его ревизию - весь ряд
+                    ranges.append((min(c["t_min"] for c in series["chunks"]),
+                                   max(c["t_max"] for c in series["chunks"])))
+        return revisions, merge_ranges(ranges)
+
+    def query(self, source, location, start=None, end=None, metrics=None):
+        """
+        Сырые показания ряда за период (границы включительно)
+
+        Returns:
+            dict: timestamp (datetime64[s], UTC) и массивы метрик
+        """
+        low, high = self._bounds(start, end)
+        with self._locked():
+            ts, columns = self._query_raw(series_id(source, location), low, high)
+
+        result = {"timestamp": ts.astype('datetime64[s]')}
+        for name in metrics or METRICS:
+            result[name] = columns[name]
+        return result
+
+    def aggregate(self, source=None, location=None, start=None, end=None, resolution="hour", metrics=None):
+        """
+        Агрегаты по часам/дням из готовых rollup'ов (без чтения сырых чанков)
+
+        Несколько рядов (source/location = None или список) объединяются: среднее взвешено по числу показаний
+
+        Returns:
+            dict: bucket (datetime64[s]) и для каждой метрики <m>_mean, <m>_min, <m>_max, <m>_count
+        """
+        low, high = self._bounds(start, end)
+        with self._locked():
+            parts = []
+            for sid in self._match_series(source, location):
+                rollup = self._read_rollup(sid, resolution)
+                mask = (rollup["bucket"] >= low) & (rollup["bucket"] <= high)
+                parts.append({name: values[mask] for name, values in rollup.items()})
+
+        if parts:
+            combined = {name: np.concatenate([p[name] for p in parts]) for name in parts[0]}
+        else:
+            combined = _empty_rollup()
+
+        buckets, inverse = np.unique(combined["bucket"], return_inverse=True)
+        n = len(buckets)
+        count = np.zeros((n, len(METRICS)), dtype=np.int64)
+        total = np.zeros((n, len(METRICS)))
+        low_v = np.full((n, len(METRICS)), np.nan)
+        high_v = np.full((n, len(METRICS)), np.nan)
+        np.add.at(count, inverse, combined["count"])
+        np.add.at(total, inverse, combined["sum"])
+        np.fmin.at(low_v, inverse, combined["min"])
+        np.fmax.at(high_v, inverse, combined["max"])
+
+        with np.errstate(invalid='ignore', divide='ignore'):
+            mean = np.where(count > 0, total / count, np.nan)
+
+        result = {"bucket": buckets.astype('datetime64[s]')}
+        for name in metrics or METRICS:
+            j = METRICS.index(name)
+            result[f"{name}_mean"] = mean[:, j]
+            result[f"{name}_min"] = low_v[:, j]
+            result[f"{name}_max"] = high_v[:, j]
+            result[f"{name}_count"] = count[:, j]
+        return result
+
+    def lookup(self, metric, timestamps, source=None, location=None, resolution="hour"):
+        """
+        Среднее метрики в бакете каждого момента времени (для сборки датасета)
+
+        Args:
+            metric: Имя метрики из METRICS
+            timestamps: Массив моментов (ISO-строки, datetime или datetime64)
+            source, location: Фильтр рядов (None = все, список = любой из)
+
+        Returns:
+            np.array (n,) float64, NaN где показаний нет
+        """
+        step = RESOLUTIONS[resolution]
+        ts = to_epoch_array(timestamps)
+        if len(ts) == 0:
+            return np.empty(0)
+
+        buckets = bucket_start(ts, step)
+        agg = self.aggregate(source, location, int(buckets.min()), int(buckets.max()), resolution, [metric])
+        known = agg["bucket"].astype(np.int64)
+        if len(known) == 0:
+            return np.full(len(ts), np.nan)
+
+        pos = np.minimum(np.searchsorted(known, buckets), len(known) - 1)
+        return np.where(known[pos] == buckets, agg[f"{metric}_mean"][pos], np.nan)
+
+
+def import_json_files(store, paths):
+    """
+    Импорт накопленных файлов: data/pm25/*.json (списки записей) и backfill *.jsonl
+
+    Returns:
+        int: записано строк
+    """
+    written = 0
+    for path in paths:
+        with open(path, 'r', encoding='utf-8') as f:
+            if path.endswith(".jsonl"):
+                records = [json.loads(line) for line in f if line.strip()]
+            else:
+                records = json.load(f)
+        if isinstance(records, dict):
+            records = [records]
+        written += store.append_records(records)
+    return written
+
+
+def _format_ts(value):
+    return None if value is None else datetime.fromtimestamp(value, tz=LOCAL_TZ).strftime('%Y-%m-%d %H:%M')
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Хранилище временных рядов показаний')
+    parser.add_argument('--store', type=str, default=STORE_DIR, help=f'Директория хранилища (default: {STORE_DIR})')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    import_parser = subparsers.add_parser('import', help='Импорт JSON/JSONL файлов показаний')
+    import_parser.add_argument('dirs', nargs='*', default=['data/pm25', 'data/pm25/backfill'])
+
+    subparsers.add_parser('series', help='Список рядов')
+
+    agg_parser = subparsers.add_parser('aggregate', help='Агрегаты по часам/дням')
+    agg_parser.add_argument('--source', type=str, default=None)
+    agg_parser.add_argument('--location', type=str, default=None)
+    agg_parser.add_argument('--start', type=str, default=None)
+    agg_parser.add_argument('--end', type=str, default=None)
+    agg_parser.add_argument('--resolution', choices=list(RESOLUTIONS), default='day')
+    agg_parser.add_argument('--metric', choices=METRICS, default='pm25')
+
+    args = parser.parse_args()
+    store = TimeSeriesStore(args.store)
+
+    if args.command == 'import':
+        paths = []
+        for directory in args.dirs:
+            if os.path.isdir(directory):
+                paths.extend(
+                    os.path.join(directory, name) for name in sorted(os.listdir(directory))
+                    if name.endswith(('.json', '.jsonl')) and not name.startswith(('.', 'checkpoint_'))
+                )
+        start = time.perf_counter()
+        written = import_json_files(store, paths)
+        print(f"✅ Импортировано файлов: {len(paths)}, строк: {written} ({time.perf_counter() - start:.1f} с)")
+
+    elif args.command == 'series':
+        for info in store.series():
+            print(f"{info['source']:<16} {info['location']:<32} {info['rows']:>8} строк  "
+                  f"{_format_ts(info['t_min'])} — {_format_ts(info['t_max'])}")
+
+    elif args.command == 'aggregate':
+        start = time.perf_counter()
+        agg = store.aggregate(args.source, args.location, args.start, args.end, args.resolution, [args.metric])
+        elapsed_ms = (time.perf_counter() - start) * 1000
+
+        for i, bucket in enumerate(agg["bucket"]):
+            print(f"{_format_ts(int(bucket.astype(np.int64)))}  mean={agg[f'{args.metric}_mean'][i]:.1f}  "
+                  f"min={agg[f'{args.metric}_min'][i]:.1f}  max={agg[f'{args.metric}_max'][i]:.1f}  "
+                  f"n={agg[f'{args.metric}_count'][i]}")
+        print(f"📊 {len(agg['bucket'])} бакетов ({elapsed_ms:.1f} мс)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,5 @@
+import os
+import sys
+
+# Модули проекта лежат плоско в src/ и импортируют друг друга по имени
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src"))
@@ -0,0 +1,25 @@
+import json
+
+import numpy as np
+import pytest
+
+from baseline_model import BaselineWeatherModel
+
+
+def test_load_rejects_other_features(tmp_path):
+    rng = np.random.default_rng(0)
+    X, y = rng.normal(size=(50, 6)), rng.normal(size=50)
+    model = BaselineWeatherModel()
+    model.train(X, y)
+    path = model.save(str(tmp_path / "model.npz"))
+    np.testing.assert_array_equal(BaselineWeatherModel.load(path).predict(X), model.predict(X))
+
+    with np.load(path) as data:
+        arrays = {name: data[name] for name in data.files}
+    info = json.loads(str(arrays["info"]))
+    info["feature_names"] = info["feature_names"][::-1]
+    arrays["info"] = np.array(json.dumps(info))
+    np.savez(str(tmp_path / "other.npz"), **arrays)
+
+    with pytest.raises(ValueError):
+        BaselineWeatherModel.load(str(tmp_path / "other.npz"))
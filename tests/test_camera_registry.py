@@ -0,0 +1,29 @@
+import json
+import os
+
+from camera_config import CAMERAS
+from camera_registry import CameraRegistry, config_divergence
+
+
+def test_readers_do_not_seed(tmp_path):
+    path = str(tmp_path / "cameras.json")
+    registry = CameraRegistry(path)
+    assert not os.path.exists(path)
+    assert registry.cameras() == {}
+
+
+def test_warns_when_config_diverges(tmp_path, capsys):
+    path = str(tmp_path / "cameras.json")
+    CameraRegistry(path, seed=True)
+    assert config_divergence(CameraRegistry(path).cameras(include_disabled=True)) == {"missing": set(), "changed": set()}
+
+    removed = sorted(CAMERAS)[0]
+    with open(path, 'r', encoding='utf-8') as f:
+        data = json.load(f)
+    del data["cameras"][removed]
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(data, f)
+
+    capsys.readouterr()
+    CameraRegistry(path)
+    assert removed in capsys.readouterr().out
@@ -0,0 +1,53 @@
+import json
+
+from collect_data import MultiCameraCapture
+from collector_cluster import CollectorWorker, POLLER_LEASE, lease_gated
+from dataset import iter_samples
+from readings_poller import tick_path
+
+
+CAMERAS = {f"cam{i}": {"name": f"Камера {i}", "url": "", "coordinates": None} for i in range(12)}
+T0 = 1_736_481_600  # 2025-01-10 04:00 UTC, кратно 10 минутам
+
+
+def _capture(camera_id, camera_info, timestamp):
+    return {"camera_id": camera_id, "camera_name": camera_info["name"], "success": True,
+            "filepath": f"{camera_id}.jpg", "timestamp": timestamp, "resolution": (1, 1), "coordinates": None}
+
+
+def test_cluster_frames_share_poller_tick(tmp_path):
+    db = str(tmp_path / "cluster.sqlite")
+    ticks_dir = tmp_path / "data" / "pm25" / "ticks"
+    ticks_dir.mkdir(parents=True)
+    workers = [CollectorWorker(dict(CAMERAS), db_path=db, worker_id=name, extra_leases=(POLLER_LEASE,))
+               for name in ("a", "b")]
+    for worker in workers + workers:
+        worker.rebalance(now=T0)
+
+    polled = []
+
+    def poll(tick_id, timestamp):
+        polled.append(tick_id)
+        with open(tick_path(tick_id, str(ticks_dir)), 'w', encoding='utf-8') as f:
+            json.dump({"tick_id": tick_id, "timestamp": timestamp.isoformat(),
+                       "readings": [{"pm25": 50.0, "temperature": -3.0}]}, f)
+
+    results = []
+    # Сборщики просыпаются в разные секунды одного интервала
+    for worker, offset in zip(workers, (3, 41)):
+        capture = MultiCameraCapture(dict(CAMERAS), output_dir=str(tmp_path / "images"), cluster=worker,
+                                     tick_listeners=[lease_gated(worker, POLLER_LEASE, poll)])
+        capture.capture_single_camera = _capture
+        results += capture.capture_all_cameras(interval_minutes=10, now=T0 + offset)
+
+    assert {r["camera_id"] for r in results} == set(CAMERAS)
+    assert len({r["tick_id"] for r in results}) == 1
+    assert polled == [results[0]["tick_id"]]
+
+    metadata_dir = tmp_path / "data" / "metadata"
+    metadata_dir.mkdir()
+    for r in results:
+        with open(metadata_dir / f"{r['camera_id']}_{r['tick_id']}.json", 'w', encoding='utf-8') as f:
+            json.dump({"camera_id": r["camera_id"], "timestamp": r["timestamp"].isoformat(),
+                       "tick_id": r["tick_id"]}, f)
+    assert {s["camera_id"] for s in iter_samples(str(tmp_path / "data"))} == set(CAMERAS)
@@ -0,0 +1,115 @@
+import tarfile
+
+import pytest
+
+from collector_cluster import POLLER_LEASE, CollectorWorker, HashRing, lease_gated
+from image_archive import ShardedArchiveReader, ShardedArchiveWriter
+
+
+CAMERAS = {f"cam{i}": {"name": f"Камера {i}"} for i in range(12)}
+T0 = 1_700_000_000.0
+
+
+def _worker(tmp_path, worker_id, **kwargs):
+    return CollectorWorker(dict(CAMERAS), db_path=str(tmp_path / "cluster.sqlite"), worker_id=worker_id,
+                           lease_ttl=180, **kwargs)
+
+
+def _pair(tmp_path, **kwargs):
+    first = _worker(tmp_path, "a", extra_leases=[POLLER_LEASE], **kwargs)
+    second = _worker(tmp_path, "b", extra_leases=[POLLER_LEASE], **kwargs)
+    first.rebalance(now=T0)
+    second.rebalance(now=T0 + 1)
+    # Первый отпускает камеры второго, второй их забирает
+    first.rebalance(now=T0 + 2)
+    second.rebalance(now=T0 + 3)
+    return first, second
+
+
+def test_hash_ring_moves_only_keys_of_new_node():
+    keys = [f"cam{i}" for i in range(200)]
+    before = HashRing(["a", "b"])
+    after = HashRing(["a", "b", "c"])
+
+    assert {before.owner(key) for key in keys} == {"a", "b"}
+    moved = [key for key in keys if before.owner(key) != after.owner(key)]
+    assert moved and all(after.owner(key) == "c" for key in moved)
+    assert HashRing([]).owner("cam0") is None
+
+
+def test_workers_split_cameras_by_ring(tmp_path):
+    first, second = _pair(tmp_path)
+    ring = HashRing(["a", "b"])
+
+    assert set(first.owned_cameras()) == {c for c in CAMERAS if ring.owner(c) == "a"}
+    assert set(second.owned_cameras()) == {c for c in CAMERAS if ring.owner(c) == "b"}
+    # Задача "одна на кластер" - ровно у одного сборщика
+    assert first.holds(POLLER_LEASE) != second.holds(POLLER_LEASE)
+
+
+def test_expired_leases_are_taken_over(tmp_path):
+    lost = []
+    first, second = _pair(tmp_path, on_release=lambda camera_ids, terminate: lost.append((camera_ids, terminate)))
+    first_cameras = set(first.owned_cameras())
+    lost.clear()
+
+    # Первый сборщик завис: пока аренды живы, его камеры никто не берёт
+    assert set(second.rebalance(now=T0 + 100)) == set(CAMERAS) - first_cameras
+    # Heartbeat и аренды истекли - всё у второго
+    assert set(second.rebalance(now=T0 + 200)) == set(CAMERAS)
+    assert second.holds(POLLER_LEASE)
+
+    # Очнувшийся сборщик узнаёт о перехвате и не трогает шарды (terminate=False)
+    assert first.rebalance(now=T0 + 201) == {}
+    assert lost == [(first_cameras, False)]
+
+
+def test_stop_hands_cameras_over_without_ttl(tmp_path):
+    first, second = _pair(tmp_path)
+    first.stop()
+
+    assert not first.holds(POLLER_LEASE) and first.owned_cameras() == {}
+    assert set(second.rebalance(now=T0 + 4)) == set(CAMERAS)
+    assert second.holds(POLLER_LEASE)
+
+
+def test_lease_gated_runs_only_for_holder(tmp_path):
+    first, second = _pair(tmp_path)
+    calls = []
+    polls = [lease_gated(worker, POLLER_LEASE, lambda tick: calls.append(tick) or tick) for worker in (first, second)]
+
+    assert sorted([poll("t1") for poll in polls], key=str) == [None, "t1"]
+    assert calls == ["t1"]
+
+
+def test_handoff_during_capture_does_not_reopen_shard(tmp_path):
+    archive = str(tmp_path / "archive")
+    first = _worker(tmp_path, "a")
+    writer = ShardedArchiveWriter(archive, guard=first.holds)
+    first.on_release = lambda camera_ids, terminate: [writer.close_camera(c, terminate) for c in camera_ids]
+
+    # Такт начался: все камеры у первого сборщика, кадры пишутся
+    first.rebalance(now=T0)
+    for camera_id in CAMERAS:
+        writer.append(camera_id, "20250110_100000", b"before")
+
+    # Пока кадры такта ещё снимаются, heartbeat отдаёт часть камер второму сборщику
+    second = _worker(tmp_path, "b")
+    second.rebalance(now=T0 + 1)
+    released = set(CAMERAS) - set(first.rebalance(now=T0 + 2))
+    assert released
+
+    moved = sorted(released)[0]
+    with pytest.raises(RuntimeError):
+        writer.append(moved, "20250110_100001", b"late")
+    assert moved not in writer.cameras()
+
+    # Шард закрыт целым, новый владелец дописывает его после захвата аренды
+    assert moved in second.rebalance(now=T0 + 3)
+    with ShardedArchiveWriter(archive, guard=second.holds) as new_owner:
+        new_owner.append(moved, "20250110_100002", b"after")
+    with tarfile.open(str(tmp_path / "archive" / moved / "shard_000001.tar")) as tar:
+        assert len(tar.getmembers()) == 2
+    reader = ShardedArchiveReader(archive)
+    assert [e["timestamp"] for e in reader.list_frames(moved)] == ["20250110_100000", "20250110_100002"]
+    writer.close()
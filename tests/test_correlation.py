@@ -0,0 +1,51 @@
+import numpy as np
+
+from correlation import CorrelationEngine
+from timeseries_store import TimeSeriesStore
+
+
+SENSORS = [
+    {"id": 1, "name": "A", "latitude": 42.87, "longitude": 74.60, "sensors": [{"id": 11}]},
+    {"id": 2, "name": "B", "latitude": 42.87, "longitude": 74.65, "sensors": [{"id": 21}]},
+]
+T0 = 1_700_000_000 - 1_700_000_000 % 3600
+
+
+def _records(location, hours, values):
+    return [{"source": "OpenAQ", "location": location, "timestamp": T0 + h * 3600, "pm25": float(v)}
+            for h, v in zip(hours, values)]
+
+
+def test_backfilled_past_hours_update_correlation(tmp_path):
+    rng = np.random.default_rng(0)
+    signal = rng.normal(50, 20, 400)
+    noise = rng.normal(0, 5, (2, 400))
+    store = TimeSeriesStore(str(tmp_path / "store"))
+    engine = CorrelationEngine(store, state_path=str(tmp_path / "state.npz"), sensors=SENSORS, step_hours=24)
+
+    # Живой опрос: последние часы под именами локаций
+    live = range(250, 400)
+    store.append_records(_records("A", live, signal[250:] + noise[0, 250:]))
+    store.append_records(_records("B", live, signal[250:] + noise[1, 250:]))
+    engine.update()
+    assert engine.names == ["A", "B"]
+
+    # Backfill прошлого под sensor_<id>: тот же датчик, часы до обработанных
+    past = range(0, 250)
+    store.append_records(_records("sensor_11", past, signal[:250] + noise[0, :250]))
+    store.append_records(_records("sensor_21", past, signal[:250] + noise[1, :250]))
+    summary = CorrelationEngine(store, state_path=str(tmp_path / "state.npz"), sensors=SENSORS,
+                                step_hours=24).update()
+    assert summary["new_hours"] == 250
+
+    incremental = CorrelationEngine(store, state_path=str(tmp_path / "state.npz"), sensors=SENSORS, step_hours=24)
+    fresh = CorrelationEngine(store, state_path=None, sensors=SENSORS, step_hours=24)
+    fresh.update()
+    assert incremental.names == ["A", "B"]
+    assert incremental.state["pair_stats"][0, 0, 1] == 400
+    np.testing.assert_allclose(incremental.correlation(), fresh.correlation())
+    np.testing.assert_array_equal(incremental.state["window_end"], fresh.state["window_end"])
+    np.testing.assert_allclose(incremental.state["rolling"], fresh.state["rolling"])
+
+    decay = incremental.homogeneity()
+    assert decay["n_pairs"] == 1
@@ -0,0 +1,42 @@
+import json
+
+from dataset import iter_samples
+
+
+def test_sample_joins_tick_readings(tmp_path):
+    (tmp_path / "metadata").mkdir()
+    (tmp_path / "pm25" / "ticks").mkdir(parents=True)
+    with open(tmp_path / "metadata" / "cam1_20250110_100000.json", 'w', encoding='utf-8') as f:
+        json.dump({"camera_id": "cam1", "timestamp": "2025-01-10T10:00:00", "tick_id": "20250110_100000"}, f)
+    with open(tmp_path / "pm25" / "ticks" / "20250110_100000.json", 'w', encoding='utf-8') as f:
+        json.dump({"tick_id": "20250110_100000", "timestamp": "2025-01-10T10:00:00", "readings": [
+            {"source": "IQAir", "pm25": 80.0},
+            {"source": "OpenWeatherMap", "pm25": 100.0, "temperature": -5.0, "humidity": 80, "wind_speed": 1.0},
+        ]}, f)
+
+    samples = list(iter_samples(str(tmp_path)))
+    assert len(samples) == 1
+    assert samples[0]["pm25"] == 90.0
+    assert samples[0]["weather"]["temperature"] == -5.0
+    assert samples[0]["weather"]["timestamp"] == "2025-01-10T10:00:00"
+
+
+def test_all_sources_label_ignores_fusion_output(tmp_path):
+    from fusion import FusionEngine
+    from timeseries_store import TimeSeriesStore
+    from dataset import load_arrays
+
+    (tmp_path / "metadata").mkdir()
+    with open(tmp_path / "metadata" / "cam1_20250110_100000.json", 'w', encoding='utf-8') as f:
+        json.dump({"camera_id": "cam1", "timestamp": "2025-01-10T10:00:00", "pm25": 10.0,
+                   "weather": {"timestamp": "2025-01-10T10:00:00", "temperature": -5.0, "humidity": 80,
+                               "wind_speed": 1.0}}, f)
+
+    store = TimeSeriesStore(str(tmp_path / "store"))
+    for location, pm25 in (("A", 30.0), ("B", 34.0), ("C", 38.0), ("D", 80.0)):
+        store.append("openaq", location, [{"timestamp": "2025-01-10T10:20:00", "pm25": pm25}])
+
+    before = load_arrays(str(tmp_path), pm25_store=store)[1]
+    FusionEngine(store, state_path=str(tmp_path / "fusion.json")).run()
+    after = load_arrays(str(tmp_path), pm25_store=store)[1]
+    assert before[0] == after[0] == 45.5
@@ -0,0 +1,43 @@
+import json
+
+from fetch_pm25_data import PM25DataCollector
+from http_cache import CachedResponse, ResponseCache
+from rate_limiter import QuotaRateLimiter
+from timeseries_store import TimeSeriesStore
+
+
+POLLUTION = {"list": [{"dt": 1_736_481_600, "components": {"pm2_5": 80.0, "pm10": 120.0}}]}
+WEATHER = {"main": {"temp": 268.15, "humidity": 80, "pressure": 1020}, "wind": {"speed": 1.0}, "visibility": 3000}
+
+
+def _collector(tmp_path, burst):
+    limiter = QuotaRateLimiter(None, {"openweathermap": {"quota": 1000, "window": "day", "burst": burst}})
+    collector = PM25DataCollector(output_dir=str(tmp_path / "pm25"), rate_limiter=limiter,
+                                  response_cache=ResponseCache(str(tmp_path / "cache")),
+                                  timeseries_store=TimeSeriesStore(str(tmp_path / "store")))
+    sent = []
+
+    def fetch(session, source, url, params=None, timeout=10):
+        sent.append(url)
+        body = POLLUTION if url.endswith("air_pollution") else WEATHER
+        return CachedResponse(200, json.dumps(body).encode(), {}, from_cache=False)
+    collector.response_cache.fetch = fetch
+    return collector, limiter, sent
+
+
+def test_owm_pair_is_not_split_by_quota(tmp_path):
+    # Один токен: пара запросов не проходит целиком - не уходит ни один
+    collector, limiter, sent = _collector(tmp_path, burst=1)
+    assert collector.fetch_openweathermap("key") is None
+    assert sent == []
+    usage = list(limiter.usage().values())
+    assert [bucket["used"] for bucket in usage] == [0]
+    assert [bucket["denied"] for bucket in usage] == [1]
+
+
+def test_owm_pair_spends_two_tokens(tmp_path):
+    collector, limiter, sent = _collector(tmp_path, burst=2)
+    result = collector.fetch_openweathermap("key")
+    assert result["pm25"] == 80.0
+    assert len(sent) == 2
+    assert sum(bucket["used"] for bucket in limiter.usage().values()) == 2
@@ -0,0 +1,29 @@
+from fusion import FusionEngine, FUSION_SOURCE, CITY_LOCATION
+from timeseries_store import TimeSeriesStore
+
+
+T0 = 1_700_000_000 - 1_700_000_000 % 3600
+
+
+def _append(store, hours, offset=0.0):
+    for location, bias in (("A", 0.0), ("B", 5.0), ("C", -5.0)):
+        store.append("openaq", location, [{"timestamp": T0 + h * 3600, "pm25": 40.0 + bias + offset} for h in hours])
+
+
+def test_backfilled_and_late_buckets_are_fused(tmp_path):
+    store = TimeSeriesStore(str(tmp_path / "store"))
+    state_path = str(tmp_path / "state.json")
+
+    _append(store, range(100, 150))
+    assert FusionEngine(store, state_path=state_path).run()["new_buckets"] == 50
+
+    # Backfill прошлого и запоздавшее показание в уже слитый час
+    _append(store, range(0, 100))
+    store.append("openaq", "D", [{"timestamp": T0 + 120 * 3600, "pm25": 40.0}])
+    summary = FusionEngine(store, state_path=state_path).run()
+    assert summary["new_buckets"] == 100
+    assert summary["buckets"] == 101
+
+    city = store.query(FUSION_SOURCE, CITY_LOCATION)
+    assert len(city["timestamp"]) == 150
+    assert FusionEngine(store, state_path=state_path).run()["buckets"] == 0
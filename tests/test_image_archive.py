@@ -0,0 +1,18 @@
+from image_archive import ShardedArchiveReader, ShardedArchiveWriter, append_index_entries, INDEX_FILENAME
+
+
+def test_index_appends_and_torn_line(tmp_path):
+    archive = str(tmp_path)
+    with ShardedArchiveWriter(archive) as writer:
+        first = writer.append("cam", "20250110_100000", b"frame-1")
+        # Компакция из другого процесса дописывает индекс, пока шард сборщика открыт
+        append_index_entries(archive, "cam", [first])
+        writer.append("cam", "20250110_100100", b"frame-2")
+
+    # Недописанная строка (сбой посреди записи) не ломает чтение индекса
+    with open(tmp_path / "cam" / INDEX_FILENAME, 'a', encoding='utf-8') as f:
+        f.write('{"timestamp": "20250110_1002')
+
+    reader = ShardedArchiveReader(archive)
+    assert [e["timestamp"] for e in reader.list_frames("cam")] == ["20250110_100000", "20250110_100100"]
+    assert reader.get_frame("cam", "20250110_100100") == b"frame-2"
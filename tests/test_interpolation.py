@@ -0,0 +1,19 @@
+import numpy as np
+
+from interpolation import sensor_readings
+from timeseries_store import TimeSeriesStore
+
+
+def test_live_and_backfilled_series_reach_catalog_sensor(tmp_path):
+    store = TimeSeriesStore(str(tmp_path))
+    sensor = {"id": 7, "name": "Bishkek Center", "latitude": 42.87, "longitude": 74.6,
+              "sensors": [{"id": 701, "parameter": {"name": "pm25"}}]}
+    # Живой опрос OpenAQ - под именем локации, backfill - под sensor_<id датчика>
+    store.append_records([
+        {"source": "OpenAQ", "location": "Bishkek Center", "timestamp": "2025-01-10T05:00:00Z", "pm25": 30.0},
+        {"source": "OpenAQ", "location": "sensor_701", "timestamp": "2024-12-01T05:00:00Z", "pm25": 90.0},
+    ])
+
+    readings = sensor_readings(store, [sensor], np.array(["2025-01-10T05:00:00", "2024-12-01T05:00:00"],
+                                                         dtype="datetime64[s]"))
+    assert readings[:, 0].tolist() == [30.0, 90.0]
@@ -0,0 +1,17 @@
+from rate_limiter import QuotaRateLimiter
+
+
+def test_processes_share_usage(tmp_path):
+    # Два экземпляра = два процесса на одном файле состояния: расход не затирается
+    state = str(tmp_path / "api_usage.json")
+    quotas = {"openaq": {"quota": 3, "window": "hour", "burst": 10}}
+    first, second = QuotaRateLimiter(state, quotas), QuotaRateLimiter(state, quotas)
+
+    assert first.try_acquire("openaq")
+    assert second.try_acquire("openaq")
+    assert first.try_acquire("openaq")
+    assert not second.try_acquire("openaq")
+
+    usage = QuotaRateLimiter(state, quotas).usage()["openaq"]
+    assert usage["used"] == 3
+    assert usage["denied"] == 1
@@ -0,0 +1,30 @@
+import json
+
+import requests
+
+from http_cache import CachedResponse, ResponseCache
+from replay_server import ReplayServer
+
+
+class _Session:
+    """Живой API: страница = номер в results"""
+
+    def get(self, url, params=None, headers=None, timeout=None):
+        body = {"meta": {"found": 3}, "results": [{"id": int(params["page"])}]}
+        return CachedResponse(200, json.dumps(body).encode('utf-8'), {"Content-Type": "application/json"},
+                              from_cache=False)
+
+
+def test_recorded_pages_are_replayed_by_page(tmp_path):
+    cache = ResponseCache(str(tmp_path / "http"))
+    for page in (1, 2):
+        cache.fetch(_Session(), "openaq", "https://api.openaq.org/v3/locations",
+                    {"coordinates": "42.87,74.57", "limit": 1, "page": page})
+
+    with ReplayServer(cache_dir=str(tmp_path / "http")) as server:
+        pages = [
+            requests.get(f"{server.url}/v3/locations", params={"limit": 1, "page": page}, timeout=5).json()
+            for page in (1, 2, 3)
+        ]
+
+    assert [p["results"] for p in pages] == [[{"id": 1}], [{"id": 2}], []]
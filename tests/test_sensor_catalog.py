@@ -0,0 +1,21 @@
+from sensor_catalog import SensorCatalog, catalog_query
+
+
+def _location(datetime_last):
+    return {"id": 1, "name": "A", "coordinates": {"latitude": 42.87, "longitude": 74.6},
+            "sensors": [{"id": 11, "parameter": {"name": "pm25"}}], "datetimeLast": {"utc": datetime_last}}
+
+
+def test_new_reading_does_not_change_location(tmp_path):
+    catalog = SensorCatalog(str(tmp_path / "catalog.json"))
+    assert catalog.update([_location("2025-01-10T04:00:00Z")], catalog_query())["new"] == 1
+    summary = catalog.update([_location("2025-01-10T05:00:00Z")], catalog_query())
+    assert summary["unchanged"] == 1
+    assert catalog.sensors()[0]["datetime_last"] == "2025-01-10T05:00:00Z"
+
+
+def test_query_mismatch_is_stale(tmp_path):
+    catalog = SensorCatalog(str(tmp_path / "catalog.json"))
+    catalog.update([_location("2025-01-10T04:00:00Z")], catalog_query())
+    assert not catalog.is_stale(query=catalog_query())
+    assert catalog.is_stale(query=catalog_query(radius_km=5))
@@ -0,0 +1,104 @@
+import os
+from datetime import datetime, timezone
+
+import numpy as np
+import pytest
+
+from timeseries_store import TimeSeriesStore, series_id, to_epoch, to_epoch_array
+
+
+def test_naive_time_is_bishkek_local():
+    utc = int(datetime(2025, 1, 10, 4, 0, tzinfo=timezone.utc).timestamp())
+    assert to_epoch("2025-01-10T10:00:00") == utc
+    assert to_epoch(datetime(2025, 1, 10, 10, 0)) == utc
+    assert to_epoch("2025-01-10T04:00:00Z") == utc
+    assert to_epoch("2025-01-10T10:00:00+06:00") == utc
+    assert to_epoch(np.datetime64("2025-01-10T04:00:00")) == utc
+    assert to_epoch_array(["2025-01-10T10:00:00", "2025-01-10T04:00:00+00:00"]).tolist() == [utc, utc]
+
+
+def test_lookup_pairs_local_frame_with_utc_reading(tmp_path):
+    store = TimeSeriesStore(str(tmp_path))
+    # OpenAQ/IQAir: UTC; кадр collect_data: наивное местное время
+    store.append("openaq", "sensor_1", [
+        {"timestamp": "2025-01-10T04:30:00Z", "pm25": 80.0},
+        {"timestamp": "2025-01-10T10:30:00Z", "pm25": 20.0},
+    ])
+    values = store.lookup("pm25", np.array(["2025-01-10T10:15:00"]), source="openaq")
+    assert values.tolist() == [80.0]
+
+
+def test_two_writers_share_manifest(tmp_path):
+    # Два экземпляра = два процесса: каждый видит записи другого и не затирает его чанки
+    first, second = TimeSeriesStore(str(tmp_path)), TimeSeriesStore(str(tmp_path))
+    first.append("openaq", "sensor_1", [{"timestamp": 1_700_000_000, "pm25": 1.0}])
+    second.append("openaq", "sensor_1", [{"timestamp": 1_700_003_600, "pm25": 2.0}])
+    first.append("openaq", "sensor_1", [{"timestamp": 1_700_007_200, "pm25": 3.0}])
+
+    for store in (first, second, TimeSeriesStore(str(tmp_path))):
+        assert store.query("openaq", "sensor_1")["pm25"].tolist() == [1.0, 2.0, 3.0]
+        assert store.aggregate("openaq", "sensor_1")["pm25_count"].sum() == 3
+
+
+def test_chunk_cache_is_bounded(tmp_path):
+    store = TimeSeriesStore(str(tmp_path), compact_after=1000, chunk_cache_bytes=1024)
+    for i in range(50):
+        store.append("openaq", "sensor_1", [{"timestamp": 1_700_000_000 + i * 3600, "pm25": float(i)}])
+    assert len(store.query("openaq", "sensor_1")["pm25"]) == 50
+    assert store._chunk_cache_size <= 1024 or len(store._chunk_cache) == 1
+
+
+def test_crash_during_compaction_keeps_chunks(tmp_path):
+    store = TimeSeriesStore(str(tmp_path), compact_after=4)
+    for i in range(3):
+        store.append("openaq", "sensor_1", [{"timestamp": 1_700_000_000 + i * 3600, "pm25": float(i)}])
+
+    # Сбой процесса после записи слитого чанка, но до сохранения манифеста
+    def crash():
+        raise OSError("disk full")
+    store._save_manifest = crash
+    with pytest.raises(OSError):
+        store.append("openaq", "sensor_1", [{"timestamp": 1_700_010_800, "pm25": 3.0}])
+
+    reopened = TimeSeriesStore(str(tmp_path), compact_after=4)
+    assert reopened.query("openaq", "sensor_1")["pm25"].tolist() == [0.0, 1.0, 2.0]
+    # Слитый чанк, не попавший в манифест, удалён при открытии
+    assert sorted(os.listdir(tmp_path / "chunks" / series_id("openaq", "sensor_1"))) == ["000000.npz", "000001.npz", "000002.npz"]
+
+
+@pytest.mark.parametrize("crash_in", ["_write_rollup", "_save_manifest"])
+def test_rollups_match_rows_after_crash(tmp_path, crash_in):
+    store = TimeSeriesStore(str(tmp_path))
+    store.append("openaq", "sensor_1", [{"timestamp": 1_700_000_000, "pm25": 10.0}])
+
+    # Сбой процесса между записью манифеста и rollup'ов (в любом порядке)
+    def crash(*args):
+        raise OSError("disk full")
+    setattr(store, crash_in, crash)
+    with pytest.raises(OSError):
+        store.append("openaq", "sensor_1", [{"timestamp": 1_700_000_100, "pm25": 30.0}])
+
+    reopened = TimeSeriesStore(str(tmp_path))
+    rows = reopened.query("openaq", "sensor_1")["pm25"]
+    agg = reopened.aggregate("openaq", "sensor_1")
+    assert agg["pm25_count"].tolist() == [len(rows)]
+    assert agg["pm25_mean"].tolist() == [rows.mean()]
+
+    # Повтор записи после сбоя доводит ряд и агрегаты до конца
+    reopened.append("openaq", "sensor_1", [{"timestamp": 1_700_000_100, "pm25": 30.0}])
+    assert TimeSeriesStore(str(tmp_path)).aggregate("openaq", "sensor_1")["pm25_mean"].tolist() == [20.0]
+
+
+def test_day_buckets_start_at_local_midnight(tmp_path):
+    store = TimeSeriesStore(str(tmp_path))
+    # 03:00 и 20:00 по Бишкеку - одни местные сутки, хотя 03:00 ещё 9 января по UTC
+    store.append("openaq", "sensor_1", [
+        {"timestamp": "2025-01-10T03:00:00", "pm25": 10.0},
+        {"timestamp": "2025-01-10T20:00:00", "pm25": 30.0},
+    ])
+    agg = store.aggregate("openaq", "sensor_1", resolution="day")
+    assert agg["pm25_count"].tolist() == [2]
+    assert int(agg["bucket"][0].astype(np.int64)) == to_epoch("2025-01-10T00:00:00")
+
+    values = store.lookup("pm25", np.array(["2025-01-10T01:00:00", "2025-01-10T23:59:00"]), resolution="day")
+    assert values.tolist() == [20.0, 20.0]